@@ -0,0 +1,116 @@
+"""JWT authentication from signed claims, without loading the user.
+
+Tokens issued at login carry the user's ``username``, ``is_staff``,
+``is_superuser`` and, when the account is linked to a ``RawUserDim``, its
+``org_id`` and ``role``.  :class:`ClaimsJWTAuthentication` validates the
+signature and expiry, checks the in-memory revocation list and returns a
+:class:`ClaimsUser` built from those claims, so an authenticated request
+costs no auth-related query.
+
+Claims are a snapshot taken when the token was issued; they are re-read
+from the database whenever an access token is refreshed, so changes reach
+clients within one access-token lifetime.  Deactivating an account revokes
+its tokens immediately.  Code that needs more than the claims can use
+:attr:`ClaimsUser.user`, which loads the ``User`` through a short-TTL cache.
+"""
+
+import time
+from typing import Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .revocation import ISSUED_AT_CLAIM, revocations
+
+USER_CACHE_PREFIX = "accounts:user:"
+DEFAULT_USER_CACHE_TTL = 60
+
+
+def add_user_claims(token, user):
+    """Stamp ``token`` with its issue time and the claims :class:`ClaimsUser` reads."""
+
+    profile = getattr(user, "raw_profile", None)
+    token[ISSUED_AT_CLAIM] = time.time()
+    token["username"] = user.get_username()
+    token["is_staff"] = user.is_staff
+    token["is_superuser"] = user.is_superuser
+    token["org_id"] = profile.org_id if profile else None
+    token["role"] = profile.role if profile else None
+    return token
+
+
+def cached_user(user_id):
+    """The ``User`` with ``user_id``, served from the cache for a short TTL."""
+
+    key = f"{USER_CACHE_PREFIX}{user_id}"
+    user = cache.get(key)
+    if user is None:
+        user = get_user_model().objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is not None:
+            cache.set(key, user, getattr(settings, "AUTH_USER_CACHE_TTL", DEFAULT_USER_CACHE_TTL))
+    return user
+
+
+def evict_cached_user(user_id) -> None:
+    cache.delete(f"{USER_CACHE_PREFIX}{user_id}")
+
+
+class ClaimsUser(TokenUser):
+    """Request user backed by token claims, with ``org_id`` and ``role``."""
+
+    @cached_property
+    def org_id(self) -> Optional[str]:
+        return self.token.get("org_id")
+
+    @cached_property
+    def role(self) -> Optional[str]:
+        return self.token.get("role")
+
+    @cached_property
+    def user(self):
+        """The full ``User`` row, through :func:`cached_user`."""
+
+        return cached_user(self.id)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` that trusts claims and checks revocations in memory."""
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        if revocations.is_revoked(validated_token):
+            raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+        return ClaimsUser(validated_token)
+
+
+async def authenticate_header(authorization: str) -> Optional[ClaimsUser]:
+    """The user of an ``Authorization: Bearer`` header, for async code.
+
+    Like :class:`ClaimsJWTAuthentication` but usable outside DRF and on the
+    event loop: the revocation list is reloaded on a worker thread when it
+    is due, so a valid token costs no query and no thread hop.  Returns
+    ``None`` for a missing, invalid, expired or revoked token.
+    """
+
+    authentication = ClaimsJWTAuthentication()
+    try:
+        raw_token = authentication.get_raw_token(authorization.encode("latin-1"))
+        if raw_token is None:
+            return None
+        token = authentication.get_validated_token(raw_token)
+    except AuthenticationFailed:
+        return None
+    if revocations.reload_due:
+        await sync_to_async(revocations.refresh, thread_sensitive=False)()
+    if api_settings.USER_ID_CLAIM not in token or revocations.is_revoked(token, reload=False):
+        return None
+    return ClaimsUser(token)
@@ -0,0 +1,17 @@
+from django.db import models
+
+
+class TokenRevocation(models.Model):
+    """A revoked token, or every token of a user issued up to ``revoked_at``.
+
+    Rows with an empty ``jti`` revoke all of the user's tokens; rows with a
+    ``jti`` revoke that token alone.  ``expires_at`` is when the revoked
+    tokens would have expired anyway, after which the row can be pruned.
+    ``user_id`` is the token's user id claim rather than a foreign key, so
+    revocations outlive deleted accounts.
+    """
+
+    user_id = models.CharField(max_length=255, db_index=True)
+    jti = models.CharField(max_length=255, blank=True, db_index=True)
+    revoked_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
@@ -0,0 +1,149 @@
+"""Token revocation without a query per request.
+
+Revocations are stored as ``TokenRevocation`` rows.  Each process keeps an
+in-memory snapshot of the live ones -- per-user cutoffs and revoked token
+ids -- and reloads it from the database at most once per
+``TOKEN_REVOCATION_CHECK_INTERVAL`` seconds, so checking a token costs no
+query in the common case.  A revocation takes effect at once in the process
+that recorded it and within one interval everywhere else.
+
+A user cutoff has to separate tokens issued before it from those issued
+right after -- a login just after a password change must work.  ``iat``
+only has whole seconds, so tokens also carry ``issued_at``, the issue time
+to the microsecond, and a token is revoked when it was issued strictly
+before the cutoff.  Tokens without the claim fall back to ``iat`` and are
+revoked up to the end of the cutoff's second.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Optional, Set
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import TokenRevocation
+
+DEFAULT_CHECK_INTERVAL = 5.0
+ISSUED_AT_CLAIM = "issued_at"
+
+
+def _longest_token_lifetime():
+    return max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+
+
+class RevocationList:
+    """Periodically reloaded snapshot of live token revocations."""
+
+    def __init__(self, check_interval: Optional[float] = None) -> None:
+        self._check_interval = check_interval
+        self._lock = threading.Lock()
+        self._cutoffs: Dict[str, float] = {}
+        self._jtis: Set[str] = set()
+        self._loaded_at: Optional[float] = None
+        self.loads = 0
+
+    @property
+    def check_interval(self) -> float:
+        if self._check_interval is not None:
+            return self._check_interval
+        return getattr(settings, "TOKEN_REVOCATION_CHECK_INTERVAL", DEFAULT_CHECK_INTERVAL)
+
+    def clear(self) -> None:
+        """Force a reload on the next check."""
+
+        with self._lock:
+            self._loaded_at = None
+
+    def _load(self) -> None:
+        cutoffs: Dict[str, float] = {}
+        jtis: Set[str] = set()
+        rows = TokenRevocation.objects.filter(expires_at__gt=timezone.now()).values_list(
+            "user_id", "jti", "revoked_at"
+        )
+        for user_id, jti, revoked_at in rows:
+            if jti:
+                jtis.add(jti)
+            else:
+                cutoffs[user_id] = max(cutoffs.get(user_id, 0.0), revoked_at.timestamp())
+        self._cutoffs, self._jtis = cutoffs, jtis
+        self._loaded_at = time.monotonic()
+        self.loads += 1
+
+    @property
+    def reload_due(self) -> bool:
+        """True if the next check reloads the snapshot from the database."""
+
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at >= self.check_interval
+
+    def refresh(self) -> None:
+        """Reload the snapshot if it is older than the check interval."""
+
+        with self._lock:
+            if self.reload_due:
+                self._load()
+
+    def is_revoked(self, token, reload: bool = True) -> bool:
+        """True if ``token`` was revoked by id or issued before a user cutoff.
+
+        With ``reload=False`` the current snapshot is used as is, so async
+        callers can reload it off the event loop first (:meth:`refresh`).
+        """
+
+        if reload:
+            self.refresh()
+        if token.get(api_settings.JTI_CLAIM) in self._jtis:
+            return True
+        cutoff = self._cutoffs.get(str(token.get(api_settings.USER_ID_CLAIM)))
+        if cutoff is None:
+            return False
+        issued_at = token.get(ISSUED_AT_CLAIM)
+        if issued_at is None:
+            return token.get("iat", 0) <= cutoff
+        return issued_at < cutoff
+
+    def _record(self, user_id: str, jti: str, revoked_at: datetime) -> None:
+        with self._lock:
+            if jti:
+                self._jtis.add(jti)
+            else:
+                self._cutoffs[user_id] = max(self._cutoffs.get(user_id, 0.0), revoked_at.timestamp())
+
+
+revocations = RevocationList()
+
+
+def revoke_user_tokens(user_id) -> TokenRevocation:
+    """Revoke every token issued to ``user_id`` so far."""
+
+    now = timezone.now()
+    row = TokenRevocation.objects.create(
+        user_id=str(user_id), jti="", revoked_at=now, expires_at=now + _longest_token_lifetime()
+    )
+    revocations._record(row.user_id, "", now)
+    return row
+
+
+def revoke_token(token) -> TokenRevocation:
+    """Revoke a single validated token by its ``jti``."""
+
+    now = timezone.now()
+    expires_at = datetime.fromtimestamp(token["exp"], tz=dt_timezone.utc)
+    row = TokenRevocation.objects.create(
+        user_id=str(token[api_settings.USER_ID_CLAIM]),
+        jti=token[api_settings.JTI_CLAIM],
+        revoked_at=now,
+        expires_at=expires_at,
+    )
+    revocations._record(row.user_id, row.jti, now)
+    return row
+
+
+def prune_revocations() -> int:
+    """Delete revocations whose tokens have expired anyway."""
+
+    deleted, _ = TokenRevocation.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
@@ -1,6 +1,13 @@
+from django.contrib.auth import get_user_model
 from django.contrib.auth.models import User
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import add_user_claims
+from .revocation import revocations, revoke_token
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -18,4 +25,38 @@ class RegisterSerializer(serializers.ModelSerializer):
 
 
 class LoginSerializer(TokenObtainPairSerializer):
-    pass
+    @classmethod
+    def get_token(cls, user):
+        return add_user_claims(super().get_token(user), user)
+
+
+class ClaimsRefreshSerializer(TokenRefreshSerializer):
+    """Refresh that re-reads the user's claims from the database.
+
+    Access tokens therefore trail a change to the user by at most their
+    lifetime.  Revoked refresh tokens are rejected.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if revocations.is_revoked(refresh):
+            raise AuthenticationFailed(_('Token has been revoked'), 'token_revoked')
+        user = (
+            get_user_model()
+            .objects.select_related('raw_profile')
+            .filter(**{api_settings.USER_ID_FIELD: refresh[api_settings.USER_ID_CLAIM]})
+            .first()
+        )
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        add_user_claims(refresh, user)
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                revoke_token(self.token_class(attrs['refresh']))
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.contrib.auth.hashers import is_password_usable
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .authentication import evict_cached_user
+from .revocation import revoke_user_tokens
+
+REVOKING_FIELDS = {"is_active", "password"}
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def detect_credential_change(sender, instance, update_fields=None, raw=False, **kwargs):
+    # Deactivation and password changes invalidate every issued token.
+    instance._revoke_tokens = False
+    if raw or instance._state.adding or (update_fields is not None and not REVOKING_FIELDS & set(update_fields)):
+        return
+    previous = sender.objects.filter(pk=instance.pk).values("is_active", "password").first()
+    if previous is not None:
+        instance._revoke_tokens = (previous["is_active"] and not instance.is_active) or (
+            previous["password"] != instance.password and _credentials_changed(instance)
+        )
+
+
+def _credentials_changed(instance):
+    # ``set_password`` keeps the raw value in ``_password`` until the save;
+    # the hash upgrade ``check_password`` does on login clears it again, as
+    # the same password rehashed is no change.  A hash swapped for an
+    # unusable one (``set_unusable_password``) disables the password.
+    return getattr(instance, "_password", None) is not None or not is_password_usable(instance.password)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def refresh_user_tokens(sender, instance, **kwargs):
+    evict_cached_user(instance.pk)
+    if getattr(instance, "_revoke_tokens", False):
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    evict_cached_user(instance.pk)
+    revoke_user_tokens(instance.pk)
@@ -1,7 +1,23 @@
+from datetime import timedelta
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User
+from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from raw_data.models import RawUserDim
+
+from .models import TokenRevocation
+from .revocation import revocations
+
+
+class WeakerPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    algorithm = 'pbkdf2_weaker'
+    iterations = 1000
+
 
 class AuthenticationTests(APITestCase):
     def test_registration_login_and_protected_access(self):
@@ -20,3 +36,83 @@ class AuthenticationTests(APITestCase):
         resp = self.client.get(protected_url, HTTP_AUTHORIZATION=f'Bearer {access_token}')
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
         self.assertEqual(resp.data['detail'], 'success')
+
+
+class ClaimsAuthenticationTests(APITestCase):
+    def setUp(self):
+        revocations.clear()
+        self.user = User.objects.create_user(username='buyer', password='secret123')
+        RawUserDim.objects.create(org_id='org-7', role='buyer', settings_json={}, account=self.user)
+
+    def login(self):
+        resp = self.client.post(reverse('login'), {'username': 'buyer', 'password': 'secret123'}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return resp.data['access'], resp.data['refresh']
+
+    def get_protected(self, access):
+        return self.client.get(reverse('protected'), HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_claims_authenticate_without_queries(self):
+        access, _ = self.login()
+        self.get_protected(access)  # loads the revocation list
+        with self.assertNumQueries(0):
+            resp = self.get_protected(access)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        user = resp.wsgi_request.user
+        self.assertEqual((user.username, user.org_id, user.role), ('buyer', 'org-7', 'buyer'))
+        self.assertEqual(user.user, self.user)
+
+    def test_refresh_reads_current_claims(self):
+        _, refresh = self.login()
+        RawUserDim.objects.filter(account=self.user).update(role='auditor')
+        resp = self.client.post(reverse('token_refresh'), {'refresh': refresh}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        user = self.get_protected(resp.data['access']).wsgi_request.user
+        self.assertEqual(user.role, 'auditor')
+
+    def test_logout_revokes_tokens(self):
+        access, refresh = self.login()
+        resp = self.client.post(
+            reverse('logout'), {'refresh': refresh}, format='json', HTTP_AUTHORIZATION=f'Bearer {access}'
+        )
+        self.assertEqual(resp.status_code, status.HTTP_205_RESET_CONTENT)
+        self.assertEqual(self.get_protected(access).status_code, status.HTTP_401_UNAUTHORIZED)
+        resp = self.client.post(reverse('token_refresh'), {'refresh': refresh}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivation_revokes_every_token(self):
+        access, _ = self.login()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_protected(access).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_revokes_only_earlier_tokens(self):
+        access, _ = self.login()
+        self.user.set_password('secret456')
+        self.user.save()
+        self.assertEqual(self.get_protected(access).status_code, status.HTTP_401_UNAUTHORIZED)
+        # A login in the same second as the change is not caught by the cutoff.
+        resp = self.client.post(reverse('login'), {'username': 'buyer', 'password': 'secret456'}, format='json')
+        self.assertEqual(self.get_protected(resp.data['access']).status_code, status.HTTP_200_OK)
+
+    @override_settings(PASSWORD_HASHERS=['accounts.tests.WeakerPBKDF2PasswordHasher'])
+    def test_hash_upgrade_on_login_keeps_tokens(self):
+        self.user.set_password('secret123')
+        self.user.save()
+        access, _ = self.login()
+        upgraded = ['django.contrib.auth.hashers.PBKDF2PasswordHasher', 'accounts.tests.WeakerPBKDF2PasswordHasher']
+        with override_settings(PASSWORD_HASHERS=upgraded):
+            self.login()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(self.get_protected(access).status_code, status.HTTP_200_OK)
+
+    def test_revocations_from_other_processes_are_picked_up_on_reload(self):
+        access, _ = self.login()
+        self.assertEqual(self.get_protected(access).status_code, status.HTTP_200_OK)
+        TokenRevocation.objects.create(
+            user_id=str(self.user.pk), jti='', revoked_at=timezone.now(),
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        revocations.clear()
+        self.assertEqual(self.get_protected(access).status_code, status.HTTP_401_UNAUTHORIZED)
@@ -1,18 +1,23 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenRefreshView, TokenObtainPairView
 
-from .serializers import LoginSerializer
-from .views import RegisterView, ProtectedView
+from .serializers import ClaimsRefreshSerializer, LoginSerializer
+from .views import LogoutView, RegisterView, ProtectedView
 
 
 class LoginView(TokenObtainPairView):
     serializer_class = LoginSerializer
 
 
+class RefreshView(TokenRefreshView):
+    serializer_class = ClaimsRefreshSerializer
+
+
 urlpatterns = [
     path('register', RegisterView.as_view(), name='register'),
     path('login', LoginView.as_view(), name='login'),
-    path('refresh', TokenRefreshView.as_view(), name='token_refresh'),
+    path('refresh', RefreshView.as_view(), name='token_refresh'),
+    path('logout', LogoutView.as_view(), name='logout'),
     path('protected', ProtectedView.as_view(), name='protected'),
 ]
 
@@ -1,9 +1,13 @@
 from django.contrib.auth.models import User
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 
+from .revocation import revoke_token
 from .serializers import RegisterSerializer
 
 
@@ -18,3 +22,21 @@ class ProtectedView(APIView):
 
     def get(self, request):
         return Response({'detail': 'success'})
+
+
+class LogoutView(APIView):
+    """Revoke the calling access token and, if posted, its refresh token."""
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if request.data.get('refresh'):
+            try:
+                refresh = RefreshToken(request.data['refresh'])
+            except TokenError as exc:
+                return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+            if str(refresh[api_settings.USER_ID_CLAIM]) != str(request.user.id):
+                return Response({'detail': 'Refresh token belongs to another user.'}, status=status.HTTP_400_BAD_REQUEST)
+            revoke_token(refresh)
+        revoke_token(request.auth)
+        return Response(status=status.HTTP_205_RESET_CONTENT)
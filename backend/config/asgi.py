@@ -2,4 +2,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from raw_data.asgi import IngestRouter  # noqa: E402  (needs the app registry)
+
+application = IngestRouter(django_application)
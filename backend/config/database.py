@@ -0,0 +1,100 @@
+"""Environment-driven ``DATABASES`` configuration.
+
+Variables (all optional; the defaults give the local ``db.sqlite3``):
+
+``DB_ENGINE``
+    ``sqlite`` (default), ``postgres`` or a full backend path.
+``DB_NAME``, ``DB_USER``, ``DB_PASSWORD``, ``DB_HOST``, ``DB_PORT``
+    Connection parameters of the primary.  For SQLite ``DB_NAME`` is the
+    file path.
+``DB_CONN_MAX_AGE``
+    Seconds a connection is kept open between requests (default 60; ``0``
+    closes it after every request).
+``DB_POOL_MAX_SIZE``
+    PostgreSQL only: size of the psycopg connection pool.  Pooled
+    connections replace persistent ones, so ``CONN_MAX_AGE`` is forced to 0.
+``DB_REPLICAS``
+    Comma-separated replicas, configured as aliases ``replica_1``,
+    ``replica_2``...  Each entry is a SQLite file path or a PostgreSQL
+    ``host[:port]``; the other parameters are shared with the primary.
+``DB_SQLITE_TIMEOUT``
+    Seconds a SQLite connection waits on a locked database (default 20).
+
+SQLite databases run in WAL mode so readers and the single writer do not
+block each other.  Write transactions on the primary start ``IMMEDIATE``:
+taking the write lock up front makes a concurrent writer wait for the busy
+timeout instead of failing with "database is locked" when a deferred
+transaction tries to upgrade its lock.
+"""
+
+import os
+from typing import Any, Dict, List, Mapping, Optional
+
+ENGINES = {
+    "sqlite": "django.db.backends.sqlite3",
+    "postgres": "django.db.backends.postgresql",
+}
+REPLICA_PREFIX = "replica_"
+DEFAULT_CONN_MAX_AGE = 60
+DEFAULT_SQLITE_TIMEOUT = 20
+SQLITE_INIT_COMMAND = "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL"
+
+
+def _engine(env: Mapping[str, str]) -> str:
+    engine = env.get("DB_ENGINE", "sqlite")
+    return ENGINES.get(engine, engine)
+
+
+def _is_sqlite(engine: str) -> bool:
+    return engine.endswith("sqlite3")
+
+
+def database_settings(base_dir, env: Optional[Mapping[str, str]] = None) -> Dict[str, Dict[str, Any]]:
+    """Build ``DATABASES`` from ``env`` (``os.environ`` by default)."""
+
+    env = os.environ if env is None else env
+    engine = _engine(env)
+    primary: Dict[str, Any] = {
+        "ENGINE": engine,
+        "NAME": env.get("DB_NAME") or (base_dir / "db.sqlite3" if _is_sqlite(engine) else ""),
+        "CONN_MAX_AGE": int(env.get("DB_CONN_MAX_AGE", DEFAULT_CONN_MAX_AGE)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
+    }
+    if _is_sqlite(engine):
+        primary["OPTIONS"] = {
+            "timeout": float(env.get("DB_SQLITE_TIMEOUT", DEFAULT_SQLITE_TIMEOUT)),
+            "init_command": SQLITE_INIT_COMMAND,
+            "transaction_mode": "IMMEDIATE",
+        }
+    else:
+        primary.update(
+            USER=env.get("DB_USER", ""),
+            PASSWORD=env.get("DB_PASSWORD", ""),
+            HOST=env.get("DB_HOST", ""),
+            PORT=env.get("DB_PORT", ""),
+        )
+        pool_size = env.get("DB_POOL_MAX_SIZE")
+        if pool_size:
+            primary["OPTIONS"]["pool"] = {"min_size": 1, "max_size": int(pool_size)}
+            primary["CONN_MAX_AGE"] = 0
+
+    databases = {"default": primary}
+    replicas = [entry.strip() for entry in env.get("DB_REPLICAS", "").split(",") if entry.strip()]
+    for number, entry in enumerate(replicas, start=1):
+        replica = {**primary, "OPTIONS": dict(primary["OPTIONS"])}
+        if _is_sqlite(engine):
+            replica["NAME"] = entry
+            # Replicas only serve reads; deferred transactions never lock.
+            replica["OPTIONS"].pop("transaction_mode")
+        else:
+            host, _, port = entry.partition(":")
+            replica.update(HOST=host, PORT=port or primary["PORT"])
+        # Tests read replica aliases from the primary's test database.
+        replica["TEST"] = {"MIRROR": "default"}
+        databases[f"{REPLICA_PREFIX}{number}"] = replica
+    return databases
+
+
+def replica_aliases(databases: Mapping[str, Any]) -> List[str]:
+    return [alias for alias in databases if alias.startswith(REPLICA_PREFIX)]
@@ -0,0 +1,39 @@
+"""Database routers."""
+
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class ReplicaRouter:
+    """Send reads of read-mostly apps to replicas; everything else to the primary.
+
+    Reads of ``REPLICA_READ_APPS`` models go to a random alias from
+    ``DATABASE_REPLICAS``.  They stay on the primary while a transaction is
+    open there, so code that reads and then writes inside ``atomic()`` never
+    sees replication lag.  All writes, and every query of other apps
+    (``raw_data`` ingestion included), use the primary.
+    """
+
+    def _replicas(self):
+        return getattr(settings, "DATABASE_REPLICAS", [])
+
+    def db_for_read(self, model, **hints):
+        replicas = self._replicas()
+        if not replicas or model._meta.app_label not in getattr(settings, "REPLICA_READ_APPS", ()):
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's data, so objects loaded from any of
+        # them may be related.
+        pool = {DEFAULT_DB_ALIAS, *self._replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
@@ -1,5 +1,8 @@
+import os
 from pathlib import Path
 
+from .database import database_settings, replica_aliases
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'replace-me'
@@ -21,7 +24,6 @@ INSTALLED_APPS = [
     'raw_data',
     'process_data',
     'output_data',
-    'rest_framework',
     'accounts',
 ]
 
@@ -55,12 +57,33 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
-DATABASES = {
+# See config/database.py for the DB_* environment variables.
+DATABASES = database_settings(BASE_DIR)
+DATABASE_REPLICAS = replica_aliases(DATABASES)
+DATABASE_ROUTERS = ['config.db_routers.ReplicaRouter']
+# Apps whose read-only queries may be served by DATABASE_REPLICAS.
+REPLICA_READ_APPS = ('output_data', 'marketplace')
+
+# The query cache (main/caching.py) needs no external service: a directory
+# shared by every worker process of this checkout.  Keys are scoped to the
+# default database, so a test run never reads or bumps the entries of the
+# database it runs next to.  Tag invalidations must reach all workers, so a
+# per-process LocMemCache is only correct with a single process; hosts
+# behind one load balancer need a cache they all share.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'query': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('QUERY_CACHE_DIR') or str(BASE_DIR / 'query-cache'),
+        'TIMEOUT': 300,
+        'KEY_FUNCTION': 'main.caching.database_key',
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('QUERY_CACHE_MAX_ENTRIES', 5000))},
+    },
 }
+# Apps whose model saves and deletes invalidate query cache entries.
+CACHE_INVALIDATION_APPS = ('raw_data', 'process_data', 'output_data', 'marketplace')
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -87,6 +110,43 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.ClaimsJWTAuthentication',
     )
 }
+
+# Request users come from token claims (accounts/authentication.py); these
+# bound how stale the claims, cached users and revocation lists may get.
+AUTH_USER_CACHE_TTL = 60
+TOKEN_REVOCATION_CHECK_INTERVAL = 5
+
+# Micro-batching of scans posted to api/raw/ingest/* (raw_data/microbatch.py).
+INGEST_BATCHING = {
+    'MAX_BATCH': 1000,
+    'MAX_DELAY_MS': 50,
+    'MAX_QUEUE': 50000,
+    'ENQUEUE_TIMEOUT': 1.0,
+    'WRITE_RETRIES': 3,
+}
+# Shared secrets scanners without a user account send as X-Ingest-Token,
+# comma-separated; a JWT is accepted as well.
+INGEST_TOKENS = [token for token in os.environ.get('INGEST_TOKENS', '').split(',') if token]
+
+# Months of scans kept in the hot RFID/NIR tables; older months are moved to
+# monthly partition tables by `manage.py partition_scans` (raw_data/partitions.py).
+SCAN_HOT_MONTHS = 1
+
+# Raw facts older than this many days are moved to compressed columnar files
+# under RAW_ARCHIVE_DIR by `manage.py archive_raw_facts` (raw_data/archive.py).
+RAW_ARCHIVE_DIR = os.environ.get('RAW_ARCHIVE_DIR', str(BASE_DIR / 'archive'))
+RAW_ARCHIVE_AFTER_DAYS = 365
+
+# Threads running ETL partitions (`manage.py run_etl`, main/etl.py).
+ETL_WORKERS = 4
+
+# Change log of fact table writes, appended by triggers (main/changelog.py).
+CHANGELOG_APPS = ('raw_data', 'process_data', 'output_data')
+CHANGELOG_EXCLUDE = ()
+CHANGELOG_BATCH_SIZE = 10000
+# Seconds before a missing offset is taken as rolled back and skipped.
+CHANGELOG_GAP_TIMEOUT = 60
+CHANGELOG_RETENTION_HOURS = 24 * 7
@@ -5,5 +5,10 @@ from main import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.index, name='index'),
+    path('api/cache/stats', views.CacheStatsView.as_view(), name='cache-stats'),
+    path('api/changes', views.ChangeFeedView.as_view(), name='change-feed'),
     path('api/auth/', include('accounts.urls')),
+    path('api/marketplace/', include('marketplace.urls')),
+    path('api/', include('output_data.urls')),
+    path('api/raw/', include('raw_data.urls')),
 ]
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from .changelog import install_triggers_after_migrate
+        from .signals import connect_invalidation
+
+        connect_invalidation()
+        post_migrate.connect(install_triggers_after_migrate, sender=self, dispatch_uid="changelog_triggers")
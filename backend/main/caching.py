@@ -0,0 +1,309 @@
+"""Read-through cache for query results and API responses.
+
+Entries live in the ``query`` cache alias, a file-based cache in
+``QUERY_CACHE_DIR`` shared by every process of the checkout (no external
+service needed), with keys scoped to the default database by
+:func:`database_key`.  Invalidation only reaches processes that share the
+alias: a per-process backend such as ``LocMemCache`` is correct with one
+process only.  Each entry is keyed by a namespace, a digest of its
+parameters and the current versions of the *tags* it depends on.  A tag is
+a model label (``"raw_data.RawFacilityDim"``) or a model label plus a
+primary key (``"output_data.OutBatchSummaryFact:b1"``).
+
+``post_save``/``post_delete`` of any model in ``CACHE_INVALIDATION_APPS``
+bumps the version of the model's tag and of its instance tag (see
+``main.signals``), so every entry built from the old state stops matching
+and later reads recompute it.  Nothing is deleted eagerly; orphaned entries
+age out through the backend's timeout and culling.  Writes that bypass
+signals (``bulk_create``, ``QuerySet.update``) call
+:func:`mark_models_stale` or :func:`invalidate_on_commit` themselves.
+
+A tag version is a fresh clock-based value on every bump rather than a
+counter: a version lost to culling never comes back as an old number and
+revives a stale entry, and two concurrent bumps never collapse into one the
+way a get-and-set ``incr`` (``FileBasedCache``'s) would.
+
+:meth:`QueryCache.stats` reports this process's hits, misses, hit ratio and
+evictions -- misses on keys the process stored itself and that the backend
+dropped before they were invalidated.
+"""
+
+import functools
+import hashlib
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Union
+
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Model, QuerySet
+from rest_framework.response import Response
+
+QUERY_CACHE_ALIAS = "query"
+DEFAULT_TIMEOUT = 300
+TRACKED_KEYS = 10000
+MISSING = object()
+
+Dependency = Union[str, type]
+
+
+def model_tag(model: Union[type, Model]) -> str:
+    return model._meta.label
+
+
+def instance_tag(instance: Model) -> str:
+    return f"{model_tag(instance)}:{instance.pk}"
+
+
+def _tag(dependency: Dependency, params: Dict[str, Any]) -> str:
+    if isinstance(dependency, str):
+        # Tags may name parameters, e.g. "output_data.OutBatchSummaryFact:{batch_id}".
+        return dependency.format(**params)
+    return model_tag(dependency)
+
+
+def _digest(params: Any) -> str:
+    payload = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    sets: int = 0
+    invalidations: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {**asdict(self), "hit_ratio": round(self.hit_ratio, 4)}
+
+
+@functools.lru_cache(maxsize=8)
+def _database_scope(name: str) -> str:
+    return hashlib.blake2b(name.encode(), digest_size=8).hexdigest()
+
+
+def database_key(key: str, key_prefix: str, version: int) -> str:
+    """``KEY_FUNCTION`` of the query cache: Django's default key, scoped to
+    the database the default connection points at (a test database included).
+    """
+    scope = _database_scope(str(connections[DEFAULT_DB_ALIAS].settings_dict["NAME"]))
+    return f"{key_prefix}:{version}:{scope}:{key}"
+
+
+def _new_version() -> int:
+    # Clock-ordered, with random low bits so concurrent bumps always differ.
+    return (time.time_ns() << 16) | secrets.randbits(16)
+
+
+class QueryCache:
+    """Tag-versioned read-through cache over one Django cache alias."""
+
+    def __init__(self, alias: str = QUERY_CACHE_ALIAS, default_timeout: int = DEFAULT_TIMEOUT) -> None:
+        self.alias = alias
+        self.default_timeout = default_timeout
+        self._lock = threading.Lock()
+        self._stats = CacheStats()
+        # Keys this process stored recently, to tell evictions from cold misses.
+        self._stored: "OrderedDict[str, None]" = OrderedDict()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _version_key(tag: str) -> str:
+        return f"tag:{tag}"
+
+    def tag_versions(self, tags: Sequence[str]) -> List[int]:
+        keys = [self._version_key(tag) for tag in tags]
+        found = self.backend.get_many(keys)
+        missing = {key: _new_version() for key in keys if key not in found}
+        if missing:
+            self.backend.set_many(missing, timeout=None)
+            found.update(missing)
+        return [found[key] for key in keys]
+
+    def invalidate(self, *tags: str) -> None:
+        """Bump ``tags`` so every entry depending on them is recomputed."""
+
+        if tags:
+            self.backend.set_many({self._version_key(tag): _new_version() for tag in tags}, timeout=None)
+        with self._lock:
+            self._stats.invalidations += len(tags)
+
+    def invalidate_models(self, *models: type) -> None:
+        self.invalidate(*(model_tag(model) for model in models))
+
+    def make_key(self, namespace: str, params: Any, tags: Sequence[str] = ()) -> str:
+        versions = self.tag_versions(tags) if tags else []
+        return f"q:{namespace}:{_digest(params)}:{_digest(versions)}"
+
+    def get(self, key: str) -> Any:
+        """Cached value for ``key``, or :data:`MISSING`."""
+
+        value = self.backend.get(key, MISSING)
+        with self._lock:
+            if value is MISSING:
+                self._stats.misses += 1
+                if key in self._stored:
+                    # Stored by us and never invalidated: the backend dropped it.
+                    self._stats.evictions += 1
+                    del self._stored[key]
+            else:
+                self._stats.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> None:
+        self.backend.set(key, value, timeout=self.default_timeout if timeout is None else timeout)
+        with self._lock:
+            self._stats.sets += 1
+            self._stored[key] = None
+            self._stored.move_to_end(key)
+            if len(self._stored) > TRACKED_KEYS:
+                self._stored.popitem(last=False)
+
+    def get_or_compute(
+        self,
+        namespace: str,
+        params: Any,
+        compute: Callable[[], Any],
+        tags: Sequence[str] = (),
+        timeout: Optional[int] = None,
+    ) -> Any:
+        """Return the cached value for ``params`` or compute and store it.
+
+        Querysets returned by ``compute`` are evaluated into lists first.
+        """
+
+        key = self.make_key(namespace, params, tags)
+        value = self.get(key)
+        if value is MISSING:
+            value = compute()
+            if isinstance(value, QuerySet):
+                value = list(value)
+            self.set(key, value, timeout)
+        return value
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(**asdict(self._stats))
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = CacheStats()
+            self._stored.clear()
+
+
+query_cache = QueryCache()
+
+
+def cached_query(
+    namespace: str,
+    depends_on: Iterable[Dependency],
+    timeout: Optional[int] = None,
+):
+    """Cache a function's result under a key derived from its arguments.
+
+    Arguments must be JSON-serializable (or stringify meaningfully); string
+    tags in ``depends_on`` may reference keyword arguments by name.
+    """
+
+    dependencies = list(depends_on)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tags = [_tag(dependency, kwargs) for dependency in dependencies]
+            return query_cache.get_or_compute(
+                namespace, [args, kwargs], lambda: func(*args, **kwargs), tags, timeout
+            )
+
+        return wrapper
+
+    return decorator
+
+
+def cache_response(
+    namespace: str,
+    depends_on: Iterable[Dependency],
+    timeout: Optional[int] = None,
+):
+    """Cache successful responses of a DRF view method.
+
+    The key covers the request path, its query parameters and the URL
+    keyword arguments, which string tags may reference.  Responses must not
+    depend on the requesting user.
+    """
+
+    dependencies = list(depends_on)
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            params = {
+                "path": request.path,
+                "query": sorted(request.query_params.lists()),
+                "kwargs": kwargs,
+            }
+            tags = [_tag(dependency, kwargs) for dependency in dependencies]
+            key = query_cache.make_key(namespace, params, tags)
+            data = query_cache.get(key)
+            if data is not MISSING:
+                return Response(data)
+            response = method(view, request, *args, **kwargs)
+            # Only successful responses are cached; errors are recomputed.
+            if response.status_code == 200:
+                query_cache.set(key, response.data, timeout)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+_pending = threading.local()
+
+
+def _flush_pending() -> None:
+    tags = getattr(_pending, "tags", None)
+    if not tags:
+        return
+    _pending.tags = set()
+    query_cache.invalidate(*sorted(tags))
+
+
+def invalidate_on_commit(*tags: str) -> None:
+    """Invalidate ``tags`` now and again once the current transaction commits.
+
+    The immediate bump keeps the writing transaction from reading stale
+    entries; the one after commit discards entries that processes sharing
+    the cache built from the pre-commit state in the meantime.  Tags marked within one
+    transaction are bumped together by the first callback to run.
+    """
+
+    query_cache.invalidate(*tags)
+    if not hasattr(_pending, "tags"):
+        _pending.tags = set()
+    _pending.tags.update(tags)
+    transaction.on_commit(_flush_pending)
+
+
+def mark_stale(instance: Model) -> None:
+    invalidate_on_commit(model_tag(instance), instance_tag(instance))
+
+
+def mark_models_stale(*models: type) -> None:
+    """Invalidate whole models after writes that bypass model signals."""
+
+    invalidate_on_commit(*(model_tag(model) for model in models))
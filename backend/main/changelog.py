@@ -0,0 +1,281 @@
+"""Append-only change log of the raw, process and output fact tables.
+
+Every insert, update and delete of a model in ``CHANGELOG_APPS`` appends a
+``ChangeLogEntry`` -- table, primary key and operation -- from a database
+trigger, so the entry commits or rolls back with the change itself and no
+write path can skip it: ``bulk_create`` upserts, ``QuerySet.update``,
+``QuerySet.delete`` and raw SQL are all captured, unlike with model
+signals.  Triggers are (re)installed after every ``migrate`` by the
+``post_migrate`` receiver in ``main.apps``; models added later are picked
+up by the next migration run.
+
+Consumers -- the frontend cache, anchoring, reports -- read the log from a
+stored offset in large batches (:class:`ChangeConsumer`) instead of polling
+each table, and fetch the rows themselves only for the keys that changed.
+Rows moved out of the scan tables by ``raw_data.partitions`` or archived by
+``raw_data.archive`` show up as deletes: they left the table the consumer
+reads.
+
+Offsets only ever grow, but on PostgreSQL they are handed out by a sequence
+before commit, so a reader can see offset 12 while 11 is still in flight
+(or was rolled back and never appears).  :func:`read_changes` therefore
+stops at the first missing offset and only reads past it once the entry
+after it is older than ``CHANGELOG_GAP_TIMEOUT`` seconds.  SQLite has a
+single writer and an ``AUTOINCREMENT`` key, so its offsets have no gaps.
+"""
+
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, List, NamedTuple, Optional, Union
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import ChangeLogEntry, JobWatermark
+from .watermarks import get_watermark, set_watermark
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_GAP_TIMEOUT = 60
+DEFAULT_RETENTION_HOURS = 24 * 7
+WATERMARK_PREFIX = "changelog."
+TRIGGER_PREFIX = "changelog_"
+
+PG_FUNCTION = """
+CREATE OR REPLACE FUNCTION changelog_capture() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO {log} ("table", "row_pk", "op", "created_at")
+    VALUES (TG_TABLE_NAME, coalesce(to_jsonb(NEW), to_jsonb(OLD)) ->> TG_ARGV[0],
+            left(TG_OP, 1), clock_timestamp());
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+class Change(NamedTuple):
+    offset: int
+    table: str
+    row_pk: str
+    op: str
+    created_at: datetime
+
+
+class ChangeBatch(NamedTuple):
+    """Changes read from the log and the offset to resume after.
+
+    ``next_offset`` also moves past entries of tables that were filtered
+    out, so a consumer of a quiet table does not re-read busy ones.
+    """
+
+    changes: List[Change]
+    next_offset: int
+
+
+TableRef = Union[str, type]
+
+
+def _table(ref: TableRef) -> str:
+    return ref if isinstance(ref, str) else ref._meta.db_table
+
+
+def tracked_models() -> List[type]:
+    """Models whose tables carry change log triggers."""
+
+    excluded = set(getattr(settings, "CHANGELOG_EXCLUDE", ()))
+    return [
+        model
+        for label in settings.CHANGELOG_APPS
+        for model in apps.get_app_config(label).get_models()
+        if model._meta.managed and not model._meta.proxy and model._meta.label not in excluded
+    ]
+
+
+# -- triggers ----------------------------------------------------------------
+
+
+def _sqlite_triggers(log: str, table: str, pk: str) -> List[str]:
+    statements = []
+    for event, op, ref in (("INSERT", "I", "NEW"), ("UPDATE", "U", "NEW"), ("DELETE", "D", "OLD")):
+        name = f'"{TRIGGER_PREFIX}{table}_{op.lower()}"'
+        statements.append(
+            f"CREATE TRIGGER {name} AFTER {event} ON \"{table}\" FOR EACH ROW BEGIN "
+            f"INSERT INTO {log} (\"table\", \"row_pk\", \"op\") "
+            f"VALUES ('{table}', CAST({ref}.\"{pk}\" AS TEXT), '{op}'); END"
+        )
+    return statements
+
+
+def _drop_triggers(cursor, vendor: str) -> None:
+    if vendor == "sqlite":
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s", [f"{TRIGGER_PREFIX}%"]
+        )
+        for (name,) in cursor.fetchall():
+            cursor.execute(f'DROP TRIGGER IF EXISTS "{name}"')
+    else:
+        cursor.execute(
+            "SELECT c.relname FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid "
+            "WHERE t.tgname = 'changelog_capture'"
+        )
+        for (table,) in cursor.fetchall():
+            cursor.execute(f'DROP TRIGGER IF EXISTS changelog_capture ON "{table}"')
+
+
+def install_triggers(using: str = DEFAULT_DB_ALIAS) -> int:
+    """Replace the change log triggers of ``using``; returns the tables covered."""
+
+    connection = connections[using]
+    if connection.vendor not in ("sqlite", "postgresql"):
+        raise NotImplementedError(f"No change log triggers for {connection.vendor}")
+    quote = connection.ops.quote_name
+    existing = set(connection.introspection.table_names())
+    log = ChangeLogEntry._meta.db_table
+    if log not in existing:
+        return 0
+
+    models = [model for model in tracked_models() if model._meta.db_table in existing]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        _drop_triggers(cursor, connection.vendor)
+        if connection.vendor == "postgresql":
+            cursor.execute(PG_FUNCTION.format(log=quote(log)))
+        for model in models:
+            table, pk = model._meta.db_table, model._meta.pk.column
+            if connection.vendor == "sqlite":
+                for statement in _sqlite_triggers(quote(log), table, pk):
+                    cursor.execute(statement)
+            else:
+                cursor.execute(
+                    f"CREATE TRIGGER changelog_capture AFTER INSERT OR UPDATE OR DELETE ON {quote(table)} "
+                    f"FOR EACH ROW EXECUTE FUNCTION changelog_capture('{pk}')"
+                )
+    return len(models)
+
+
+def install_triggers_after_migrate(sender, using=DEFAULT_DB_ALIAS, **kwargs) -> None:
+    install_triggers(using)
+
+
+# -- reading -----------------------------------------------------------------
+
+
+def _gap_timeout() -> timedelta:
+    return timedelta(seconds=getattr(settings, "CHANGELOG_GAP_TIMEOUT", DEFAULT_GAP_TIMEOUT))
+
+
+def read_changes(
+    since: int = 0,
+    limit: int = DEFAULT_BATCH_SIZE,
+    tables: Optional[Iterable[TableRef]] = None,
+    now: Optional[datetime] = None,
+) -> ChangeBatch:
+    """Up to ``limit`` log entries after offset ``since``, oldest first.
+
+    Reading stops before an offset that is missing but may still commit
+    (see the module docstring).  Reading from offset 0 starts at the
+    oldest entry kept, whatever its offset.
+    """
+
+    wanted = {_table(ref) for ref in tables} if tables is not None else None
+    settled = (now or timezone.now()) - _gap_timeout()
+    rows = ChangeLogEntry.objects.filter(offset__gt=since).order_by("offset").values_list(
+        "offset", "table", "row_pk", "op", "created_at"
+    )[:limit]
+
+    changes: List[Change] = []
+    position = since
+    for change in map(Change._make, rows):
+        if position and change.offset != position + 1 and change.created_at > settled:
+            break
+        position = change.offset
+        if wanted is None or change.table in wanted:
+            changes.append(change)
+    return ChangeBatch(changes, position)
+
+
+def settled_offset(since: int = 0, now: Optional[datetime] = None) -> int:
+    """Highest offset readable past ``since`` without skipping an entry.
+
+    Offsets after a gap that may still fill (see the module docstring) are
+    not settled yet.  SQLite offsets have no gaps, so its latest is.
+    """
+
+    if connections[ChangeLogEntry.objects.db].vendor == "sqlite":
+        last = ChangeLogEntry.objects.filter(offset__gt=since).aggregate(last=Max("offset"))["last"]
+        return since if last is None else last
+    position = since
+    while True:
+        batch = read_changes(position, DEFAULT_BATCH_SIZE, tables=(), now=now)
+        if batch.next_offset == position:
+            return position
+        position = batch.next_offset
+
+
+class ChangeConsumer:
+    """A named reader of the change log that remembers its offset.
+
+    The offset is a ``JobWatermark`` (``changelog.<name>``).  :meth:`consume`
+    hands each batch to a handler and stores the new offset in the same
+    transaction, so database work done by the handler and the offset commit
+    together: a failed batch is read again by the next run.
+    """
+
+    def __init__(
+        self, name: str, tables: Optional[Iterable[TableRef]] = None, batch_size: Optional[int] = None
+    ) -> None:
+        self.name = name
+        self.watermark = f"{WATERMARK_PREFIX}{name}"
+        self.tables = [_table(ref) for ref in tables] if tables is not None else None
+        self.batch_size = batch_size or getattr(settings, "CHANGELOG_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+
+    @property
+    def offset(self) -> int:
+        return get_watermark(self.watermark)
+
+    def poll(self, since: Optional[int] = None) -> ChangeBatch:
+        return read_changes(self.offset if since is None else since, self.batch_size, self.tables)
+
+    def commit(self, batch: ChangeBatch) -> None:
+        set_watermark(self.watermark, batch.next_offset)
+
+    def consume(self, handler: Callable[[List[Change]], None], max_batches: Optional[int] = None) -> int:
+        """Feed batches to ``handler`` until caught up; returns the changes handled."""
+
+        handled = batches = 0
+        while max_batches is None or batches < max_batches:
+            with transaction.atomic():
+                since = get_watermark(self.watermark, lock=True)
+                batch = self.poll(since)
+                if batch.next_offset == since:
+                    break
+                if batch.changes:
+                    handler(batch.changes)
+                self.commit(batch)
+            handled += len(batch.changes)
+            batches += 1
+        return handled
+
+
+def consumer_offsets() -> dict:
+    """Stored offset of every consumer, by consumer name."""
+
+    rows = JobWatermark.objects.filter(name__startswith=WATERMARK_PREFIX).values_list("name", "position")
+    return {name[len(WATERMARK_PREFIX):]: position for name, position in rows}
+
+
+def prune_changes(retention_hours: Optional[float] = None, now: Optional[datetime] = None) -> int:
+    """Delete entries every consumer has read and that are past retention.
+
+    Readers without a stored offset (``api/changes`` clients) have the
+    retention period to catch up.
+    """
+
+    if retention_hours is None:
+        retention_hours = getattr(settings, "CHANGELOG_RETENTION_HOURS", DEFAULT_RETENTION_HOURS)
+    entries = ChangeLogEntry.objects.filter(created_at__lt=(now or timezone.now()) - timedelta(hours=retention_hours))
+    lowest = JobWatermark.objects.filter(name__startswith=WATERMARK_PREFIX).aggregate(lowest=Min("position"))["lowest"]
+    if lowest is not None:
+        entries = entries.filter(offset__lte=lowest)
+    deleted, _ = entries.delete()
+    return deleted
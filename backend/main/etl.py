@@ -0,0 +1,506 @@
+"""Watermark-driven incremental ETL across raw -> process -> output.
+
+The pipeline is a DAG of :class:`Stage` objects.  A stage reads one or more
+source tables through :class:`Source` cursors -- an increasing id or a
+timestamp -- whose high-water marks are kept in ``main.JobWatermark`` as
+``etl.<stage>.<table>``.  Tables whose rows are edited in place are read
+through :class:`ChangeSource` instead, whose cursor is the offset of the
+change log (``main.changelog``), so inserts and updates are both picked up;
+its watermark is a change log consumer offset, ``changelog.etl.<stage>.<table>``.
+A run of a stage:
+
+1. *plans*: for every source, takes the rows past its watermark, up to the
+   highest cursor value present now, and records how far behind the stage
+   is (pending rows and the age of the oldest one);
+2. splits the pending work into partitions, usually one per facility;
+3. runs the partitions on a thread pool, each in its own transaction;
+4. advances the watermarks to the planned upper bounds once every
+   partition has succeeded.
+
+Stages whose dependencies have finished are planned as soon as possible, so
+independent branches (inventory -> emissions -> credits, and order
+matching) run side by side.  A stage that fails keeps its watermarks and its
+dependents are skipped; every partition writes idempotently (upserts, or
+window replacements), so the next run simply redoes the same range.  Two
+runs overlapping in time do duplicate work but produce the same rows.
+
+Each stage reports rows processed, lag and duration in a
+:class:`StageReport`.  On SQLite, partitions queue for the single write
+lock; the parallelism pays off on PostgreSQL.
+"""
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max, Min, QuerySet
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from output_data import credits
+from process_data.emissions import compute_emissions
+from process_data.manual_inputs import load_manual_inputs, remove_manual_inputs
+from process_data.matching import run_matching
+from process_data.models import ProcEmissionsCalcFact, ProcInventoryFact
+from process_data.units import backfill_normalized_quantities
+from raw_data.models import RawInputManualFact, RawMarketplaceListingFact, RawOrderSubmissionFact
+
+from .changelog import WATERMARK_PREFIX as CHANGELOG_PREFIX, settled_offset
+from .models import ChangeLogEntry
+from .watermarks import get_watermark, set_watermark
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+# Stage states in a report.
+PENDING, OK, FAILED, SKIPPED = "pending", "ok", "failed", "skipped"
+# Partition of a stage's deleted source rows.
+DELETED = "deleted"
+
+
+class Source:
+    """An incrementally read table: a model, its cursor and its time column.
+
+    Timestamp cursors are stored as microseconds since the epoch.  Rows
+    that arrive later with a cursor at or below the watermark are not seen,
+    so prefer an auto-increment id where the table has one.  Rows updated in
+    place keep their cursor and are not seen either; see :class:`ChangeSource`.
+    """
+
+    watermark_prefix = ""
+
+    def __init__(self, model: type, cursor: str, time_field: Optional[str] = None) -> None:
+        self.model = model
+        self.cursor = cursor
+        self.time_field = time_field
+        self._is_time = model._meta.get_field(cursor).get_internal_type() == "DateTimeField"
+
+    @property
+    def table(self) -> str:
+        return self.model._meta.db_table
+
+    def to_position(self, value: Any) -> int:
+        return (value - EPOCH) // MICROSECOND if self._is_time else int(value)
+
+    def from_position(self, position: int) -> Any:
+        return EPOCH + position * MICROSECOND if self._is_time else position
+
+    def between(self, since: int, upto: int) -> QuerySet:
+        """Rows with ``since < cursor <= upto``."""
+
+        return self.model.objects.filter(**{
+            f"{self.cursor}__gt": self.from_position(since),
+            f"{self.cursor}__lte": self.from_position(upto),
+        })
+
+    def deleted(self, since: int, upto: int) -> List[str]:
+        """Primary keys of rows deleted in the range, where the source knows them."""
+
+        return []
+
+    def pending(self, since: int) -> Dict[str, Any]:
+        """``rows`` past ``since``, the ``upto`` position and the ``oldest`` time."""
+
+        pending = self.model.objects.filter(**{f"{self.cursor}__gt": self.from_position(since)})
+        aggregates = {"rows": Count("pk"), "upto": Max(self.cursor)}
+        if self.time_field:
+            aggregates["oldest"] = Min(self.time_field)
+        found = pending.aggregate(**aggregates)
+        found["upto"] = self.to_position(found["upto"]) if found["upto"] is not None else since
+        return found
+
+
+class ChangeSource(Source):
+    """A table read through the change log, so updated rows are read too.
+
+    Positions are change log offsets.  From position 0 -- a ``full`` run, or
+    the first run -- every row of the table is read.  Deleted rows no longer
+    exist and are not read; their keys are listed by :meth:`deleted`.  The
+    lag is measured from when the changes were logged.
+    """
+
+    watermark_prefix = CHANGELOG_PREFIX
+
+    def __init__(self, model: type, time_field: Optional[str] = None) -> None:
+        self.model = model
+        self.cursor = "offset"
+        self.time_field = time_field
+        self._is_time = False
+
+    def _changes(self, since: int, upto: int) -> QuerySet:
+        return ChangeLogEntry.objects.filter(table=self.table, offset__gt=since, offset__lte=upto)
+
+    def between(self, since: int, upto: int) -> QuerySet:
+        if since == 0:
+            return self.model.objects.all()
+        keys = self._changes(since, upto).exclude(op="D").values(key=Cast("row_pk", self.model._meta.pk))
+        return self.model.objects.filter(pk__in=keys)
+
+    def deleted(self, since: int, upto: int) -> List[str]:
+        # A full run has no range of changes; rows deleted before it were
+        # handled when their entries were read.
+        if since == 0:
+            return []
+        keys = set(self._changes(since, upto).filter(op="D").values_list("row_pk", flat=True))
+        return sorted(keys)
+
+    def pending(self, since: int) -> Dict[str, Any]:
+        upto = settled_offset(since)
+        rows = self.between(since, upto).count() + len(self.deleted(since, upto))
+        found = {"rows": rows, "upto": upto, "oldest": None}
+        if since:
+            found["oldest"] = self._changes(since, upto).aggregate(oldest=Min("created_at"))["oldest"]
+        elif self.time_field:
+            found["oldest"] = self.model.objects.aggregate(oldest=Min(self.time_field))["oldest"]
+        return found
+
+
+@dataclass
+class SourceRange:
+    source: Source
+    watermark: str
+    since: int
+    upto: int
+    rows: int = 0
+    oldest: Optional[datetime] = None
+
+    @property
+    def rows_queryset(self) -> QuerySet:
+        return self.source.between(self.since, self.upto)
+
+    @property
+    def deleted_keys(self) -> List[str]:
+        return self.source.deleted(self.since, self.upto)
+
+
+@dataclass
+class StageReport:
+    name: str
+    status: str = PENDING
+    rows: int = 0
+    partitions: int = 0
+    lag_rows: int = 0
+    lag_seconds: float = 0.0
+    watermarks: Dict[str, List[int]] = field(default_factory=dict)
+    duration: float = 0.0
+    error: str = ""
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["lag_seconds"] = round(self.lag_seconds, 3)
+        data["duration"] = round(self.duration, 3)
+        return data
+
+
+@dataclass
+class PipelineReport:
+    stages: Dict[str, StageReport] = field(default_factory=dict)
+    duration: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return all(report.status == OK for report in self.stages.values())
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "ok": self.ok,
+            "duration": round(self.duration, 3),
+            "stages": {name: report.as_dict() for name, report in self.stages.items()},
+        }
+
+
+class Stage:
+    """One transform of the pipeline.
+
+    Subclasses set ``name``, ``depends_on`` and ``sources`` and implement
+    :meth:`partitions` and :meth:`run_partition`.
+    """
+
+    name: str = ""
+    depends_on: Sequence[str] = ()
+    sources: Sequence[Source] = ()
+
+    def watermark_name(self, source: Source) -> str:
+        return f"{source.watermark_prefix}etl.{self.name}.{source.table}"
+
+    def plan(self, full: bool = False) -> List[SourceRange]:
+        ranges = []
+        for source in self.sources:
+            name = self.watermark_name(source)
+            since = 0 if full else get_watermark(name)
+            found = source.pending(since)
+            ranges.append(SourceRange(source, name, since, found["upto"], found["rows"], found.get("oldest")))
+        return ranges
+
+    def partitions(self, ranges: List[SourceRange]) -> List[Any]:
+        """Independent units of work; by default the whole range at once."""
+
+        return [None]
+
+    def run_partition(self, partition: Any, ranges: List[SourceRange]) -> int:
+        """Process one partition and return the number of rows it handled."""
+
+        raise NotImplementedError
+
+    def commit(self, ranges: List[SourceRange]) -> None:
+        for source_range in ranges:
+            set_watermark(source_range.watermark, source_range.upto)
+
+
+def _facilities(queryset: QuerySet) -> List[int]:
+    return sorted(queryset.order_by().values_list("facility_id", flat=True).distinct())
+
+
+class ManualInventoryStage(Stage):
+    """raw manual inputs -> ``ProcInventoryFact``, per facility.
+
+    Corrected inputs are reloaded, so the inputs are read through the
+    change log; the inventory of deleted inputs is removed in a partition
+    of its own.
+    """
+
+    name = "manual_inventory"
+    sources = (ChangeSource(RawInputManualFact, "timestamp"),)
+
+    def partitions(self, ranges):
+        parts: List[Any] = _facilities(ranges[0].rows_queryset)
+        if ranges[0].deleted_keys:
+            parts.append(DELETED)
+        return parts
+
+    def run_partition(self, facility_id, ranges):
+        if facility_id == DELETED:
+            keys = ranges[0].deleted_keys
+            remove_manual_inputs(int(key) for key in keys)
+            return len(keys)
+        return load_manual_inputs(ranges[0].rows_queryset.filter(facility_id=facility_id)).read
+
+
+class NormalizeQuantitiesStage(Stage):
+    """Kilogram conversion of new and reloaded inventory rows."""
+
+    name = "normalize_quantities"
+    depends_on = ("manual_inventory",)
+    sources = (ChangeSource(ProcInventoryFact, "timestamp"),)
+
+    def run_partition(self, partition, ranges):
+        return backfill_normalized_quantities(ranges[0].rows_queryset).rows
+
+
+class EmissionsStage(Stage):
+    """Inventory -> ``ProcEmissionsCalcFact``, recomputing each facility's touched days.
+
+    Days are those of the inserted and updated rows as they are now; a row
+    moved to another day or deleted leaves its old day to a ``full`` run.
+    """
+
+    name = "emissions"
+    depends_on = ("normalize_quantities",)
+    sources = (ChangeSource(ProcInventoryFact, "timestamp"),)
+
+    def partitions(self, ranges):
+        return _facilities(ranges[0].rows_queryset)
+
+    def run_partition(self, facility_id, ranges):
+        rows = ranges[0].rows_queryset.filter(facility_id=facility_id)
+        span = rows.aggregate(first=Min("timestamp"), last=Max("timestamp"), count=Count("pk"))
+        if not span["count"]:
+            return 0
+        # compute_emissions replaces whole windows, so recomputing the days
+        # the new rows fall on is idempotent and keeps older rows of those
+        # days in the result.
+        start = datetime.combine(span["first"].astimezone(dt_timezone.utc).date(), dt_time.min, tzinfo=dt_timezone.utc)
+        end = datetime.combine(span["last"].astimezone(dt_timezone.utc).date(), dt_time.min, tzinfo=dt_timezone.utc)
+        compute_emissions(start, end + timedelta(days=1), facility_ids=[facility_id])
+        return span["count"]
+
+
+class CreditGrantsStage(Stage):
+    """Emissions -> ``OutCreditGrantLogFact`` through ``output_data.credits``.
+
+    The credit job keeps its own watermark, which this stage reads and lets
+    the job advance.
+    """
+
+    name = "credit_grants"
+    depends_on = ("emissions",)
+    sources = (Source(ProcEmissionsCalcFact, "calc_id", "timestamp"),)
+
+    def watermark_name(self, source):
+        return credits.WATERMARK
+
+    def run_partition(self, partition, ranges):
+        # From position 0 a full recomputation is what an incremental run
+        # would do anyway; it also covers ``run_pipeline(full=True)``.
+        return credits.grant_credits(full=ranges[0].since == 0).new_rows
+
+    def commit(self, ranges):
+        pass
+
+
+class OrderMatchingStage(Stage):
+    """Raw orders and listings -> ``ProcOrderFulfillmentFact``."""
+
+    name = "order_matching"
+    sources = (
+        Source(RawOrderSubmissionFact, "order_id", "timestamp"),
+        Source(RawMarketplaceListingFact, "listing_id", "timestamp"),
+    )
+
+    def run_partition(self, partition, ranges):
+        return run_matching().orders
+
+
+PIPELINE: List[Stage] = [
+    ManualInventoryStage(),
+    NormalizeQuantitiesStage(),
+    EmissionsStage(),
+    CreditGrantsStage(),
+    OrderMatchingStage(),
+]
+
+
+def _check_dag(stages: Sequence[Stage]) -> None:
+    names = [stage.name for stage in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("stage names must be unique")
+    seen: set = set()
+    remaining = list(stages)
+    while remaining:
+        ready = [stage for stage in remaining if all(dep in seen or dep not in names for dep in stage.depends_on)]
+        if not ready:
+            raise ValueError(f"dependency cycle among {[stage.name for stage in remaining]}")
+        for stage in ready:
+            seen.add(stage.name)
+            remaining.remove(stage)
+
+
+def _run_task(stage: Stage, partition: Any, ranges: List[SourceRange]) -> int:
+    try:
+        return stage.run_partition(partition, ranges)
+    finally:
+        # Pool threads keep their own connections; do not leak them.
+        connections.close_all()
+
+
+class _InlineExecutor:
+    """Runs tasks in the calling thread, for ``workers=0``."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, stage, partition, ranges) -> Future:
+        future: Future = Future()
+        try:
+            future.set_result(stage.run_partition(partition, ranges))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+def run_pipeline(
+    stages: Optional[Iterable[Stage]] = None,
+    only: Optional[Iterable[str]] = None,
+    workers: Optional[int] = None,
+    full: bool = False,
+) -> PipelineReport:
+    """Run the DAG once and report on every stage.
+
+    ``only`` restricts the run to the named stages; dependencies outside
+    the selection are assumed to be up to date.  ``full=True`` ignores the
+    watermarks and reprocesses every row.  ``workers=0`` runs every
+    partition in the calling thread and connection.
+    """
+
+    stages = list(PIPELINE if stages is None else stages)
+    if only is not None:
+        only = set(only)
+        unknown = only - {stage.name for stage in stages}
+        if unknown:
+            raise ValueError(f"unknown stages {sorted(unknown)}")
+        stages = [stage for stage in stages if stage.name in only]
+    _check_dag(stages)
+    if workers is None:
+        workers = getattr(settings, "ETL_WORKERS", DEFAULT_WORKERS)
+
+    report = PipelineReport({stage.name: StageReport(stage.name) for stage in stages})
+    by_name = {stage.name: stage for stage in stages}
+    started = time.perf_counter()
+    waiting = list(stages)
+    running: Dict[str, Dict[str, Any]] = {}
+    futures: Dict[Future, str] = {}
+
+    def finish(name: str, status: str, error: str = "") -> None:
+        stage_report = report.stages[name]
+        state = running.pop(name)
+        if status == OK:
+            by_name[name].commit(state["ranges"])
+        stage_report.status = status
+        stage_report.error = error
+        stage_report.duration = time.perf_counter() - state["started"]
+        log = logger.info if status == OK else logger.error
+        log("etl stage %s %s: %d rows in %.2fs", name, status, stage_report.rows, stage_report.duration)
+
+    executor = ThreadPoolExecutor(workers, thread_name_prefix="etl") if workers else _InlineExecutor()
+    with executor as pool:
+        while waiting or running:
+            for stage in list(waiting):
+                deps = [report.stages[dep].status for dep in stage.depends_on if dep in report.stages]
+                if any(status in (FAILED, SKIPPED) for status in deps):
+                    waiting.remove(stage)
+                    report.stages[stage.name].status = SKIPPED
+                    continue
+                if any(status != OK for status in deps):
+                    continue
+                waiting.remove(stage)
+                stage_report = report.stages[stage.name]
+                state = running[stage.name] = {"started": time.perf_counter(), "ranges": [], "left": 0}
+                try:
+                    ranges = state["ranges"] = stage.plan(full)
+                    now = timezone.now()
+                    stage_report.lag_rows = sum(r.rows for r in ranges)
+                    oldest = [r.oldest for r in ranges if r.rows and r.oldest is not None]
+                    stage_report.lag_seconds = max(((now - ts).total_seconds() for ts in oldest), default=0.0)
+                    stage_report.watermarks = {r.watermark: [r.since, r.upto] for r in ranges}
+                    parts = stage.partitions(ranges) if stage_report.lag_rows else []
+                except Exception as exc:
+                    logger.exception("etl stage %s failed to plan", stage.name)
+                    finish(stage.name, FAILED, repr(exc))
+                    continue
+                stage_report.partitions = len(parts)
+                if not parts:
+                    finish(stage.name, OK)
+                    continue
+                state["left"] = len(parts)
+                for part in parts:
+                    futures[pool.submit(_run_task, stage, part, ranges)] = stage.name
+
+            if not futures:
+                continue
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures.pop(future)
+                state = running[name]
+                stage_report = report.stages[name]
+                try:
+                    stage_report.rows += future.result()
+                except Exception as exc:
+                    logger.exception("etl stage %s failed", name)
+                    state["error"] = repr(exc)
+                state["left"] -= 1
+                if state["left"] == 0:
+                    finish(name, FAILED if "error" in state else OK, state.get("error", ""))
+
+    report.duration = time.perf_counter() - started
+    return report
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from main.changelog import consumer_offsets, prune_changes
+
+
+class Command(BaseCommand):
+    help = "Delete change log entries that every consumer has read."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-hours",
+            type=float,
+            help="Keep entries younger than this (default: CHANGELOG_RETENTION_HOURS).",
+        )
+
+    def handle(self, *args, **options):
+        if options["retention_hours"] is not None and options["retention_hours"] < 0:
+            raise CommandError("--retention-hours must not be negative")
+        deleted = prune_changes(options["retention_hours"])
+        offsets = ", ".join(f"{name} at {offset}" for name, offset in sorted(consumer_offsets().items()))
+        self.stdout.write(f"Pruned {deleted} change log entries (consumers: {offsets or 'none'}).")
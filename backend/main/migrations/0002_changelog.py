@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:07
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ChangeLogEntry",
+            fields=[
+                ("offset", models.BigAutoField(primary_key=True, serialize=False)),
+                ("table", models.CharField(max_length=100)),
+                ("row_pk", models.CharField(max_length=255)),
+                (
+                    "op",
+                    models.CharField(
+                        choices=[("I", "insert"), ("U", "update"), ("D", "delete")],
+                        max_length=1,
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        db_default=django.db.models.functions.datetime.Now()
+                    ),
+                ),
+            ],
+        ),
+    ]
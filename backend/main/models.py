@@ -1,3 +1,26 @@
 from django.db import models
+from django.db.models.functions import Now
 
-# Create your models here.
+
+class JobWatermark(models.Model):
+    """High-water mark of an incremental job, e.g. the last row id it consumed."""
+
+    name = models.CharField(max_length=100, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ChangeLogEntry(models.Model):
+    """One row written to, rewritten in or removed from a tracked table.
+
+    Entries are appended by database triggers (see ``main.changelog``) in
+    the transaction of the change itself; ``offset`` only ever grows.
+    """
+
+    OPS = [("I", "insert"), ("U", "update"), ("D", "delete")]
+
+    offset = models.BigAutoField(primary_key=True)
+    table = models.CharField(max_length=100)
+    row_pk = models.CharField(max_length=255)
+    op = models.CharField(max_length=1, choices=OPS)
+    created_at = models.DateTimeField(db_default=Now())
@@ -0,0 +1,36 @@
+"""Query cache invalidation from model signals.
+
+Receivers are connected per model rather than for every sender: a
+``post_delete`` receiver makes Django load and signal each row of a
+``QuerySet.delete()``, so tables rewritten in bulk are left out here and
+their writers invalidate the cache themselves.
+"""
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+
+from .caching import mark_stale
+
+BULK_MAINTAINED = {
+    "output_data.OutBatchSummaryFact",
+    "process_data.ProcTraceLineageFact",
+    "process_data.ProcTraceMerkleNode",
+    "raw_data.RawInputNIRFact",
+    "raw_data.RawInputRFIDFact",
+}
+
+
+def invalidate_query_cache(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_stale(instance)
+
+
+def connect_invalidation() -> None:
+    for label in settings.CACHE_INVALIDATION_APPS:
+        for model in apps.get_app_config(label).get_models():
+            if model._meta.label in BULK_MAINTAINED:
+                continue
+            uid = f"query_cache:{model._meta.label}"
+            post_save.connect(invalidate_query_cache, sender=model, dispatch_uid=uid)
+            post_delete.connect(invalidate_query_cache, sender=model, dispatch_uid=uid)
@@ -0,0 +1,507 @@
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.db.models import Max
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from config.database import database_settings, replica_aliases
+from config.db_routers import ReplicaRouter
+from output_data.rollups import inventory_totals, refresh_batch_summaries
+from process_data.manual_inputs import load_manual_inputs
+from process_data.models import ProcEmissionsCalcFact, ProcInventoryFact
+from raw_data.archive import archive_before
+from output_data.models import OutBatchSummaryFact
+from raw_data.models import (
+    RawEmissionFactorDim,
+    RawFacilityDim,
+    RawFacilityProcessMapFact,
+    RawInputManualFact,
+    RawInputRFIDFact,
+    RawMaterialDim,
+    RawTextileProcessDim,
+    RawUnitMappingDim,
+    RawUserDim,
+)
+
+from . import changelog, etl
+from .caching import cached_query, query_cache
+from .models import ChangeLogEntry
+from .watermarks import get_watermark, set_watermark
+
+
+# Opens its own connections to throwaway SQLite files, outside the test
+# database guards of Django's test cases.
+class DatabaseSettingsTests(unittest.TestCase):
+    def test_sqlite_primary_and_replicas(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = Path(tmp)
+            env = {"DB_REPLICAS": f"{base / 'r1.sqlite3'}, {base / 'r2.sqlite3'}", "DB_SQLITE_TIMEOUT": "5"}
+            databases = database_settings(base, env)
+            self.assertEqual(replica_aliases(databases), ["replica_1", "replica_2"])
+            self.assertEqual(databases["default"]["NAME"], base / "db.sqlite3")
+            self.assertEqual(databases["default"]["OPTIONS"]["transaction_mode"], "IMMEDIATE")
+            self.assertNotIn("transaction_mode", databases["replica_1"]["OPTIONS"])
+            self.assertEqual(databases["replica_2"]["TEST"], {"MIRROR": "default"})
+
+            handler = ConnectionHandler(databases)
+            try:
+                for alias in databases:
+                    with handler[alias].cursor() as cursor:
+                        cursor.execute("PRAGMA journal_mode")
+                        self.assertEqual(cursor.fetchone()[0], "wal")
+                        cursor.execute("PRAGMA busy_timeout")
+                        self.assertEqual(cursor.fetchone()[0], 5000)
+            finally:
+                handler.close_all()
+
+    def test_postgres_pool_disables_persistent_connections(self):
+        env = {
+            "DB_ENGINE": "postgres", "DB_NAME": "lumen", "DB_HOST": "db", "DB_PORT": "5432",
+            "DB_POOL_MAX_SIZE": "20", "DB_REPLICAS": "replica-a,replica-b:6432",
+        }
+        databases = database_settings(Path("."), env)
+        primary = databases["default"]
+        self.assertEqual(primary["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(primary["OPTIONS"]["pool"], {"min_size": 1, "max_size": 20})
+        self.assertEqual(primary["CONN_MAX_AGE"], 0)
+        self.assertEqual((databases["replica_1"]["HOST"], databases["replica_1"]["PORT"]), ("replica-a", "5432"))
+        self.assertEqual((databases["replica_2"]["HOST"], databases["replica_2"]["PORT"]), ("replica-b", "6432"))
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1", "replica_2"], REPLICA_READ_APPS=("output_data",))
+class ReplicaRouterTests(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def test_reads_of_replica_apps_go_to_replicas(self):
+        reads = {self.router.db_for_read(OutBatchSummaryFact) for _ in range(50)}
+        self.assertEqual(reads, {"replica_1", "replica_2"})
+        self.assertEqual(self.router.db_for_write(OutBatchSummaryFact), DEFAULT_DB_ALIAS)
+
+    def test_raw_data_stays_on_primary(self):
+        self.assertEqual(self.router.db_for_read(RawFacilityDim), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_write(RawFacilityDim), DEFAULT_DB_ALIAS)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_primary(self):
+        self.assertEqual(self.router.db_for_read(OutBatchSummaryFact), DEFAULT_DB_ALIAS)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"], REPLICA_READ_APPS=("output_data",))
+class ReplicaRouterTransactionTests(TestCase):
+    def test_reads_inside_a_transaction_use_primary(self):
+        # TestCase wraps each test in atomic() on the primary.
+        self.assertEqual(ReplicaRouter().db_for_read(OutBatchSummaryFact), DEFAULT_DB_ALIAS)
+        self.assertEqual(OutBatchSummaryFact.objects.all().db, DEFAULT_DB_ALIAS)
+
+
+class QueryCacheTests(TestCase):
+    def setUp(self):
+        # clear() below wipes the whole directory, so use one of our own.
+        location = self.enterContext(tempfile.TemporaryDirectory())
+        caches = {**settings.CACHES, "query": {**settings.CACHES["query"], "LOCATION": location}}
+        self.enterContext(override_settings(CACHES=caches))
+        query_cache.backend.clear()
+        query_cache.reset_stats()
+        self.facility = RawFacilityDim.objects.create(
+            name="Mill", location="IN", org_id="org-1", boundary_conditions_json={}
+        )
+        self.material = RawMaterialDim.objects.create(
+            type="cotton", blend_ratio="100", source="farm", certifications=""
+        )
+
+    def add_inventory(self, batch_id, kg):
+        return ProcInventoryFact.objects.create(
+            facility=self.facility, material=self.material, batch_id=batch_id,
+            quantity_kg=kg, status="in_stock", timestamp="2025-01-01T00:00:00Z",
+        )
+
+    def test_cached_query_is_invalidated_by_saves(self):
+        self.add_inventory("b1", 10.0)
+        self.assertEqual(inventory_totals()[0]["inventory_kg"], 10.0)
+        with self.assertNumQueries(0):
+            self.assertEqual(inventory_totals()[0]["inventory_kg"], 10.0)
+
+        self.add_inventory("b2", 5.0)
+        self.assertEqual(inventory_totals()[0]["inventory_kg"], 15.0)
+        self.facility.name = "North mill"
+        self.facility.save()
+        self.assertEqual(inventory_totals()[0]["facility_name"], "North mill")
+        stats = query_cache.stats()
+        self.assertEqual((stats.hits, stats.misses), (1, 3))
+        self.assertEqual(stats.hit_ratio, 0.25)
+
+    def test_parameters_are_part_of_the_key(self):
+        self.add_inventory("b1", 10.0)
+        self.assertEqual(len(inventory_totals()), 1)
+        self.assertEqual(inventory_totals(facility_id=self.facility.pk + 1), [])
+
+    def test_evictions_are_counted(self):
+        calls = []
+
+        @cached_query("tests.answer", depends_on=[RawMaterialDim])
+        def answer():
+            calls.append(1)
+            return 42
+
+        answer()
+        # Drop the entry behind the cache's back, as culling would.
+        query_cache.backend.delete(query_cache.make_key("tests.answer", [[], {}], ["raw_data.RawMaterialDim"]))
+        answer()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(query_cache.stats().evictions, 1)
+
+    def test_concurrent_invalidations_never_collapse(self):
+        tag = "raw_data.RawMaterialDim"
+        seen = set(query_cache.tag_versions([tag]))
+        # Each bump writes a version of its own instead of incrementing the
+        # stored one, so two processes bumping at once still move it twice.
+        for _ in range(3):
+            query_cache.invalidate(tag)
+            seen.add(query_cache.tag_versions([tag])[0])
+        self.assertEqual(len(seen), 4)
+
+    def test_dashboard_and_stats_require_authentication(self):
+        client = APIClient()
+        self.assertEqual(client.get(reverse("cache-stats")).status_code, 401)
+        self.assertEqual(client.get(reverse("inventory-dashboard")).status_code, 401)
+        client.force_authenticate(get_user_model().objects.create_user(username="viewer", password="secret123"))
+        self.add_inventory("b1", 10.0)
+        self.assertEqual(client.get(reverse("inventory-dashboard")).status_code, 200)
+        self.assertIn("hit_ratio", client.get(reverse("cache-stats")).json())
+
+    def test_dossier_response_is_cached_per_batch(self):
+        self.add_inventory("b1", 10.0)
+        self.add_inventory("b2", 3.0)
+        refresh_batch_summaries(["b1", "b2"])
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(username="reader", password="secret123"))
+        url = reverse("batch-dossier", args=["b1"])
+        self.assertEqual(self.client.get(url).json()["inventory_kg"], 10.0)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json()["inventory_kg"], 10.0)
+
+        # Refreshing another batch leaves b1's entry in place.
+        self.add_inventory("b2", 1.0)
+        refresh_batch_summaries(["b2"])
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        self.add_inventory("b1", 2.0)
+        refresh_batch_summaries(["b1"])
+        self.assertEqual(self.client.get(url).json()["inventory_kg"], 12.0)
+        self.assertEqual(self.client.get(reverse("batch-dossier", args=["missing"])).status_code, 404)
+
+        stats = self.client.get(reverse("cache-stats")).json()
+        self.assertEqual(stats["hits"], 2)
+        self.assertGreater(stats["hit_ratio"], 0)
+
+    def test_keys_are_scoped_to_the_database(self):
+        query_cache.backend.set("entry", "value")
+        with mock.patch.dict(connection.settings_dict, NAME="another-database"):
+            self.assertIsNone(query_cache.backend.get("entry"))
+        self.assertEqual(query_cache.backend.get("entry"), "value")
+
+
+class EtlPipelineTests(TestCase):
+    def setUp(self):
+        self.facility = RawFacilityDim.objects.create(
+            name="Mill", location="IN", org_id="org-1", boundary_conditions_json={}
+        )
+        self.material = RawMaterialDim.objects.create(
+            type="Cotton", blend_ratio="100", source="farm", certifications=""
+        )
+        self.user = RawUserDim.objects.create(org_id="org-1", role="operator", settings_json={})
+        process = RawTextileProcessDim.objects.create(
+            process_name="dyeing", stage="wet", energy_type="grid", unit_of_measurement="kg", details_json={}
+        )
+        RawFacilityProcessMapFact.objects.create(
+            facility=self.facility, process=process, default_energy_source="grid",
+            active_from=date(2024, 1, 1), scope_flag="1",
+        )
+        RawEmissionFactorDim.objects.create(
+            process=process, material_type="cotton", factor_value=2.0, source="x", region="in"
+        )
+
+    def add_input(self, values, day=2):
+        return RawInputManualFact.objects.create(
+            user=self.user, stage="dyeing", material=self.material, facility=self.facility,
+            timestamp=datetime(2025, 3, day, tzinfo=dt_timezone.utc), values_json=values, source_type="form",
+        )
+
+    def test_runs_move_only_new_rows_through_the_layers(self):
+        self.add_input({"batch_id": "b1", "quantity": 10})
+        self.add_input({"batch_id": "b2", "quantity": 2, "unit": "t"})
+        self.add_input({"quantity": 5})
+
+        report = etl.run_pipeline(workers=0)
+        self.assertTrue(report.ok, report.as_dict())
+        manual = report.stages["manual_inventory"]
+        self.assertEqual((manual.rows, manual.lag_rows, manual.partitions), (3, 3, 1))
+        self.assertGreater(manual.lag_seconds, 0)
+        self.assertEqual(report.stages["emissions"].rows, 2)
+        self.assertEqual(ProcInventoryFact.objects.get(batch_id="b2").normalized_quantity_kg, 2000.0)
+        self.assertEqual(
+            sorted(ProcEmissionsCalcFact.objects.values_list("batch_id", "emissions_kgco2")),
+            [("b1", 20.0), ("b2", 4000.0)],
+        )
+
+        # Nothing new: every stage is a no-op.
+        rerun = etl.run_pipeline(workers=0)
+        self.assertTrue(rerun.ok)
+        self.assertEqual(sum(stage.rows for stage in rerun.stages.values()), 0)
+
+        self.add_input({"batch_id": "b3", "quantity": 1}, day=2)
+        report = etl.run_pipeline(workers=0)
+        self.assertEqual(report.stages["manual_inventory"].rows, 1)
+        self.assertEqual(report.stages["emissions"].rows, 1)
+        self.assertEqual(ProcEmissionsCalcFact.objects.count(), 3)
+
+        # A full rerun rewrites the same rows instead of duplicating them.
+        self.assertTrue(etl.run_pipeline(workers=0, full=True).ok)
+        self.assertEqual(ProcInventoryFact.objects.count(), 3)
+        self.assertEqual(ProcEmissionsCalcFact.objects.count(), 3)
+        watermark = get_watermark("changelog.etl.manual_inventory.raw_data_rawinputmanualfact")
+        self.assertGreater(watermark, 0)
+        self.assertIn("etl.manual_inventory.raw_data_rawinputmanualfact", changelog.consumer_offsets())
+
+    def test_edited_inputs_are_reprocessed(self):
+        first = self.add_input({"batch_id": "b1", "quantity": 10})
+        self.add_input({"batch_id": "b2", "quantity": 1})
+        self.assertTrue(etl.run_pipeline(workers=0).ok)
+
+        first.values_json = {"batch_id": "b1", "quantity": 3, "unit": "t"}
+        first.save()
+        report = etl.run_pipeline(workers=0)
+        self.assertTrue(report.ok, report.as_dict())
+        self.assertEqual(report.stages["manual_inventory"].rows, 1)
+        self.assertEqual(report.stages["emissions"].rows, 1)
+        self.assertEqual(ProcInventoryFact.objects.get(batch_id="b1").normalized_quantity_kg, 3000.0)
+        self.assertEqual(
+            sorted(ProcEmissionsCalcFact.objects.values_list("batch_id", "emissions_kgco2")),
+            [("b1", 6000.0), ("b2", 2.0)],
+        )
+
+    def test_invalidated_and_deleted_inputs_lose_their_inventory(self):
+        first = self.add_input({"batch_id": "b1", "quantity": 10})
+        second = self.add_input({"batch_id": "b2", "quantity": 1}, day=3)
+        self.add_input({"batch_id": "b3", "quantity": 2}, day=3)
+        self.assertTrue(etl.run_pipeline(workers=0).ok)
+
+        # A correction that no longer validates takes the inventory with it.
+        first.values_json = {"batch_id": "b1"}
+        first.save()
+        self.assertTrue(etl.run_pipeline(workers=0).ok)
+        self.assertFalse(ProcInventoryFact.objects.filter(batch_id="b1").exists())
+        self.assertFalse(ProcEmissionsCalcFact.objects.filter(batch_id="b1").exists())
+        self.assertFalse(OutBatchSummaryFact.objects.filter(batch_id="b1").exists())
+
+        second.delete()
+        report = etl.run_pipeline(workers=0)
+        self.assertTrue(report.ok, report.as_dict())
+        self.assertEqual(report.stages["manual_inventory"].rows, 1)
+        self.assertEqual(list(ProcInventoryFact.objects.values_list("batch_id", flat=True)), ["b3"])
+        self.assertEqual(list(ProcEmissionsCalcFact.objects.values_list("batch_id", flat=True)), ["b3"])
+
+    def test_archived_inputs_keep_their_inventory(self):
+        self.add_input({"batch_id": "b1", "quantity": 10})
+        self.assertTrue(etl.run_pipeline(workers=0).ok)
+        with tempfile.TemporaryDirectory() as archive_dir, override_settings(RAW_ARCHIVE_DIR=archive_dir):
+            archive_before(datetime(2025, 4, 1, tzinfo=dt_timezone.utc), kinds=["manual"])
+            self.assertFalse(RawInputManualFact.objects.exists())
+            self.assertTrue(etl.run_pipeline(workers=0).ok)
+        self.assertTrue(ProcInventoryFact.objects.filter(batch_id="b1").exists())
+
+    def test_unknown_unit_mappings_are_rejected(self):
+        mapping = RawUnitMappingDim.objects.create(custom_unit="bale", kg_equivalent=200, description="")
+        self.add_input({"batch_id": "b1", "quantity": 1, "unit_mapping_id": mapping.pk})
+        self.add_input({"batch_id": "b2", "quantity": 1, "unit_mapping_id": mapping.pk + 1})
+        self.add_input({"batch_id": "b3", "quantity": 1, "unit_mapping_id": True})
+        self.add_input({"batch_id": "b4", "quantity": 1, "unit_mapping_id": "1"})
+        stats = load_manual_inputs()
+        self.assertEqual((stats.read, stats.loaded, stats.rejected), (4, 1, 3))
+        self.assertEqual(ProcInventoryFact.objects.get().unit_mapping_id, mapping.pk)
+
+
+class _FakeStage(etl.Stage):
+    def __init__(self, name, depends_on=(), parts=(1,), fail=False, barrier=None):
+        self.name, self.depends_on = name, depends_on
+        self.parts, self.fail, self.barrier = list(parts), fail, barrier
+        self.committed = False
+
+    def plan(self, full=False):
+        return [etl.SourceRange(None, self.name, 0, len(self.parts), rows=len(self.parts))]
+
+    def partitions(self, ranges):
+        return self.parts
+
+    def run_partition(self, partition, ranges):
+        if self.barrier is not None:
+            self.barrier.wait(timeout=5)
+        if self.fail:
+            raise RuntimeError("boom")
+        return partition
+
+    def commit(self, ranges):
+        self.committed = True
+
+
+class EtlSchedulerTests(SimpleTestCase):
+    def test_independent_branches_and_partitions_run_in_parallel(self):
+        # Both stages' partitions must be in flight at once to pass the barrier.
+        barrier = threading.Barrier(3)
+        left = _FakeStage("left", parts=[1, 2], barrier=barrier)
+        right = _FakeStage("right", parts=[4], barrier=barrier)
+        after = _FakeStage("after", depends_on=("left", "right"))
+        report = etl.run_pipeline([after, left, right], workers=3)
+        self.assertTrue(report.ok)
+        self.assertEqual(report.stages["left"].rows, 3)
+        self.assertTrue(after.committed)
+
+    def test_failures_keep_watermarks_and_skip_dependents(self):
+        broken = _FakeStage("broken", parts=[1, 2], fail=True)
+        child = _FakeStage("child", depends_on=("broken",))
+        other = _FakeStage("other")
+        with self.assertLogs("main.etl", "ERROR"):
+            report = etl.run_pipeline([broken, child, other], workers=2)
+        self.assertEqual(
+            {name: stage.status for name, stage in report.stages.items()},
+            {"broken": etl.FAILED, "child": etl.SKIPPED, "other": etl.OK},
+        )
+        self.assertFalse(broken.committed)
+        self.assertIn("boom", report.stages["broken"].error)
+
+    def test_cycles_are_rejected(self):
+        with self.assertRaises(ValueError):
+            etl.run_pipeline([_FakeStage("a", depends_on=("b",)), _FakeStage("b", depends_on=("a",))], workers=0)
+
+
+class ChangeLogTests(TestCase):
+    def setUp(self):
+        self.since = ChangeLogEntry.objects.aggregate(last=Max("offset"))["last"] or 0
+        self.facility = RawFacilityDim.objects.create(
+            name="Mill", location="IN", org_id="org-1", boundary_conditions_json={}
+        )
+
+    def logged(self, since=None):
+        batch = changelog.read_changes(self.since if since is None else since)
+        return [(change.table, change.row_pk, change.op) for change in batch.changes]
+
+    def scan(self, tag_id, batch_id="b1"):
+        return RawInputRFIDFact(
+            tag_id=tag_id, batch_id=batch_id, facility=self.facility,
+            scan_time=datetime(2025, 3, 1, tzinfo=dt_timezone.utc), context_json={},
+        )
+
+    def test_every_write_path_is_logged_in_order(self):
+        table = RawInputRFIDFact._meta.db_table
+        facility = (RawFacilityDim._meta.db_table, str(self.facility.pk))
+        RawInputRFIDFact.objects.bulk_create([self.scan("t1"), self.scan("t2")])
+        RawInputRFIDFact.objects.bulk_create(
+            [self.scan("t2", "b2"), self.scan("t3")],
+            update_conflicts=True, unique_fields=["tag_id"], update_fields=["batch_id"],
+        )
+        RawInputRFIDFact.objects.filter(tag_id="t1").update(batch_id="b3")
+        RawInputRFIDFact.objects.filter(tag_id="t3").delete()
+
+        self.assertEqual(self.logged(), [
+            (*facility, "I"),
+            (table, "t1", "I"), (table, "t2", "I"),
+            (table, "t2", "U"), (table, "t3", "I"),
+            (table, "t1", "U"),
+            (table, "t3", "D"),
+        ])
+        offsets = [change.offset for change in changelog.read_changes(self.since).changes]
+        self.assertEqual(offsets, sorted(offsets))
+
+    def test_rolled_back_writes_leave_no_entries(self):
+        start = changelog.read_changes(self.since).next_offset
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.scan("t1").save()
+            RawFacilityDim.objects.filter(pk=self.facility.pk).update(name="Renamed")
+            raise RuntimeError
+        self.assertEqual(self.logged(start), [])
+
+    def test_consumers_read_filtered_batches_from_their_offset(self):
+        user = RawUserDim.objects.create(org_id="org-1", role="operator", settings_json={})
+        material = RawMaterialDim.objects.create(type="Cotton", blend_ratio="100", source="farm", certifications="")
+        for number in range(3):
+            RawInputManualFact.objects.create(
+                user=user, stage="dyeing", material=material, facility=self.facility, timestamp=timezone.now(),
+                values_json={"batch_id": f"b{number}", "quantity": 1}, source_type="form",
+            )
+        load_manual_inputs()
+        load_manual_inputs()
+
+        set_watermark("changelog.inventory", self.since)
+        consumer = changelog.ChangeConsumer("inventory", tables=[ProcInventoryFact], batch_size=4)
+        seen = []
+        handled = consumer.consume(seen.append)
+        self.assertEqual(handled, 6)
+        self.assertGreater(len(seen), 1)
+        self.assertEqual([change.op for batch in seen for change in batch], ["I", "I", "I", "U", "U", "U"])
+        self.assertEqual(consumer.offset, ChangeLogEntry.objects.aggregate(last=Max("offset"))["last"])
+        self.assertEqual(consumer.consume(seen.append), 0)
+
+        RawInputRFIDFact.objects.bulk_create([self.scan("t1")])
+        self.assertEqual(consumer.poll().changes, [])
+        # A failing handler keeps the offset for the next run.
+        load_manual_inputs()
+        offset = consumer.offset
+        with self.assertRaises(ValueError):
+            consumer.consume(lambda changes: int("x"))
+        self.assertEqual(consumer.offset, offset)
+
+    def test_reading_waits_at_offset_gaps_until_they_time_out(self):
+        now = timezone.now()
+        base = self.since + 10
+        for offset, age in ((base + 1, 0), (base + 3, 0), (base + 4, 0)):
+            ChangeLogEntry.objects.create(
+                offset=offset, table="t", row_pk=str(offset), op="I", created_at=now - timedelta(seconds=age)
+            )
+
+        batch = changelog.read_changes(base, now=now)
+        self.assertEqual(([change.offset for change in batch.changes], batch.next_offset), ([base + 1], base + 1))
+        later = now + timedelta(seconds=61)
+        batch = changelog.read_changes(base + 1, now=later)
+        self.assertEqual([change.offset for change in batch.changes], [base + 3, base + 4])
+        # Offset 0 starts at the oldest entry kept.
+        ChangeLogEntry.objects.filter(offset__lte=base).delete()
+        self.assertEqual(changelog.read_changes(0, now=now).changes[0].offset, base + 1)
+
+    def test_prune_keeps_entries_a_consumer_has_not_read(self):
+        RawInputRFIDFact.objects.bulk_create([self.scan("t1"), self.scan("t2")])
+        entries = list(ChangeLogEntry.objects.filter(offset__gt=self.since).values_list("offset", flat=True))
+        set_watermark("changelog.slow", entries[1])
+        set_watermark("changelog.fast", entries[-1])
+
+        self.assertEqual(changelog.prune_changes(retention_hours=1), 0)
+        later = timezone.now() + timedelta(hours=2)
+        self.assertEqual(changelog.prune_changes(retention_hours=1, now=later), 2)
+        self.assertEqual(
+            list(ChangeLogEntry.objects.filter(offset__gt=self.since).values_list("offset", flat=True)), entries[2:]
+        )
+
+    def test_change_feed_requires_a_user_and_pages_by_offset(self):
+        client = APIClient()
+        url = reverse("change-feed")
+        self.assertEqual(client.get(url).status_code, 401)
+
+        client.force_authenticate(get_user_model().objects.create_user(username="reader", password="secret123"))
+        RawInputRFIDFact.objects.bulk_create([self.scan("t1"), self.scan("t2")])
+        response = client.get(url, {"since": self.since, "limit": 2, "table": RawInputRFIDFact._meta.db_table})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([change["row_pk"] for change in response.data["changes"]], ["t1"])
+        response = client.get(url, {"since": response.data["next"]})
+        self.assertEqual([change["row_pk"] for change in response.data["changes"]], ["t2"])
+        self.assertEqual(client.get(url, {"since": "-1"}).status_code, 400)
@@ -1,5 +1,44 @@
+from django.conf import settings
 from django.http import HttpResponse
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .caching import query_cache
+from .changelog import read_changes
 
 
 def index(request):
     return HttpResponse('Hello from Django!')
+
+
+class CacheStatsView(APIView):
+    """``GET`` hit ratio and eviction counters of this process's query cache."""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(query_cache.stats().as_dict())
+
+
+class ChangeFeedView(APIView):
+    """``GET`` change log entries after ``?since=``, oldest first.
+
+    ``?limit=`` caps the entries scanned (at most ``CHANGELOG_BATCH_SIZE``)
+    and repeated ``?table=`` keeps only those tables.  Clients store
+    ``next`` and pass it as ``since`` on their next call.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        since = request.query_params.get("since", "0")
+        limit = request.query_params.get("limit", str(settings.CHANGELOG_BATCH_SIZE))
+        if not since.isdigit() or not limit.isdigit() or int(limit) < 1:
+            return Response({"detail": "since and limit must be non-negative integers."}, status=400)
+        tables = request.query_params.getlist("table") or None
+        batch = read_changes(int(since), min(int(limit), settings.CHANGELOG_BATCH_SIZE), tables)
+        return Response({
+            "changes": [change._asdict() for change in batch.changes],
+            "next": batch.next_offset,
+        })
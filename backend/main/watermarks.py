@@ -0,0 +1,33 @@
+"""Positions of incremental jobs, stored in ``JobWatermark``."""
+
+from django.db.models import F
+
+from .models import JobWatermark
+
+
+def get_watermark(name: str, lock: bool = False) -> int:
+    """Current position of job ``name`` (0 if it never ran).
+
+    With ``lock=True`` the row is locked for the rest of the transaction,
+    so concurrent runs of the same job serialise.
+    """
+
+    queryset = JobWatermark.objects.filter(pk=name)
+    if lock:
+        JobWatermark.objects.get_or_create(pk=name)
+        queryset = queryset.select_for_update()
+    position = queryset.values_list("position", flat=True).first()
+    return position or 0
+
+
+def set_watermark(name: str, position: int) -> None:
+    JobWatermark.objects.update_or_create(pk=name, defaults={"position": position})
+
+
+def bump_watermark(name: str) -> None:
+    """Increment ``name`` in one statement, so concurrent bumps all count."""
+
+    if not JobWatermark.objects.filter(pk=name).update(position=F("position") + 1):
+        _, created = JobWatermark.objects.get_or_create(pk=name, defaults={"position": 1})
+        if not created:
+            JobWatermark.objects.filter(pk=name).update(position=F("position") + 1)
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplace", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outmarketplaceactivelistingfact",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name="procmarketplacestatefact",
+            name="state",
+            field=models.CharField(db_index=True, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name="outmarketplaceactivelistingfact",
+            index=models.Index(
+                fields=["-activated_at", "-id"], name="mkt_active_activated_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("marketplace", "0002_listing_api_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="procmarketplacestatefact",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="rawmarketplacelistingfact",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -18,6 +18,7 @@ class RawMarketplaceListingFact(models.Model):
     payload = models.JSONField(default=dict)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self) -> str:  # pragma: no cover - simple data repr
         return f"RawListing<{self.listing_id}>"
@@ -31,8 +32,9 @@ class ProcMarketplaceStateFact(models.Model):
         on_delete=models.CASCADE,
         related_name="processed_states",
     )
-    state = models.CharField(max_length=50)
+    state = models.CharField(max_length=50, db_index=True)
     processed_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self) -> str:  # pragma: no cover - simple data repr
         return f"State<{self.state}> for {self.raw_listing}"
@@ -48,6 +50,13 @@ class OutMarketplaceActiveListingFact(models.Model):
     )
     is_active = models.BooleanField(default=True)
     activated_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Serves the keyset pagination order of the listings API.
+            models.Index(fields=["-activated_at", "-id"], name="mkt_active_activated_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover - simple data repr
         return f"Active<{self.processed_state.raw_listing.listing_id}>"
@@ -0,0 +1,28 @@
+from rest_framework import serializers
+
+from .models import OutMarketplaceActiveListingFact
+
+
+class ActiveListingSerializer(serializers.ModelSerializer):
+    """Active listing flattened with its processed state and raw listing.
+
+    Expects a queryset with ``processed_state__raw_listing`` selected.
+    """
+
+    state = serializers.CharField(source="processed_state.state", read_only=True)
+    processed_at = serializers.DateTimeField(source="processed_state.processed_at", read_only=True)
+    listing_id = serializers.CharField(source="processed_state.raw_listing.listing_id", read_only=True)
+    payload = serializers.JSONField(source="processed_state.raw_listing.payload", read_only=True)
+
+    class Meta:
+        model = OutMarketplaceActiveListingFact
+        fields = (
+            "id",
+            "listing_id",
+            "state",
+            "is_active",
+            "activated_at",
+            "updated_at",
+            "processed_at",
+            "payload",
+        )
@@ -0,0 +1,110 @@
+from datetime import timedelta
+
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from marketplace.models import (
+    OutMarketplaceActiveListingFact,
+    ProcMarketplaceStateFact,
+    RawMarketplaceListingFact,
+)
+
+
+class ActiveListingAPITests(APITestCase):
+    """List/detail endpoints for active listings."""
+
+    def setUp(self) -> None:
+        now = timezone.now()
+        for i in range(12):
+            raw = RawMarketplaceListingFact.objects.create(listing_id=f"listing-{i}", payload={"i": i})
+            state = ProcMarketplaceStateFact.objects.create(
+                raw_listing=raw, state="published" if i % 2 else "draft"
+            )
+            active = OutMarketplaceActiveListingFact.objects.create(processed_state=state)
+            OutMarketplaceActiveListingFact.objects.filter(pk=active.pk).update(
+                activated_at=now - timedelta(hours=i)
+            )
+        self.url = reverse("active-listing-list")
+
+    def test_query_count_is_independent_of_page_size(self) -> None:
+        for page_size in (2, 12):
+            with self.assertNumQueries(2):
+                resp = self.client.get(self.url, {"page_size": page_size})
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(resp.data["results"]), page_size)
+
+    def test_cursor_pages_cover_every_listing_once(self) -> None:
+        seen = []
+        url = f"{self.url}?page_size=5"
+        while url:
+            resp = self.client.get(url)
+            seen.extend(item["listing_id"] for item in resp.data["results"])
+            url = resp.data["next"]
+        self.assertEqual(seen, [f"listing-{i}" for i in range(12)])
+
+    def test_filters(self) -> None:
+        cutoff = (timezone.now() - timedelta(hours=5, minutes=30)).isoformat()
+        resp = self.client.get(self.url, {"state": "published", "activated_after": cutoff})
+        self.assertEqual(
+            [item["listing_id"] for item in resp.data["results"]],
+            ["listing-1", "listing-3", "listing-5"],
+        )
+        resp = self.client.get(self.url, {"activated_after": "yesterday"})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_conditional_get(self) -> None:
+        resp = self.client.get(self.url)
+        etag = resp["ETag"]
+        # Deletes can move the newest updated_at backwards; only the ETag is sent.
+        self.assertNotIn("Last-Modified", resp)
+
+        with self.assertNumQueries(1):
+            resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        listing = OutMarketplaceActiveListingFact.objects.first()
+        listing.is_active = False
+        listing.save()
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_related_edits_and_deletes_change_the_list_etag(self) -> None:
+        etag = self.client.get(self.url)["ETag"]
+        raw = RawMarketplaceListingFact.objects.get(listing_id="listing-4")
+        raw.payload = {"i": 40}
+        raw.save()
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        etag = resp["ETag"]
+        state = ProcMarketplaceStateFact.objects.get(raw_listing__listing_id="listing-7")
+        state.state = "sold"
+        state.save()
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        etag = resp["ETag"]
+        OutMarketplaceActiveListingFact.objects.order_by("-updated_at").first().delete()
+        resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+    def test_detail(self) -> None:
+        listing = OutMarketplaceActiveListingFact.objects.order_by("-activated_at").first()
+        url = reverse("active-listing-detail", args=[listing.pk])
+        with self.assertNumQueries(1):
+            resp = self.client.get(url)
+        self.assertEqual(resp.data["listing_id"], "listing-0")
+        self.assertEqual(resp.data["state"], "draft")
+
+        etag = resp["ETag"]
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        state = listing.processed_state
+        state.state = "published"
+        state.save()
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data["state"], "published")
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import ActiveListingDetailView, ActiveListingListView
+
+urlpatterns = [
+    path('listings', ActiveListingListView.as_view(), name='active-listing-list'),
+    path('listings/<int:pk>', ActiveListingDetailView.as_view(), name='active-listing-detail'),
+]
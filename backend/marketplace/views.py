@@ -1,3 +1,117 @@
-from django.shortcuts import render
+"""Read API over active marketplace listings.
 
-# Create your views here.
+Every response is built from a fixed number of queries: list pages use
+keyset (cursor) pagination over ``(-activated_at, -id)`` and fetch the
+processed state and raw listing through ``select_related``, so the query
+count does not depend on the page size.  Both endpoints answer conditional
+GETs with ``304 Not Modified``.  Validators cover the serialized state and
+raw listing rows as well as the active listing, through their ``updated_at``
+columns.  The list ETag also folds in the count and id sum of the filtered
+rows, so deletes change it; list pages carry no Last-Modified, because the
+latest ``updated_at`` moves backwards when the newest row is deleted.
+"""
+
+import hashlib
+
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
+from rest_framework import generics
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+from .models import OutMarketplaceActiveListingFact
+from .serializers import ActiveListingSerializer
+
+
+class ActiveListingCursorPagination(CursorPagination):
+    ordering = ("-activated_at", "-id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+def _set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(int(last_modified.timestamp()))
+    return response
+
+
+def _conditional_response(request, etag, last_modified):
+    """Return a 304 (or 412) response if the request's validators match."""
+
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        _set_validators(response, etag, last_modified)
+    return response
+
+
+class ActiveListingMixin:
+    serializer_class = ActiveListingSerializer
+
+    def get_queryset(self):
+        return OutMarketplaceActiveListingFact.objects.select_related("processed_state__raw_listing")
+
+
+class ActiveListingListView(ActiveListingMixin, generics.ListAPIView):
+    """``GET`` active listings, filterable by state, activity and activation time.
+
+    Query parameters: ``state``, ``is_active`` (``true``/``false``),
+    ``activated_after`` and ``activated_before`` (ISO 8601 datetimes).
+    """
+
+    pagination_class = ActiveListingCursorPagination
+
+    def filter_queryset(self, queryset):
+        params = self.request.query_params
+        if params.get("state"):
+            queryset = queryset.filter(processed_state__state=params["state"])
+        if params.get("is_active") in ("true", "false"):
+            queryset = queryset.filter(is_active=params["is_active"] == "true")
+        for param, lookup in (("activated_after", "activated_at__gte"), ("activated_before", "activated_at__lt")):
+            if params.get(param):
+                value = parse_datetime(params[param])
+                if value is None:
+                    raise ValidationError({param: "Expected an ISO 8601 datetime."})
+                queryset = queryset.filter(**{lookup: value})
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        summary = queryset.order_by().aggregate(
+            rows=Count("id"),
+            id_sum=Sum("id"),
+            last_id=Max("id"),
+            listing_modified=Max("updated_at"),
+            state_modified=Max("processed_state__updated_at"),
+            raw_modified=Max("processed_state__raw_listing__updated_at"),
+        )
+        fingerprint = "|".join([request.get_full_path(), *(str(summary[key]) for key in sorted(summary))])
+        etag = quote_etag(hashlib.sha256(fingerprint.encode()).hexdigest()[:32])
+        not_modified = _conditional_response(request, etag, None)
+        if not_modified is not None:
+            return not_modified
+
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return _set_validators(response, etag, None)
+
+
+class ActiveListingDetailView(ActiveListingMixin, generics.RetrieveAPIView):
+    """``GET`` one active listing by id."""
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        state = instance.processed_state
+        stamps = [instance.updated_at, state.updated_at, state.raw_listing.updated_at]
+        etag = quote_etag("-".join([str(instance.pk), *(f"{stamp.timestamp():.6f}" for stamp in stamps)]))
+        last_modified = max(stamps)
+        not_modified = _conditional_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        response = Response(self.get_serializer(instance).data)
+        return _set_validators(response, etag, last_modified)
@@ -0,0 +1,238 @@
+"""Batched anchoring of ``OutBlockchainCommitLog`` records.
+
+Records are enqueued unanchored (``anchor_batch`` is ``NULL``, ``tx_hash``
+empty).  Rows written before batching existed carry their own ``tx_hash``
+and no batch; they are left as they are and never re-anchored.
+:class:`CommitBatcher` collects pending records until either
+``max_batch_size`` of them are waiting or the oldest has waited
+``max_wait`` seconds, builds a Merkle tree over them with
+``process_data.merkle`` and submits only the root to the chain.  Every
+record then stores the shared transaction hash, its leaf index and its
+inclusion proof, so proving a record later is a single-row read.
+
+:func:`verify_commit` checks a record offline: it recomputes the leaf from
+the record's own fields and verifies the stored proof against the batch
+root; no chain access is needed.  :class:`LocalChain` stands in for the
+chain client in development and tests -- anything with a
+``submit(root_hash) -> tx_hash`` method can be used instead, configured via
+the ``ANCHOR_CHAIN_CLASS`` setting.
+
+The root is submitted inside the transaction that records the batch: if the
+write fails the records stay pending and are anchored again, which costs an
+extra transaction but never leaves a record pointing at a missing batch.
+"""
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Protocol, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from main.caching import mark_models_stale
+from process_data.merkle import MerkleMountainRange, leaf_hash, verify_proof
+
+from .models import OutAnchorBatch, OutBlockchainCommitLog
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_MAX_WAIT = 60.0
+
+
+class Chain(Protocol):
+    def submit(self, root_hash: str) -> str:
+        ...
+
+
+class LocalChain:
+    """In-process stand-in for a chain: records roots, returns fake tx hashes."""
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.roots: List[str] = []
+        self._lock = threading.Lock()
+
+    def submit(self, root_hash: str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.roots.append(root_hash)
+            height = len(self.roots)
+        return "0x" + hashlib.sha256(f"{height}:{root_hash}".encode()).hexdigest()
+
+
+def default_chain() -> Chain:
+    chain_class = getattr(settings, "ANCHOR_CHAIN_CLASS", "output_data.anchoring.LocalChain")
+    return import_string(chain_class)()
+
+
+def commit_leaf(linked_table: str, linked_id: str, record_hash: str) -> str:
+    """Merkle leaf for one commit record."""
+
+    return leaf_hash(f"{linked_table}\x1f{linked_id}\x1f{record_hash}".encode())
+
+
+def enqueue_commits(records: Iterable[Tuple[str, Any, str]]) -> int:
+    """Queue ``(linked_table, linked_id, hash)`` records for anchoring."""
+
+    now = timezone.now()
+    rows = [
+        OutBlockchainCommitLog(
+            linked_table=linked_table,
+            linked_id=str(linked_id),
+            hash=record_hash,
+            tx_hash="",
+            commit_date=now,
+        )
+        for linked_table, linked_id, record_hash in records
+    ]
+    OutBlockchainCommitLog.objects.bulk_create(rows, batch_size=2000)
+    mark_models_stale(OutBlockchainCommitLog)
+    return len(rows)
+
+
+@dataclass
+class AnchorStats:
+    batches: int = 0
+    records: int = 0
+    elapsed: float = 0.0
+
+
+class CommitBatcher:
+    """Anchor pending commit records in size- or time-bounded batches."""
+
+    def __init__(
+        self,
+        chain: Chain,
+        max_batch_size: int = DEFAULT_BATCH_SIZE,
+        max_wait: float = DEFAULT_MAX_WAIT,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be positive")
+        self.chain = chain
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+    @staticmethod
+    def pending():
+        return OutBlockchainCommitLog.objects.filter(anchor_batch__isnull=True, tx_hash="").order_by("commit_id")
+
+    def is_due(self) -> bool:
+        """True when a full batch is waiting or the oldest record is too old."""
+
+        pending = self.pending()
+        if pending[self.max_batch_size - 1:self.max_batch_size].exists():
+            return True
+        cutoff = timezone.now() - timedelta(seconds=self.max_wait)
+        return pending.filter(commit_date__lte=cutoff).exists()
+
+    def anchor_batch(self) -> Optional[OutAnchorBatch]:
+        """Anchor up to ``max_batch_size`` pending records as one batch."""
+
+        with transaction.atomic():
+            records = list(
+                self.pending()
+                .select_for_update(skip_locked=True)
+                .values_list("commit_id", "linked_table", "linked_id", "hash")[: self.max_batch_size]
+            )
+            if not records:
+                return None
+            mmr = MerkleMountainRange.from_leaves(
+                commit_leaf(table, linked_id, record_hash)
+                for _, table, linked_id, record_hash in records
+            )
+            root = mmr.root
+            tx_hash = self.chain.submit(root)
+            anchored_at = timezone.now()
+            batch = OutAnchorBatch.objects.create(
+                root_hash=root, leaf_count=len(records), tx_hash=tx_hash, anchored_at=anchored_at
+            )
+            # Upsert on the primary key: far cheaper than bulk_update's
+            # per-row CASE expressions for large batches.
+            rows = [
+                OutBlockchainCommitLog(
+                    commit_id=commit_id,
+                    linked_table=table,
+                    linked_id=linked_id,
+                    hash=record_hash,
+                    anchor_batch=batch,
+                    leaf_index=index,
+                    proof_json=mmr.proof(index),
+                    tx_hash=tx_hash,
+                    commit_date=anchored_at,
+                )
+                for index, (commit_id, table, linked_id, record_hash) in enumerate(records)
+            ]
+            OutBlockchainCommitLog.objects.bulk_create(
+                rows,
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=["commit_id"],
+                update_fields=["anchor_batch", "leaf_index", "proof_json", "tx_hash", "commit_date"],
+            )
+            mark_models_stale(OutBlockchainCommitLog)
+        return batch
+
+    def flush(self) -> AnchorStats:
+        """Anchor every pending record, ``max_batch_size`` at a time."""
+
+        stats = AnchorStats()
+        started = time.perf_counter()
+        while True:
+            batch = self.anchor_batch()
+            if batch is None:
+                break
+            stats.batches += 1
+            stats.records += batch.leaf_count
+        stats.elapsed = time.perf_counter() - started
+        return stats
+
+    def run_once(self) -> AnchorStats:
+        """Flush if a batch is due; call this from a periodic job."""
+
+        return self.flush() if self.is_due() else AnchorStats()
+
+
+def commit_proof(linked_table: str, linked_id: Any) -> Optional[Dict[str, Any]]:
+    """Self-contained proof bundle for the latest anchored commit of a record."""
+
+    record = (
+        OutBlockchainCommitLog.objects.filter(
+            linked_table=linked_table, linked_id=str(linked_id), anchor_batch__isnull=False
+        )
+        .select_related("anchor_batch")
+        .order_by("-commit_id")
+        .first()
+    )
+    if record is None:
+        return None
+    return {
+        "linked_table": record.linked_table,
+        "linked_id": record.linked_id,
+        "hash": record.hash,
+        "leaf": commit_leaf(record.linked_table, record.linked_id, record.hash),
+        "proof": record.proof_json,
+        "root_hash": record.anchor_batch.root_hash,
+        "tx_hash": record.tx_hash,
+        "anchored_at": record.anchor_batch.anchored_at,
+    }
+
+
+def verify_bundle(bundle: Dict[str, Any]) -> bool:
+    """Verify a :func:`commit_proof` bundle without touching the database."""
+
+    leaf = commit_leaf(bundle["linked_table"], bundle["linked_id"], bundle["hash"])
+    return leaf == bundle.get("leaf") and verify_proof(leaf, bundle["proof"], bundle["root_hash"])
+
+
+def verify_commit(record: OutBlockchainCommitLog) -> bool:
+    """Check ``record`` against the root of the batch that anchored it."""
+
+    if record.anchor_batch_id is None or record.proof_json is None:
+        return False
+    leaf = commit_leaf(record.linked_table, record.linked_id, record.hash)
+    return verify_proof(leaf, record.proof_json, record.anchor_batch.root_hash)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class OutputDataConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "output_data"
+
+    def ready(self):
+        from . import signals  # noqa: F401
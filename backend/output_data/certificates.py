@@ -0,0 +1,207 @@
+"""Parallel, resumable issuance of ``OutCertificateIssueLogFact`` rows.
+
+A run issues one certificate of a given ``cert_type`` per batch.  Batch
+payloads (material, normalized inventory, emissions and trace root) are
+gathered with a few bulk queries, their ``zk_hash`` values are computed in a
+process pool by :func:`output_data.proofs.compute_zk_hash`, and the results
+are written chunk by chunk as they complete.  Only a few chunks are built
+ahead of the pool, so payloads are not all held in memory before hashing
+starts.
+
+``(batch_id, cert_type)`` is unique, and batches that already hold a
+certificate of the type are skipped when the run is planned, so a run that
+was interrupted can simply be started again: it resumes with the batches
+that are still missing and never duplicates a certificate.
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from django.db import transaction
+from django.db.models import Min, Sum
+
+from main.caching import mark_models_stale
+from process_data.models import ProcEmissionsCalcFact, ProcInventoryFact, ProcTraceMerkleState
+
+from .models import OutCertificateIssueLogFact
+from .proofs import ZK_ITERATIONS, hash_jobs
+from .rollups import refresh_batch_summaries
+
+DEFAULT_CHUNK_SIZE = 200
+
+Job = Tuple[str, Dict[str, Any]]
+
+
+@dataclass
+class IssuanceStats:
+    """Progress and throughput counters of one issuance run."""
+
+    planned: int = 0
+    skipped: int = 0
+    issued: int = 0
+    # Planned certificates a concurrent run issued first.
+    raced: int = 0
+    chunks: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def remaining(self) -> int:
+        return self.planned - self.issued - self.raced
+
+    @property
+    def certificates_per_sec(self) -> float:
+        return self.issued / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "planned": self.planned,
+            "skipped": self.skipped,
+            "issued": self.issued,
+            "raced": self.raced,
+            "remaining": self.remaining,
+            "chunks": self.chunks,
+            "elapsed": round(self.elapsed, 3),
+            "certificates_per_sec": round(self.certificates_per_sec, 1),
+        }
+
+
+def pending_batches(cert_type: str, batch_ids: Optional[Iterable[str]] = None) -> Tuple[List[str], int]:
+    """Batches with inventory but no ``cert_type`` certificate, and the skip count."""
+
+    inventory = ProcInventoryFact.objects.all()
+    if batch_ids is not None:
+        inventory = inventory.filter(batch_id__in=list(batch_ids))
+    candidates = set(inventory.values_list("batch_id", flat=True).distinct())
+    issued = set(
+        OutCertificateIssueLogFact.objects.filter(cert_type=cert_type, batch_id__in=candidates)
+        .values_list("batch_id", flat=True)
+    )
+    return sorted(candidates - issued), len(issued)
+
+
+def build_jobs(cert_type: str, batch_ids: Sequence[str]) -> List[Job]:
+    """Collect the payload hashed for each batch, with one query per source."""
+
+    inventory = {
+        row["batch_id"]: row
+        for row in ProcInventoryFact.objects.filter(batch_id__in=batch_ids)
+        .values("batch_id")
+        .order_by()
+        .annotate(material_id=Min("material_id"), kg=Sum("normalized_quantity_kg"))
+    }
+    emissions = dict(
+        ProcEmissionsCalcFact.objects.filter(batch_id__in=batch_ids)
+        .values("batch_id")
+        .order_by()
+        .annotate(total=Sum("emissions_kgco2"))
+        .values_list("batch_id", "total")
+    )
+    roots = dict(
+        ProcTraceMerkleState.objects.filter(batch_id__in=batch_ids).values_list("batch_id", "root_hash")
+    )
+    jobs = []
+    for batch_id in batch_ids:
+        row = inventory[batch_id]
+        jobs.append(
+            (
+                batch_id,
+                {
+                    "batch_id": batch_id,
+                    "cert_type": cert_type,
+                    "material_id": row["material_id"],
+                    "inventory_kg": row["kg"],
+                    "emissions_kgco2": emissions.get(batch_id),
+                    "trace_root": roots.get(batch_id),
+                },
+            )
+        )
+    return jobs
+
+
+def _chunks(items: Sequence, size: int) -> Iterator[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def issue_certificates(
+    cert_type: str,
+    verifier_id: str,
+    batch_ids: Optional[Iterable[str]] = None,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    issue_date: Optional[date] = None,
+    iterations: int = ZK_ITERATIONS,
+    progress: Optional[Callable[[IssuanceStats], None]] = None,
+) -> IssuanceStats:
+    """Issue missing ``cert_type`` certificates, hashing in a process pool.
+
+    ``workers=0`` hashes in the calling process.  ``progress`` is called
+    with the running stats after every chunk is written.
+    """
+
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+    stats = IssuanceStats()
+    started = time.perf_counter()
+    pending, stats.skipped = pending_batches(cert_type, batch_ids)
+    stats.planned = len(pending)
+    issue_date = issue_date or date.today()
+
+    def write(chunk_jobs: Sequence[Job], hashes: List[Tuple[str, str]]) -> None:
+        materials = {batch_id: payload["material_id"] for batch_id, payload in chunk_jobs}
+        rows = [
+            OutCertificateIssueLogFact(
+                batch_id=batch_id,
+                material_id=materials[batch_id],
+                cert_type=cert_type,
+                issue_date=issue_date,
+                verifier_id=verifier_id,
+                zk_hash=zk_hash,
+            )
+            for batch_id, zk_hash in hashes
+        ]
+        with transaction.atomic():
+            # A concurrent run may have issued some of these meanwhile; only
+            # rows actually written count as issued.
+            taken = set(
+                OutCertificateIssueLogFact.objects.filter(cert_type=cert_type, batch_id__in=materials)
+                .values_list("batch_id", flat=True)
+            )
+            rows = [row for row in rows if row.batch_id not in taken]
+            OutCertificateIssueLogFact.objects.bulk_create(rows, ignore_conflicts=True)
+            mark_models_stale(OutCertificateIssueLogFact)
+            refresh_batch_summaries(materials)
+        stats.issued += len(rows)
+        stats.raced += len(hashes) - len(rows)
+        stats.chunks += 1
+        stats.elapsed = time.perf_counter() - started
+        if progress is not None:
+            progress(stats)
+
+    chunks = (build_jobs(cert_type, batch_chunk) for batch_chunk in _chunks(pending, chunk_size))
+    if workers == 0:
+        for chunk_jobs in chunks:
+            write(chunk_jobs, hash_jobs(chunk_jobs, iterations))
+    else:
+        # Executor.map would submit, and so build, every chunk up front; keep
+        # two chunks per worker in flight instead.
+        ahead = 2 * (workers or os.cpu_count() or 1)
+        in_flight: deque = deque()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Results are written in order while the pool hashes the next chunks.
+            for chunk_jobs in chunks:
+                in_flight.append((chunk_jobs, executor.submit(hash_jobs, chunk_jobs, iterations)))
+                if len(in_flight) >= ahead:
+                    done_jobs, future = in_flight.popleft()
+                    write(done_jobs, future.result())
+            while in_flight:
+                done_jobs, future = in_flight.popleft()
+                write(done_jobs, future.result())
+
+    stats.elapsed = time.perf_counter() - started
+    return stats
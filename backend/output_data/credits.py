@@ -0,0 +1,253 @@
+"""Credit grants derived from calculated emissions.
+
+``OutCreditGrantLogFact`` rows are aggregated from ``ProcEmissionsCalcFact``
+per ``(batch_id, methodology_ref, window)``.  Windows are ``window_days``
+long and aligned to 1970-01-01, so every row falls into exactly one window
+regardless of when the job runs.  A batch's methodology is the
+``methodology_ref`` of its latest ``ProcProofOfGoodFact``; a grant is linked to
+the batch's latest certificate.  Windows of batches without either are
+counted as skipped; run with ``full=True`` once they have been added.
+
+The job is incremental.  ``main.JobWatermark`` remembers the highest
+``calc_id`` consumed; a run reads only newer emission rows, works out which
+``(batch, window)`` pairs they touch and recomputes just those pairs in one
+vectorized pass over their rows before upserting the grants.  A recomputed
+pair replaces every grant of its batch and window: if the batch's latest
+methodology changed, the grant under the old one is removed rather than
+left next to the new one.
+
+``window_days`` should stay fixed for a deployment: grants are keyed by
+window start, so changing it leaves the old windows' grants in place.
+Pricing is per methodology via the ``CREDIT_PRICE_PER_TONNE`` setting, a
+mapping of ``methodology_ref`` to a price with an optional ``"default"``.
+"""
+
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from typing import Dict, List, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from main.caching import mark_models_stale
+from main.watermarks import get_watermark, set_watermark
+from process_data.models import ProcEmissionsCalcFact, ProcProofOfGoodFact
+
+from .models import OutCertificateIssueLogFact, OutCreditGrantLogFact
+from .rollups import refresh_batch_summaries
+
+WATERMARK = "output_data.credit_grants"
+DEFAULT_WINDOW_DAYS = 30
+DEFAULT_PRICE_PER_TONNE = 0.0
+EPOCH = date(1970, 1, 1)
+_EPOCH_ORDINAL = EPOCH.toordinal()
+
+
+@dataclass
+class CreditRunStats:
+    new_rows: int = 0
+    windows: int = 0
+    granted: int = 0
+    skipped_no_methodology: int = 0
+    skipped_no_certificate: int = 0
+    replaced: int = 0
+    watermark: int = 0
+    elapsed: float = 0.0
+
+
+def window_index(day_ordinals: np.ndarray, window_days: int) -> np.ndarray:
+    return (day_ordinals - _EPOCH_ORDINAL) // window_days
+
+
+def _midnight(day: date) -> datetime:
+    return datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+
+
+def window_bounds(index: int, window_days: int) -> Tuple[date, date]:
+    """``[start, end)`` of window ``index``."""
+
+    start = EPOCH + timedelta(days=index * window_days)
+    return start, start + timedelta(days=window_days)
+
+
+def price_per_tonne(methodology_ref: str) -> float:
+    prices = getattr(settings, "CREDIT_PRICE_PER_TONNE", {})
+    return float(prices.get(methodology_ref, prices.get("default", DEFAULT_PRICE_PER_TONNE)))
+
+
+def _latest_by_batch(queryset, value_field: str, order_field: str, batch_ids) -> Dict[str, object]:
+    latest: Dict[str, object] = {}
+    rows = queryset.filter(batch_id__in=batch_ids).order_by("batch_id", order_field).values_list(
+        "batch_id", value_field
+    )
+    for batch_id, value in rows:
+        latest[batch_id] = value
+    return latest
+
+
+def _day_ordinals(timestamps: List[datetime]) -> np.ndarray:
+    return np.fromiter(
+        (ts.astimezone(dt_timezone.utc).date().toordinal() for ts in timestamps),
+        dtype=np.int64,
+        count=len(timestamps),
+    )
+
+
+def aggregate_windows(
+    batch_codes: np.ndarray,
+    windows: np.ndarray,
+    emissions_kg: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sum ``emissions_kg`` per ``(batch_code, window)`` pair.
+
+    Returns the unique batch codes, windows and summed kilograms.
+    """
+
+    keys = np.stack([batch_codes, windows], axis=1)
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    totals = np.bincount(inverse.ravel(), weights=emissions_kg, minlength=len(unique))
+    return unique[:, 0], unique[:, 1], totals
+
+
+def grant_credits(window_days: int = DEFAULT_WINDOW_DAYS, full: bool = False) -> CreditRunStats:
+    """Derive credit grants for windows touched since the last run.
+
+    ``full=True`` ignores the watermark and recomputes every window.
+    """
+
+    if window_days < 1:
+        raise ValueError("window_days must be positive")
+    stats = CreditRunStats()
+    started = time.perf_counter()
+
+    with transaction.atomic():
+        since = 0 if full else get_watermark(WATERMARK, lock=True)
+        new_rows = list(
+            ProcEmissionsCalcFact.objects.filter(calc_id__gt=since).values_list(
+                "calc_id", "batch_id", "timestamp"
+            )
+        )
+        stats.new_rows = len(new_rows)
+        stats.watermark = max((row[0] for row in new_rows), default=since)
+        if not new_rows:
+            set_watermark(WATERMARK, stats.watermark)
+            stats.elapsed = time.perf_counter() - started
+            return stats
+
+        # Which (batch, window) pairs did the new rows touch?
+        touched: Dict[str, set] = {}
+        new_windows = window_index(_day_ordinals([row[2] for row in new_rows]), window_days)
+        for (_, batch_id, _), window in zip(new_rows, new_windows.tolist()):
+            touched.setdefault(batch_id, set()).add(window)
+
+        batch_ids = sorted(touched)
+        first = min(min(windows) for windows in touched.values())
+        last = max(max(windows) for windows in touched.values())
+        range_start, _ = window_bounds(first, window_days)
+        _, range_end = window_bounds(last, window_days)
+        rows = list(
+            ProcEmissionsCalcFact.objects.filter(
+                batch_id__in=batch_ids,
+                timestamp__gte=_midnight(range_start),
+                timestamp__lt=_midnight(range_end),
+            ).values_list("batch_id", "timestamp", "emissions_kgco2")
+        )
+
+        codes = {batch_id: code for code, batch_id in enumerate(batch_ids)}
+        batch_codes = np.fromiter((codes[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+        windows = window_index(_day_ordinals([row[1] for row in rows]), window_days)
+        kg = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+        pair_batches, pair_windows, pair_kg = aggregate_windows(batch_codes, windows, kg)
+
+        # The range query also returns untouched windows of the same batches.
+        keep = np.fromiter(
+            (w in touched[batch_ids[b]] for b, w in zip(pair_batches.tolist(), pair_windows.tolist())),
+            dtype=bool,
+            count=len(pair_kg),
+        )
+        pair_batches, pair_windows, pair_kg = pair_batches[keep], pair_windows[keep], pair_kg[keep]
+        stats.windows = len(pair_kg)
+
+        methodologies = _latest_by_batch(
+            ProcProofOfGoodFact.objects, "methodology_ref", "timestamp", batch_ids
+        )
+        certificates = _latest_by_batch(
+            OutCertificateIssueLogFact.objects, "cert_id", "issue_date", batch_ids
+        )
+
+        today = date.today()
+        grants = []
+        recomputed: Dict[str, List[date]] = {}
+        pairs = zip(pair_batches.tolist(), pair_windows.tolist(), pair_kg.tolist())
+        for code, window, total_kg in pairs:
+            batch_id = batch_ids[code]
+            recomputed.setdefault(batch_id, []).append(window_bounds(window, window_days)[0])
+            methodology = methodologies.get(batch_id)
+            if not methodology:
+                stats.skipped_no_methodology += 1
+                continue
+            certificate_id = certificates.get(batch_id)
+            if certificate_id is None:
+                stats.skipped_no_certificate += 1
+                continue
+            start, end = window_bounds(window, window_days)
+            tonnes = total_kg / 1000.0
+            grants.append(
+                OutCreditGrantLogFact(
+                    batch_id=batch_id,
+                    carbon_tonnes=tonnes,
+                    certificate_id=certificate_id,
+                    price=tonnes * price_per_tonne(methodology),
+                    methodology_ref=methodology,
+                    grant_date=today,
+                    window_start=start,
+                    window_end=end,
+                )
+            )
+
+        # Grants of recomputed windows that this run does not rewrite, such
+        # as those under a batch's previous methodology, are stale.
+        stale = Q(pk__in=[])
+        for batch_id, starts in recomputed.items():
+            pair = Q(batch_id=batch_id, window_start__in=starts)
+            if methodologies.get(batch_id) and certificates.get(batch_id) is not None:
+                pair &= ~Q(methodology_ref=methodologies[batch_id])
+            stale |= pair
+        stats.replaced, _ = OutCreditGrantLogFact.objects.filter(stale).delete()
+        OutCreditGrantLogFact.objects.bulk_create(
+            grants,
+            update_conflicts=True,
+            unique_fields=["batch_id", "methodology_ref", "window_start"],
+            update_fields=["carbon_tonnes", "certificate", "price", "grant_date", "window_end"],
+        )
+        mark_models_stale(OutCreditGrantLogFact)
+        refresh_batch_summaries(batch_ids)
+        set_watermark(WATERMARK, stats.watermark)
+        stats.granted = len(grants)
+
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def drop_emptied_grants(batch_ids) -> int:
+    """Delete grants of ``batch_ids`` whose window has no emissions left.
+
+    Incremental runs only revisit windows that gained emission rows, so a
+    window whose inventory was removed entirely is cleaned up here.
+    """
+
+    remaining = ProcEmissionsCalcFact.objects.filter(
+        batch_id=OuterRef("batch_id"),
+        timestamp__date__gte=OuterRef("window_start"),
+        timestamp__date__lt=OuterRef("window_end"),
+    )
+    with transaction.atomic():
+        deleted, _ = (
+            OutCreditGrantLogFact.objects.filter(batch_id__in=list(batch_ids)).exclude(Exists(remaining)).delete()
+        )
+        if deleted:
+            mark_models_stale(OutCreditGrantLogFact)
+    return deleted
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from output_data.anchoring import DEFAULT_BATCH_SIZE, DEFAULT_MAX_WAIT, CommitBatcher, default_chain
+
+
+class Command(BaseCommand):
+    help = "Anchor pending OutBlockchainCommitLog records in Merkle batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            "--max-wait",
+            type=float,
+            default=DEFAULT_MAX_WAIT,
+            help="Anchor a partial batch once its oldest record is this many seconds old.",
+        )
+        parser.add_argument("--force", action="store_true", help="Anchor everything pending now.")
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        batcher = CommitBatcher(default_chain(), options["batch_size"], options["max_wait"])
+        stats = batcher.flush() if options["force"] else batcher.run_once()
+        self.stdout.write(
+            f"Anchored {stats.records} records in {stats.batches} batches ({stats.elapsed:.2f}s)"
+        )
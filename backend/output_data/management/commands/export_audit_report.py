@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from output_data.models import OutAuditReportDim
+from output_data.reports import DEFAULT_CHUNK_SIZE, FORMATS, write_report
+
+
+class Command(BaseCommand):
+    help = "Stream an audit report's certificates, credits and trace figures to a file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("report_id", type=int)
+        parser.add_argument("path", help="Output file; a .gz suffix compresses it.")
+        parser.add_argument("--output", choices=FORMATS, default="csv")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        report = OutAuditReportDim.objects.filter(pk=options["report_id"]).first()
+        if report is None:
+            raise CommandError(f"Audit report {options['report_id']} does not exist")
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+        written = write_report(report, options["path"], options["output"], chunk_size=options["chunk_size"])
+        self.stdout.write(f"Wrote {written} bytes to {options['path']}")
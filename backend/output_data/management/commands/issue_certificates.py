@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from output_data.certificates import DEFAULT_CHUNK_SIZE, issue_certificates
+
+
+class Command(BaseCommand):
+    help = "Issue missing certificates of a type, hashing proofs in a process pool. Safe to re-run."
+
+    def add_arguments(self, parser):
+        parser.add_argument("cert_type")
+        parser.add_argument("--verifier", required=True, help="verifier_id recorded on each certificate.")
+        parser.add_argument("--batch", action="append", dest="batches", help="Limit to a batch id; may be repeated.")
+        parser.add_argument("--workers", type=int, help="Pool size; 0 hashes in this process.")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if options["chunk_size"] < 1:
+            raise CommandError("--chunk-size must be positive")
+
+        def report(stats):
+            self.stdout.write(json.dumps(stats.as_dict()))
+
+        stats = issue_certificates(
+            options["cert_type"],
+            options["verifier"],
+            batch_ids=options["batches"],
+            workers=options["workers"],
+            chunk_size=options["chunk_size"],
+            progress=report if options["verbosity"] > 1 else None,
+        )
+        self.stdout.write(
+            f"Issued {stats.issued} of {stats.planned} certificates ({stats.skipped} already issued, "
+            f"{stats.raced} issued by a concurrent run) "
+            f"in {stats.elapsed:.2f}s, {stats.certificates_per_sec:.1f}/sec"
+        )
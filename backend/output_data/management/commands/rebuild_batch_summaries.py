@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from output_data.rollups import rebuild_batch_summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute OutBatchSummaryFact for every batch from the source facts."
+
+    def handle(self, *args, **options):
+        written = rebuild_batch_summaries()
+        self.stdout.write(f"Wrote {written} batch summaries")
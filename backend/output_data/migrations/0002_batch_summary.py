@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("output_data", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutBatchSummaryFact",
+            fields=[
+                (
+                    "batch_id",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("inventory_records", models.PositiveIntegerField(default=0)),
+                ("inventory_kg", models.FloatField(default=0)),
+                ("emissions_records", models.PositiveIntegerField(default=0)),
+                ("emissions_kgco2", models.FloatField(default=0)),
+                ("certificate_count", models.PositiveIntegerField(default=0)),
+                ("latest_certificate_date", models.DateField(blank=True, null=True)),
+                ("credit_count", models.PositiveIntegerField(default=0)),
+                ("carbon_tonnes", models.FloatField(default=0)),
+                ("credit_value", models.FloatField(default=0)),
+                ("trace_count", models.PositiveIntegerField(default=0)),
+                ("latest_trace_stage", models.CharField(blank=True, max_length=100)),
+                ("last_activity", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="outcertificateissuelogfact",
+            name="batch_id",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="outcreditgrantlogfact",
+            name="batch_id",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="outinventorytracefact",
+            name="batch_id",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("output_data", "0002_batch_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutAnchorBatch",
+            fields=[
+                ("anchor_id", models.AutoField(primary_key=True, serialize=False)),
+                ("root_hash", models.CharField(max_length=64)),
+                ("leaf_count", models.PositiveIntegerField()),
+                ("tx_hash", models.CharField(max_length=255)),
+                ("anchored_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name="outblockchaincommitlog",
+            name="leaf_index",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="outblockchaincommitlog",
+            name="proof_json",
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="outblockchaincommitlog",
+            name="anchor_batch",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                to="output_data.outanchorbatch",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="outblockchaincommitlog",
+            index=models.Index(
+                fields=["linked_table", "linked_id"], name="out_commit_linked_idx"
+            ),
+        ),
+    ]
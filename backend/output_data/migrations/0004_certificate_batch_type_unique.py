@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:31
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_certificates(apps, schema_editor):
+    """Keep the oldest certificate per ``(batch_id, cert_type)``.
+
+    Credits granted against a dropped duplicate move to the kept one rather
+    than being deleted with it.
+    """
+
+    Certificate = apps.get_model("output_data", "OutCertificateIssueLogFact")
+    Credit = apps.get_model("output_data", "OutCreditGrantLogFact")
+    duplicated = (
+        Certificate.objects.values("batch_id", "cert_type")
+        .order_by()
+        .annotate(copies=Count("cert_id"), keep=Min("cert_id"))
+        .filter(copies__gt=1)
+    )
+    for group in list(duplicated):
+        extra = Certificate.objects.filter(batch_id=group["batch_id"], cert_type=group["cert_type"]).exclude(
+            cert_id=group["keep"]
+        )
+        Credit.objects.filter(certificate__in=extra).update(certificate_id=group["keep"])
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("output_data", "0003_commit_anchoring"),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_certificates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="outcertificateissuelogfact",
+            constraint=models.UniqueConstraint(
+                fields=("batch_id", "cert_type"), name="out_cert_batch_type_uniq"
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("output_data", "0004_certificate_batch_type_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outcreditgrantlogfact",
+            name="window_end",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="outcreditgrantlogfact",
+            name="window_start",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="outcreditgrantlogfact",
+            constraint=models.UniqueConstraint(
+                fields=("batch_id", "methodology_ref", "window_start"),
+                name="out_credit_window_uniq",
+            ),
+        ),
+    ]
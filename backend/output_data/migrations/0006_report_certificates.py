@@ -0,0 +1,87 @@
+import logging
+
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+
+def json_to_m2m(apps, schema_editor):
+    """Link reports to their certificates.
+
+    Ids that do not name an existing certificate cannot be linked; they are
+    kept in ``unresolved_cert_ids`` instead of being dropped.
+    """
+
+    OutAuditReportDim = apps.get_model("output_data", "OutAuditReportDim")
+    OutCertificateIssueLogFact = apps.get_model("output_data", "OutCertificateIssueLogFact")
+    Link = OutAuditReportDim.certificates.through
+    existing = set(OutCertificateIssueLogFact.objects.values_list("cert_id", flat=True))
+    links = []
+    unresolved = []
+    for report_id, cert_ids in OutAuditReportDim.objects.values_list("report_id", "linked_cert_ids"):
+        missing = []
+        for raw_id in cert_ids or []:
+            try:
+                cert_id = int(raw_id)
+            except (TypeError, ValueError):
+                cert_id = None
+            if cert_id in existing:
+                links.append(Link(outauditreportdim_id=report_id, outcertificateissuelogfact_id=cert_id))
+            else:
+                missing.append(raw_id)
+        if missing:
+            unresolved.append(OutAuditReportDim(report_id=report_id, unresolved_cert_ids=missing))
+    Link.objects.bulk_create(links, batch_size=5000, ignore_conflicts=True)
+    OutAuditReportDim.objects.bulk_update(unresolved, ["unresolved_cert_ids"], batch_size=2000)
+    if unresolved:
+        logger.warning(
+            "%d audit reports reference %d certificate ids that do not exist; kept in unresolved_cert_ids",
+            len(unresolved),
+            sum(len(report.unresolved_cert_ids) for report in unresolved),
+        )
+
+
+def m2m_to_json(apps, schema_editor):
+    OutAuditReportDim = apps.get_model("output_data", "OutAuditReportDim")
+    Link = OutAuditReportDim.certificates.through
+    cert_ids = {}
+    for report_id, cert_id in Link.objects.order_by("outcertificateissuelogfact_id").values_list(
+        "outauditreportdim_id", "outcertificateissuelogfact_id"
+    ):
+        cert_ids.setdefault(report_id, []).append(cert_id)
+    reports = list(OutAuditReportDim.objects.only("report_id", "unresolved_cert_ids"))
+    for report in reports:
+        report.linked_cert_ids = cert_ids.get(report.report_id, []) + list(report.unresolved_cert_ids or [])
+    OutAuditReportDim.objects.bulk_update(reports, ["linked_cert_ids"], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("output_data", "0005_credit_windows"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outauditreportdim",
+            name="certificates",
+            field=models.ManyToManyField(
+                blank=True, related_name="audit_reports", to="output_data.outcertificateissuelogfact"
+            ),
+        ),
+        migrations.AddField(
+            model_name="outauditreportdim",
+            name="unresolved_cert_ids",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name="outauditreportdim",
+            name="linked_cert_ids",
+            field=models.JSONField(null=True),
+        ),
+        migrations.RunPython(json_to_m2m, m2m_to_json),
+        migrations.RemoveField(
+            model_name="outauditreportdim",
+            name="linked_cert_ids",
+        ),
+    ]
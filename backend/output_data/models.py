@@ -3,7 +3,7 @@ from django.db import models
 
 class OutInventoryTraceFact(models.Model):
     trace_id = models.AutoField(primary_key=True)
-    batch_id = models.CharField(max_length=255)
+    batch_id = models.CharField(max_length=255, db_index=True)
     facility = models.ForeignKey('raw_data.RawFacilityDim', on_delete=models.CASCADE)
     material = models.ForeignKey('raw_data.RawMaterialDim', on_delete=models.CASCADE)
     path_hash = models.CharField(max_length=255)
@@ -13,6 +13,16 @@ class OutInventoryTraceFact(models.Model):
     stage = models.CharField(max_length=100)
 
 
+class OutAnchorBatch(models.Model):
+    """One chain transaction anchoring the Merkle root of many commit records."""
+
+    anchor_id = models.AutoField(primary_key=True)
+    root_hash = models.CharField(max_length=64)
+    leaf_count = models.PositiveIntegerField()
+    tx_hash = models.CharField(max_length=255)
+    anchored_at = models.DateTimeField()
+
+
 class OutBlockchainCommitLog(models.Model):
     commit_id = models.AutoField(primary_key=True)
     linked_table = models.CharField(max_length=255)
@@ -20,26 +30,50 @@ class OutBlockchainCommitLog(models.Model):
     hash = models.CharField(max_length=255)
     tx_hash = models.CharField(max_length=255)
     commit_date = models.DateTimeField()
+    # Set when the record is anchored; see output_data.anchoring.
+    anchor_batch = models.ForeignKey(OutAnchorBatch, on_delete=models.PROTECT, null=True, blank=True)
+    leaf_index = models.PositiveIntegerField(null=True, blank=True)
+    proof_json = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["linked_table", "linked_id"], name="out_commit_linked_idx"),
+        ]
 
 
 class OutCertificateIssueLogFact(models.Model):
     cert_id = models.AutoField(primary_key=True)
-    batch_id = models.CharField(max_length=255)
+    batch_id = models.CharField(max_length=255, db_index=True)
     material = models.ForeignKey('raw_data.RawMaterialDim', on_delete=models.CASCADE)
     cert_type = models.CharField(max_length=100)
     issue_date = models.DateField()
     verifier_id = models.CharField(max_length=255)
     zk_hash = models.CharField(max_length=255)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["batch_id", "cert_type"], name="out_cert_batch_type_uniq"),
+        ]
+
 
 class OutCreditGrantLogFact(models.Model):
     credit_id = models.AutoField(primary_key=True)
-    batch_id = models.CharField(max_length=255)
+    batch_id = models.CharField(max_length=255, db_index=True)
     carbon_tonnes = models.FloatField()
     certificate = models.ForeignKey(OutCertificateIssueLogFact, on_delete=models.CASCADE)
     price = models.FloatField()
     methodology_ref = models.CharField(max_length=255)
     grant_date = models.DateField()
+    # Emissions window a derived grant covers; NULL for grants entered by hand.
+    window_start = models.DateField(null=True, blank=True)
+    window_end = models.DateField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["batch_id", "methodology_ref", "window_start"], name="out_credit_window_uniq"
+            ),
+        ]
 
 
 class OutMarketplaceActiveListingFact(models.Model):
@@ -54,6 +88,28 @@ class OutAuditReportDim(models.Model):
     report_id = models.AutoField(primary_key=True)
     report_type = models.CharField(max_length=100)
     generation_date = models.DateField()
-    linked_cert_ids = models.JSONField()
+    certificates = models.ManyToManyField(OutCertificateIssueLogFact, related_name="audit_reports", blank=True)
+    # Legacy certificate ids that named no certificate when ``certificates``
+    # replaced the JSON list; kept for review rather than dropped.
+    unresolved_cert_ids = models.JSONField(default=list, blank=True)
     reviewer_id = models.CharField(max_length=255)
 
+
+class OutBatchSummaryFact(models.Model):
+    """Materialized per-batch rollup of inventory, emissions, certificates,
+    credits and trace facts, maintained by ``output_data.rollups``."""
+
+    batch_id = models.CharField(max_length=255, primary_key=True)
+    inventory_records = models.PositiveIntegerField(default=0)
+    inventory_kg = models.FloatField(default=0)
+    emissions_records = models.PositiveIntegerField(default=0)
+    emissions_kgco2 = models.FloatField(default=0)
+    certificate_count = models.PositiveIntegerField(default=0)
+    latest_certificate_date = models.DateField(null=True, blank=True)
+    credit_count = models.PositiveIntegerField(default=0)
+    carbon_tonnes = models.FloatField(default=0)
+    credit_value = models.FloatField(default=0)
+    trace_count = models.PositiveIntegerField(default=0)
+    latest_trace_stage = models.CharField(max_length=100, blank=True)
+    last_activity = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
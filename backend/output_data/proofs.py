@@ -0,0 +1,37 @@
+"""CPU-bound certificate proof hashing.
+
+Kept free of Django imports so process-pool workers can import it under any
+start method without configuring settings.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+
+ZK_ITERATIONS = 20000
+
+
+def canonical_payload(payload: Dict[str, Any]) -> bytes:
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()
+
+
+def compute_zk_hash(job: Tuple[str, Dict[str, Any]], iterations: int = ZK_ITERATIONS) -> Tuple[str, str]:
+    """Return ``(batch_id, zk_hash)`` for one ``(batch_id, payload)`` job.
+
+    The hash is a key-stretched digest of the canonical payload, salted with
+    the certificate type, so it is deterministic and deliberately costly.
+    """
+
+    batch_id, payload = job
+    salt = f"lumen-cert:{payload.get('cert_type', '')}".encode()
+    digest = hashlib.pbkdf2_hmac("sha256", canonical_payload(payload), salt, iterations)
+    return batch_id, digest.hex()
+
+
+def hash_jobs(
+    jobs: Sequence[Tuple[str, Dict[str, Any]]],
+    iterations: int = ZK_ITERATIONS,
+) -> List[Tuple[str, str]]:
+    """:func:`compute_zk_hash` over a chunk of jobs; one pool task per chunk."""
+
+    return [compute_zk_hash(job, iterations) for job in jobs]
@@ -0,0 +1,144 @@
+"""Streaming export of audit reports.
+
+An audit report covers the certificates linked to it through
+``OutAuditReportDim.certificates``.  Each output row is one certificate
+joined in SQL with its material, its credit totals and the trace figures of
+its batch summary.  Rows are read with ``iterator(chunk_size=...)`` and
+encoded line by line as CSV or NDJSON, optionally gzip-compressed, so memory
+use depends on the chunk size rather than on the size of the report.
+"""
+
+import csv
+import io
+import json
+import zlib
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional, Union
+
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import OutAuditReportDim, OutBatchSummaryFact, OutCertificateIssueLogFact
+
+DEFAULT_CHUNK_SIZE = 2000
+FORMATS = ("csv", "ndjson")
+
+COLUMNS = [
+    "report_id",
+    "cert_id",
+    "batch_id",
+    "cert_type",
+    "issue_date",
+    "verifier_id",
+    "zk_hash",
+    "material_type",
+    "credit_count",
+    "carbon_tonnes",
+    "credit_value",
+    "trace_count",
+    "latest_trace_stage",
+]
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def report_rows_queryset(report: Union[OutAuditReportDim, int]):
+    """Certificates of ``report`` with credit and trace columns joined in SQL."""
+
+    report_id = report.pk if isinstance(report, OutAuditReportDim) else report
+    summary = OutBatchSummaryFact.objects.filter(batch_id=OuterRef("batch_id"))
+    return (
+        OutCertificateIssueLogFact.objects.filter(audit_reports=report_id)
+        .annotate(
+            report_id=Value(report_id),
+            material_type=Coalesce("material__type", Value("")),
+            credit_count=Count("outcreditgrantlogfact"),
+            carbon_tonnes=Coalesce(Sum("outcreditgrantlogfact__carbon_tonnes"), Value(0.0), output_field=FloatField()),
+            credit_value=Coalesce(Sum("outcreditgrantlogfact__price"), Value(0.0), output_field=FloatField()),
+            trace_count=Coalesce(Subquery(summary.values("trace_count")[:1]), Value(0)),
+            latest_trace_stage=Coalesce(Subquery(summary.values("latest_trace_stage")[:1]), Value("")),
+        )
+        .order_by("cert_id")
+        .values_list(*COLUMNS)
+    )
+
+
+def iter_report_rows(report, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+    for values in report_rows_queryset(report).iterator(chunk_size=chunk_size):
+        yield dict(zip(COLUMNS, values))
+
+
+def iter_csv(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS, lineterminator="\n")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row, default=str, separators=(",", ":")) + "\n"
+
+
+def _encode(report, fmt: str, chunk_size: int) -> Iterator[bytes]:
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported report format: {fmt!r}")
+    encode = iter_csv if fmt == "csv" else iter_ndjson
+    return (line.encode() for line in encode(iter_report_rows(report, chunk_size)))
+
+
+def _gzip_stream(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    # wbits=31 wraps the deflate stream in a gzip header and trailer.
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_report(
+    report,
+    fmt: str = "csv",
+    compress: bool = False,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Yield the encoded report as byte chunks, gzip-compressed if asked."""
+
+    lines = _encode(report, fmt, chunk_size)
+    return _gzip_stream(lines) if compress else lines
+
+
+def write_report(
+    report,
+    path_or_stream: Union[str, BinaryIO],
+    fmt: str = "csv",
+    compress: Optional[bool] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """Write the report to a file path or binary stream; returns bytes written.
+
+    ``compress`` defaults to whether a path ends in ``.gz``.
+    """
+
+    if compress is None:
+        compress = isinstance(path_or_stream, str) and path_or_stream.endswith(".gz")
+    chunks = iter_report(report, fmt, compress, chunk_size)
+    written = 0
+    handle = open(path_or_stream, "wb") if isinstance(path_or_stream, str) else path_or_stream
+    try:
+        for chunk in chunks:
+            handle.write(chunk)
+            written += len(chunk)
+    finally:
+        if handle is not path_or_stream:
+            handle.close()
+    return written
@@ -0,0 +1,234 @@
+"""Per-batch rollup of process and output facts.
+
+``OutBatchSummaryFact`` holds one row per ``batch_id`` with the totals a batch
+dossier needs: inventory, emissions, certificates, credits and trace facts.
+Rows are recomputed from the source tables with one grouped aggregate per
+table for a whole set of batches, so a refresh costs the same handful of
+queries whether it covers one batch or a thousand.
+
+Single-row saves and deletes on the source models mark their batch dirty via
+``output_data.signals``; dirty batches are refreshed once, after the
+surrounding transaction commits.  Bulk writers that bypass signals
+(``compute_emissions`` and friends) call :func:`refresh_batch_summaries`
+with the batches they touched.
+
+:func:`inventory_totals` is the facility/material rollup behind the
+inventory dashboard; it is served from the query cache until one of its
+source tables changes.
+"""
+
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+
+from main.caching import cached_query, invalidate_on_commit, model_tag
+from process_data.models import ProcEmissionsCalcFact, ProcInventoryFact
+from raw_data.models import RawFacilityDim, RawMaterialDim
+
+from .models import (
+    OutBatchSummaryFact,
+    OutCertificateIssueLogFact,
+    OutCreditGrantLogFact,
+    OutInventoryTraceFact,
+)
+
+REFRESH_CHUNK_SIZE = 500
+
+SUMMARY_FIELDS = [
+    "inventory_records",
+    "inventory_kg",
+    "emissions_records",
+    "emissions_kgco2",
+    "certificate_count",
+    "latest_certificate_date",
+    "credit_count",
+    "carbon_tonnes",
+    "credit_value",
+    "trace_count",
+    "latest_trace_stage",
+    "last_activity",
+    "updated_at",
+]
+
+_pending = threading.local()
+
+
+def _grouped(queryset, batch_ids: List[str], **aggregates) -> Dict[str, Dict]:
+    rows = (
+        queryset.filter(batch_id__in=batch_ids)
+        .values("batch_id")
+        .order_by()
+        .annotate(**aggregates)
+    )
+    return {row.pop("batch_id"): row for row in rows}
+
+
+def _latest_stages(batch_ids: List[str]) -> Dict[str, str]:
+    stages: Dict[str, str] = {}
+    rows = (
+        OutInventoryTraceFact.objects.filter(batch_id__in=batch_ids)
+        .order_by("batch_id", "timestamp", "trace_id")
+        .values_list("batch_id", "stage")
+    )
+    for batch_id, stage in rows:
+        stages[batch_id] = stage
+    return stages
+
+
+def _summaries(batch_ids: List[str]) -> List[OutBatchSummaryFact]:
+    inventory = _grouped(
+        ProcInventoryFact.objects, batch_ids,
+        records=Count("inventory_id"), kg=Sum("normalized_quantity_kg"), last=Max("timestamp"),
+    )
+    emissions = _grouped(
+        ProcEmissionsCalcFact.objects, batch_ids,
+        records=Count("calc_id"), kgco2=Sum("emissions_kgco2"), last=Max("timestamp"),
+    )
+    certificates = _grouped(
+        OutCertificateIssueLogFact.objects, batch_ids,
+        count=Count("cert_id"), latest=Max("issue_date"),
+    )
+    credits = _grouped(
+        OutCreditGrantLogFact.objects, batch_ids,
+        count=Count("credit_id"), tonnes=Sum("carbon_tonnes"), value=Sum("price"),
+    )
+    traces = _grouped(
+        OutInventoryTraceFact.objects, batch_ids,
+        count=Count("trace_id"), last=Max("timestamp"),
+    )
+    stages = _latest_stages(list(traces))
+
+    summaries = []
+    for batch_id in batch_ids:
+        inv = inventory.get(batch_id)
+        emi = emissions.get(batch_id)
+        cert = certificates.get(batch_id)
+        cred = credits.get(batch_id)
+        trace = traces.get(batch_id)
+        if not any((inv, emi, cert, cred, trace)):
+            continue
+        activity = [row["last"] for row in (inv, emi, trace) if row and row["last"]]
+        summaries.append(
+            OutBatchSummaryFact(
+                batch_id=batch_id,
+                inventory_records=inv["records"] if inv else 0,
+                inventory_kg=(inv["kg"] or 0.0) if inv else 0.0,
+                emissions_records=emi["records"] if emi else 0,
+                emissions_kgco2=(emi["kgco2"] or 0.0) if emi else 0.0,
+                certificate_count=cert["count"] if cert else 0,
+                latest_certificate_date=cert["latest"] if cert else None,
+                credit_count=cred["count"] if cred else 0,
+                carbon_tonnes=(cred["tonnes"] or 0.0) if cred else 0.0,
+                credit_value=(cred["value"] or 0.0) if cred else 0.0,
+                trace_count=trace["count"] if trace else 0,
+                latest_trace_stage=stages.get(batch_id, ""),
+                last_activity=max(activity) if activity else None,
+            )
+        )
+    return summaries
+
+
+def refresh_batch_summaries(batch_ids: Iterable[str], chunk_size: int = REFRESH_CHUNK_SIZE) -> int:
+    """Recompute the summaries of ``batch_ids`` from the source facts.
+
+    Batches with no remaining facts lose their summary row.  Returns the
+    number of summaries written.
+    """
+
+    batch_ids = sorted({batch_id for batch_id in batch_ids if batch_id})
+    written = 0
+    for start in range(0, len(batch_ids), chunk_size):
+        chunk = batch_ids[start:start + chunk_size]
+        summaries = _summaries(chunk)
+        present = {summary.batch_id for summary in summaries}
+        with transaction.atomic():
+            OutBatchSummaryFact.objects.filter(
+                batch_id__in=[batch_id for batch_id in chunk if batch_id not in present]
+            ).delete()
+            OutBatchSummaryFact.objects.bulk_create(
+                summaries,
+                update_conflicts=True,
+                unique_fields=["batch_id"],
+                update_fields=SUMMARY_FIELDS,
+            )
+            label = model_tag(OutBatchSummaryFact)
+            invalidate_on_commit(label, *(f"{label}:{batch_id}" for batch_id in chunk))
+        written += len(summaries)
+    return written
+
+
+def rebuild_batch_summaries(chunk_size: int = REFRESH_CHUNK_SIZE) -> int:
+    """Recompute every summary and drop those of batches that no longer exist."""
+
+    batch_ids: Set[str] = set()
+    for model in (
+        ProcInventoryFact,
+        ProcEmissionsCalcFact,
+        OutCertificateIssueLogFact,
+        OutCreditGrantLogFact,
+        OutInventoryTraceFact,
+    ):
+        batch_ids.update(model.objects.values_list("batch_id", flat=True).distinct())
+    batch_ids.update(OutBatchSummaryFact.objects.values_list("batch_id", flat=True))
+    return refresh_batch_summaries(batch_ids, chunk_size=chunk_size)
+
+
+def _flush_pending() -> None:
+    batch_ids = getattr(_pending, "batch_ids", None)
+    if not batch_ids:
+        return
+    _pending.batch_ids = set()
+    refresh_batch_summaries(batch_ids)
+
+
+def mark_batch_dirty(batch_id: str) -> None:
+    """Schedule a refresh of ``batch_id`` once the current transaction commits.
+
+    Batches marked within the same transaction are refreshed together by the
+    first callback to run; batches left over from a rolled-back transaction
+    ride along with the next refresh.
+    """
+
+    if not hasattr(_pending, "batch_ids"):
+        _pending.batch_ids = set()
+    _pending.batch_ids.add(batch_id)
+    transaction.on_commit(_flush_pending)
+
+
+def _totals_entry(row: Dict) -> Dict:
+    return {
+        "facility_id": row["facility_id"],
+        "facility_name": row["facility__name"],
+        "material_id": row["material_id"],
+        "material_type": row["material__type"],
+        "inventory_records": 0,
+        "inventory_kg": 0.0,
+        "emissions_kgco2": 0.0,
+    }
+
+
+@cached_query(
+    "output_data.inventory_totals",
+    depends_on=[ProcInventoryFact, ProcEmissionsCalcFact, RawFacilityDim, RawMaterialDim],
+)
+def inventory_totals(facility_id: Optional[int] = None) -> List[Dict]:
+    """Inventory and emissions totals per facility and material."""
+
+    inventory = ProcInventoryFact.objects.all()
+    emissions = ProcEmissionsCalcFact.objects.all()
+    if facility_id is not None:
+        inventory = inventory.filter(facility_id=facility_id)
+        emissions = emissions.filter(facility_id=facility_id)
+    keys = ("facility_id", "facility__name", "material_id", "material__type")
+    totals: Dict[tuple, Dict] = {}
+    for row in inventory.values(*keys).order_by().annotate(
+        records=Count("inventory_id"), kg=Sum("normalized_quantity_kg")
+    ):
+        entry = totals.setdefault((row["facility_id"], row["material_id"]), _totals_entry(row))
+        entry.update(inventory_records=row["records"], inventory_kg=row["kg"] or 0.0)
+    for row in emissions.values(*keys).order_by().annotate(kg=Sum("emissions_kgco2")):
+        entry = totals.setdefault((row["facility_id"], row["material_id"]), _totals_entry(row))
+        entry["emissions_kgco2"] = row["kg"] or 0.0
+    return [totals[key] for key in sorted(totals)]
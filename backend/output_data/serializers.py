@@ -0,0 +1,24 @@
+from rest_framework import serializers
+
+from .models import OutBatchSummaryFact
+
+
+class BatchSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OutBatchSummaryFact
+        fields = (
+            "batch_id",
+            "inventory_records",
+            "inventory_kg",
+            "emissions_records",
+            "emissions_kgco2",
+            "certificate_count",
+            "latest_certificate_date",
+            "credit_count",
+            "carbon_tonnes",
+            "credit_value",
+            "trace_count",
+            "latest_trace_stage",
+            "last_activity",
+            "updated_at",
+        )
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from process_data.models import ProcEmissionsCalcFact, ProcInventoryFact, ProcTraceMerkleState
+
+from .models import OutCertificateIssueLogFact, OutCreditGrantLogFact, OutInventoryTraceFact
+from .rollups import mark_batch_dirty
+
+SUMMARY_SOURCES = (
+    ProcInventoryFact,
+    ProcEmissionsCalcFact,
+    OutCertificateIssueLogFact,
+    OutCreditGrantLogFact,
+    OutInventoryTraceFact,
+)
+
+
+@receiver(pre_save, sender=OutInventoryTraceFact)
+def set_path_hash(sender, instance, **kwargs):
+    root = (
+        ProcTraceMerkleState.objects.filter(batch_id=instance.batch_id)
+        .values_list("root_hash", flat=True)
+        .first()
+    )
+    if root is not None:
+        instance.path_hash = root
+
+
+def mark_summary_dirty(sender, instance, **kwargs):
+    mark_batch_dirty(instance.batch_id)
+
+
+for model in SUMMARY_SOURCES:
+    post_save.connect(mark_summary_dirty, sender=model, dispatch_uid=f"batch_summary_save_{model.__name__}")
+    post_delete.connect(mark_summary_dirty, sender=model, dispatch_uid=f"batch_summary_delete_{model.__name__}")
@@ -1,3 +1,408 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from process_data.models import (
+    ProcEmissionsCalcFact,
+    ProcInventoryFact,
+    ProcProofOfGoodFact,
+    ProcTraceChainFact,
+    ProcTraceMerkleState,
+)
+from process_data.trace_hashing import verify_all_paths
+from raw_data.models import (
+    RawEmissionFactorDim,
+    RawFacilityDim,
+    RawLocationStageDim,
+    RawMaterialDim,
+    RawTextileProcessDim,
+)
+
+from .anchoring import CommitBatcher, LocalChain, enqueue_commits, verify_commit
+from .certificates import issue_certificates
+from .credits import drop_emptied_grants, grant_credits
+from .models import (
+    OutAnchorBatch,
+    OutAuditReportDim,
+    OutBatchSummaryFact,
+    OutBlockchainCommitLog,
+    OutCertificateIssueLogFact,
+    OutCreditGrantLogFact,
+    OutInventoryTraceFact,
+)
+from .reports import iter_report, write_report
+from .rollups import rebuild_batch_summaries
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+class OutputFixtures:
+    def make_dimensions(self):
+        self.facility = RawFacilityDim.objects.create(
+            name="Mill", location="IN", org_id="org-1", boundary_conditions_json={}
+        )
+        self.material = RawMaterialDim.objects.create(
+            type="cotton", blend_ratio="100", source="farm", certifications=""
+        )
+        self.location_stage = RawLocationStageDim.objects.create(
+            facility=self.facility, stage_name="dispatch",
+            estimated_transit_time_to_next=timedelta(hours=4), is_dispath_ready=True,
+        )
+
+    def add_inventory_trace(self, batch_id, **kwargs):
+        defaults = {
+            "batch_id": batch_id,
+            "facility": self.facility,
+            "material": self.material,
+            "path_hash": "",
+            "cert_refs": [],
+            "timestamp": utc(2025, 1, 2),
+            "location_stage": self.location_stage,
+            "stage": "dispatch",
+        }
+        defaults.update(kwargs)
+        return OutInventoryTraceFact.objects.create(**defaults)
+
+    def add_trace_step(self, batch_id, minute=0):
+        return ProcTraceChainFact.objects.create(
+            batch_id=batch_id, prev_step_id="upstream", timestamp=utc(2025, 1, 1, 0, minute), hash=""
+        )
+
+
+class InventoryPathHashTests(OutputFixtures, TestCase):
+    def setUp(self):
+        self.make_dimensions()
+
+    def test_path_hash_follows_batch_root(self):
+        self.add_trace_step("b1")
+        trace = self.add_inventory_trace("b1")
+        self.assertEqual(trace.path_hash, ProcTraceMerkleState.objects.get(pk="b1").root_hash)
+
+        self.add_trace_step("b1", minute=1)
+        trace.refresh_from_db()
+        self.assertEqual(trace.path_hash, ProcTraceMerkleState.objects.get(pk="b1").root_hash)
+        self.assertTrue(verify_all_paths().ok)
+
+        OutInventoryTraceFact.objects.filter(pk=trace.pk).update(path_hash="forged")
+        report = verify_all_paths()
+        self.assertEqual(report.inventory_traces, 1)
+        self.assertEqual(report.failure_count, 1)
+
+
+class BatchSummaryTests(OutputFixtures, TestCase):
+    def setUp(self):
+        self.make_dimensions()
+
+    def add_inventory(self, batch_id, quantity_kg):
+        return ProcInventoryFact.objects.create(
+            facility=self.facility, material=self.material, batch_id=batch_id,
+            quantity_kg=quantity_kg, status="stored", timestamp=utc(2025, 1, 1),
+        )
+
+    def add_certificate(self, batch_id):
+        return OutCertificateIssueLogFact.objects.create(
+            batch_id=batch_id, material=self.material, cert_type="GRS",
+            issue_date=utc(2025, 1, 3).date(), verifier_id="v-1", zk_hash="zk",
+        )
+
+    def test_summary_follows_source_facts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_inventory("b1", 100.0)
+            self.add_inventory("b1", 50.0)
+            cert = self.add_certificate("b1")
+            OutCreditGrantLogFact.objects.create(
+                batch_id="b1", carbon_tonnes=1.5, certificate=cert, price=20.0,
+                methodology_ref="m-1", grant_date=utc(2025, 1, 4).date(),
+            )
+            self.add_inventory_trace("b1", stage="spinning", timestamp=utc(2025, 1, 2))
+            self.add_inventory_trace("b1", stage="dispatch", timestamp=utc(2025, 1, 5))
+            self.add_inventory("b2", 10.0)
+
+        summary = OutBatchSummaryFact.objects.get(pk="b1")
+        self.assertEqual(summary.inventory_records, 2)
+        self.assertEqual(summary.inventory_kg, 150.0)
+        self.assertEqual(summary.certificate_count, 1)
+        self.assertEqual(summary.credit_count, 1)
+        self.assertEqual(summary.carbon_tonnes, 1.5)
+        self.assertEqual(summary.trace_count, 2)
+        self.assertEqual(summary.latest_trace_stage, "dispatch")
+        self.assertEqual(summary.last_activity, utc(2025, 1, 5))
+        self.assertEqual(OutBatchSummaryFact.objects.get(pk="b2").inventory_kg, 10.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cert.delete()
+        summary.refresh_from_db()
+        self.assertEqual((summary.certificate_count, summary.credit_count), (0, 0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ProcInventoryFact.objects.get(batch_id="b2").delete()
+        self.assertFalse(OutBatchSummaryFact.objects.filter(pk="b2").exists())
+
+    def test_rebuild_and_dossier_endpoint(self):
+        self.add_inventory("b1", 25.0)
+        OutBatchSummaryFact.objects.create(batch_id="gone")
+        self.assertEqual(rebuild_batch_summaries(), 1)
+        self.assertFalse(OutBatchSummaryFact.objects.filter(pk="gone").exists())
+
+        client = APIClient()
+        self.assertEqual(client.get(reverse("batch-dossier", args=["b1"])).status_code, 401)
+        client.force_authenticate(User.objects.create_user(username="reader", password="secret123"))
+        with self.assertNumQueries(1):
+            resp = client.get(reverse("batch-dossier", args=["b1"]))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["inventory_kg"], 25.0)
+        self.assertEqual(client.get(reverse("batch-dossier", args=["b9"])).status_code, 404)
+
+
+class CommitAnchoringTests(TestCase):
+    def setUp(self):
+        self.chain = LocalChain()
+        enqueue_commits(("cert", i, f"h{i}") for i in range(25))
+
+    def test_batches_anchor_one_root_each(self):
+        batcher = CommitBatcher(self.chain, max_batch_size=10, max_wait=3600)
+        self.assertTrue(batcher.is_due())
+        stats = batcher.flush()
+
+        self.assertEqual((stats.batches, stats.records), (3, 25))
+        self.assertEqual(len(self.chain.roots), 3)
+        self.assertEqual(
+            list(OutAnchorBatch.objects.order_by("anchor_id").values_list("leaf_count", flat=True)),
+            [10, 10, 5],
+        )
+        records = OutBlockchainCommitLog.objects.select_related("anchor_batch")
+        self.assertTrue(all(verify_commit(record) for record in records))
+
+        record = records.get(linked_id="7")
+        record.hash = "forged"
+        self.assertFalse(verify_commit(record))
+        self.assertFalse(batcher.is_due())
+
+    def test_legacy_records_keep_their_transaction(self):
+        legacy = OutBlockchainCommitLog.objects.create(
+            linked_table="cert", linked_id="legacy", hash="h", tx_hash="0xold", commit_date=utc(2024, 1, 1)
+        )
+        stats = CommitBatcher(self.chain, max_batch_size=100).flush()
+        self.assertEqual(stats.records, 25)
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.tx_hash, legacy.commit_date, legacy.anchor_batch), ("0xold", utc(2024, 1, 1), None))
+
+    def test_partial_batch_waits_for_window(self):
+        batcher = CommitBatcher(self.chain, max_batch_size=100, max_wait=3600)
+        self.assertFalse(batcher.is_due())
+        self.assertEqual(batcher.run_once().records, 0)
+        self.assertEqual(CommitBatcher(self.chain, max_batch_size=100, max_wait=0).run_once().records, 25)
+
+    def test_proof_endpoint_verifies_offline(self):
+        CommitBatcher(self.chain, max_batch_size=8).flush()
+        client = APIClient()
+        self.assertEqual(client.get(reverse("commit-proof", args=["cert", "12"])).status_code, 401)
+        client.force_authenticate(User.objects.create_user(username="auditor", password="secret123"))
+        with self.assertNumQueries(1):
+            resp = client.get(reverse("commit-proof", args=["cert", "12"]))
+        data = resp.json()
+        self.assertTrue(data["verified"])
+        self.assertEqual(data["root_hash"], self.chain.roots[1])
+        self.assertEqual(client.get(reverse("commit-proof", args=["cert", "99"])).status_code, 404)
+
+
+class CertificateIssuanceTests(OutputFixtures, TestCase):
+    def setUp(self):
+        self.make_dimensions()
+        for i in range(5):
+            ProcInventoryFact.objects.create(
+                facility=self.facility, material=self.material, batch_id=f"b{i}",
+                quantity_kg=10.0 * i, status="stored", timestamp=utc(2025, 1, 1),
+            )
+
+    def test_issuance_is_resumable(self):
+        seen = []
+        stats = issue_certificates(
+            "GRS", "v-1", batch_ids=["b0", "b1"], workers=0, chunk_size=1, iterations=10,
+            progress=lambda s: seen.append(s.issued),
+        )
+        self.assertEqual((stats.planned, stats.issued, stats.chunks), (2, 2, 2))
+        self.assertEqual(seen, [1, 2])
+
+        stats = issue_certificates("GRS", "v-1", workers=0, chunk_size=2, iterations=10)
+        self.assertEqual((stats.skipped, stats.issued), (2, 3))
+        self.assertEqual(OutCertificateIssueLogFact.objects.filter(cert_type="GRS").count(), 5)
+        self.assertEqual(issue_certificates("GRS", "v-1", workers=0).planned, 0)
+        self.assertEqual(OutBatchSummaryFact.objects.get(pk="b3").certificate_count, 1)
+
+    def test_certificates_issued_by_a_concurrent_run_are_not_counted(self):
+        issue_certificates("GRS", "v-1", batch_ids=["b0"], workers=0, iterations=10)
+        # Plan as if b0 were still missing, as a run started alongside would.
+        with mock.patch("output_data.certificates.pending_batches", return_value=(["b0", "b1"], 0)):
+            stats = issue_certificates("GRS", "v-1", workers=0, iterations=10)
+        self.assertEqual((stats.planned, stats.issued, stats.raced, stats.remaining), (2, 1, 1, 0))
+        self.assertEqual(OutCertificateIssueLogFact.objects.filter(cert_type="GRS").count(), 2)
+
+    def test_pool_matches_serial_hashes(self):
+        issue_certificates("GRS", "v-1", workers=0, iterations=10)
+        serial = dict(OutCertificateIssueLogFact.objects.values_list("batch_id", "zk_hash"))
+        OutCertificateIssueLogFact.objects.all().delete()
+        issue_certificates("GRS", "v-1", workers=2, chunk_size=2, iterations=10)
+        self.assertEqual(dict(OutCertificateIssueLogFact.objects.values_list("batch_id", "zk_hash")), serial)
+
+
+@override_settings(CREDIT_PRICE_PER_TONNE={"VM0001": 10.0})
+class CreditGrantTests(OutputFixtures, TestCase):
+    def setUp(self):
+        self.make_dimensions()
+        process = RawTextileProcessDim.objects.create(
+            process_name="dyeing", stage="wet", energy_type="grid",
+            unit_of_measurement="kg", details_json={},
+        )
+        self.factor = RawEmissionFactorDim.objects.create(
+            process=process, material_type="cotton", factor_value=1.0, source="x", region="IN"
+        )
+        self.process = process
+        self.certificate = OutCertificateIssueLogFact.objects.create(
+            batch_id="b1", material=self.material, cert_type="GRS",
+            issue_date=utc(2025, 1, 1).date(), verifier_id="v-1", zk_hash="zk",
+        )
+        ProcProofOfGoodFact.objects.create(
+            batch_id="b1", verifier_id="v-1", source_batch="b0", timestamp=utc(2025, 1, 1),
+            proof_doc_url="https://proofs.example/b1", methodology_ref="VM0001",
+        )
+
+    def add_emissions(self, batch_id, kg, timestamp):
+        return ProcEmissionsCalcFact.objects.create(
+            batch_id=batch_id, process=self.process, material=self.material, facility=self.facility,
+            factor=self.factor, activity_type="inventory", emissions_kgco2=kg, timestamp=timestamp,
+        )
+
+    def grants(self):
+        return list(
+            OutCreditGrantLogFact.objects.order_by("window_start").values_list(
+                "window_start", "carbon_tonnes", "price"
+            )
+        )
+
+    def test_windows_are_aggregated_incrementally(self):
+        self.add_emissions("b1", 500.0, utc(2025, 1, 13))
+        self.add_emissions("b1", 1500.0, utc(2025, 1, 20))
+        self.add_emissions("b1", 3000.0, utc(2025, 3, 5))
+        self.add_emissions("b2", 100.0, utc(2025, 1, 13))
+
+        stats = grant_credits(window_days=30)
+        self.assertEqual((stats.windows, stats.granted, stats.skipped_no_methodology), (3, 2, 1))
+        # 30-day windows aligned to 1970-01-01 start on 2025-01-12 and 2025-02-11.
+        self.assertEqual(
+            self.grants(),
+            [(date(2025, 1, 12), 2.0, 20.0), (date(2025, 2, 11), 3.0, 30.0)],
+        )
+        grant = OutCreditGrantLogFact.objects.first()
+        self.assertEqual(grant.certificate, self.certificate)
+        self.assertEqual(grant.window_end, date(2025, 2, 11))
+
+        self.assertEqual(grant_credits(window_days=30).new_rows, 0)
+
+        self.add_emissions("b1", 1000.0, utc(2025, 2, 1))
+        stats = grant_credits(window_days=30)
+        self.assertEqual((stats.new_rows, stats.windows, stats.granted), (1, 1, 1))
+        self.assertEqual(self.grants()[0], (date(2025, 1, 12), 3.0, 30.0))
+        self.assertEqual(OutCreditGrantLogFact.objects.count(), 2)
+        self.assertEqual(OutBatchSummaryFact.objects.get(pk="b1").carbon_tonnes, 6.0)
+
+    def test_methodology_change_replaces_the_window_grant(self):
+        self.add_emissions("b1", 2000.0, utc(2025, 1, 13))
+        grant_credits(window_days=30)
+        ProcProofOfGoodFact.objects.create(
+            batch_id="b1", verifier_id="v-2", source_batch="b0", timestamp=utc(2025, 2, 1),
+            proof_doc_url="https://proofs.example/b1-2", methodology_ref="VM0002",
+        )
+        self.add_emissions("b1", 1000.0, utc(2025, 1, 14))
+
+        stats = grant_credits(window_days=30)
+        self.assertEqual((stats.granted, stats.replaced), (1, 1))
+        self.assertEqual(
+            list(OutCreditGrantLogFact.objects.values_list("methodology_ref", "carbon_tonnes")), [("VM0002", 3.0)]
+        )
+        self.assertEqual(OutBatchSummaryFact.objects.get(pk="b1").carbon_tonnes, 3.0)
+
+    def test_grants_of_emptied_windows_are_dropped(self):
+        self.add_emissions("b1", 500.0, utc(2025, 1, 13))
+        emptied = self.add_emissions("b1", 3000.0, utc(2025, 3, 5))
+        grant_credits(window_days=30)
+        emptied.delete()
+        self.assertEqual(drop_emptied_grants(["b1"]), 1)
+        self.assertEqual(self.grants(), [(date(2025, 1, 12), 0.5, 5.0)])
+
+
+class AuditReportExportTests(OutputFixtures, TestCase):
+    def setUp(self):
+        self.make_dimensions()
+        self.certificates = [
+            OutCertificateIssueLogFact.objects.create(
+                batch_id=f"b{n}", material=self.material, cert_type="GRS",
+                issue_date=date(2025, 1, n), verifier_id="v-1", zk_hash=f"zk{n}",
+            )
+            for n in range(1, 4)
+        ]
+        OutCreditGrantLogFact.objects.create(
+            batch_id="b1", carbon_tonnes=2.0, certificate=self.certificates[0], price=20.0,
+            methodology_ref="VM0001", grant_date=date(2025, 2, 1),
+        )
+        OutCreditGrantLogFact.objects.create(
+            batch_id="b1", carbon_tonnes=1.5, certificate=self.certificates[0], price=15.0,
+            methodology_ref="VM0002", grant_date=date(2025, 2, 1),
+        )
+        self.add_inventory_trace("b1", stage="spinning", timestamp=utc(2025, 1, 3))
+        rebuild_batch_summaries()
+        self.report = OutAuditReportDim.objects.create(
+            report_type="annual", generation_date=date(2025, 3, 1), reviewer_id="r-1"
+        )
+        self.report.certificates.add(*self.certificates[:2])
+
+    def read_csv(self, data):
+        return list(csv.DictReader(io.StringIO(data.decode())))
+
+    def test_rows_join_credits_and_trace_in_sql(self):
+        with self.assertNumQueries(1):
+            data = b"".join(iter_report(self.report, "csv"))
+        rows = self.read_csv(data)
+        self.assertEqual([row["batch_id"] for row in rows], ["b1", "b2"])
+        self.assertEqual(rows[0]["credit_count"], "2")
+        self.assertEqual(float(rows[0]["carbon_tonnes"]), 3.5)
+        self.assertEqual(float(rows[0]["credit_value"]), 35.0)
+        self.assertEqual((rows[0]["trace_count"], rows[0]["latest_trace_stage"]), ("1", "spinning"))
+        self.assertEqual((rows[1]["credit_count"], rows[1]["trace_count"]), ("0", "0"))
+        self.assertEqual(rows[1]["material_type"], "cotton")
+        self.assertEqual(list(self.certificates[2].audit_reports.all()), [])
+
+    def test_ndjson_and_gzip_output(self):
+        lines = b"".join(iter_report(self.report, "ndjson", chunk_size=1)).decode().splitlines()
+        self.assertEqual([json.loads(line)["cert_id"] for line in lines], [c.cert_id for c in self.certificates[:2]])
+
+        buffer = io.BytesIO()
+        write_report(self.report, buffer, "csv", compress=True)
+        plain = b"".join(iter_report(self.report, "csv"))
+        self.assertEqual(gzip.decompress(buffer.getvalue()), plain)
+        with self.assertRaises(ValueError):
+            list(iter_report(self.report, "xml"))
+
+    def test_export_endpoint_streams(self):
+        url = reverse("audit-report-export", args=[self.report.pk])
+        self.client = APIClient()
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_authenticate(User.objects.create_user(username="auditor", password="secret123"))
+        response = self.client.get(url, {"output": "csv", "gzip": "1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn(".csv.gz", response["Content-Disposition"])
+        rows = self.read_csv(gzip.decompress(b"".join(response.streaming_content)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(self.client.get(url, {"output": "xml"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("audit-report-export", args=[999])).status_code, 404)
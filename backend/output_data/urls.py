@@ -0,0 +1,10 @@
+from django.urls import path
+
+from .views import AuditReportExportView, BatchDossierView, CommitProofView, InventoryDashboardView
+
+urlpatterns = [
+    path('batches/<str:batch_id>', BatchDossierView.as_view(), name='batch-dossier'),
+    path('commits/<str:linked_table>/<str:linked_id>', CommitProofView.as_view(), name='commit-proof'),
+    path('dashboard/inventory', InventoryDashboardView.as_view(), name='inventory-dashboard'),
+    path('reports/<int:report_id>/export', AuditReportExportView.as_view(), name='audit-report-export'),
+]
@@ -1,3 +1,86 @@
-from django.shortcuts import render
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import generics
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from main.caching import cache_response
+
+from .anchoring import commit_proof, verify_bundle
+from .models import OutAuditReportDim, OutBatchSummaryFact
+from .reports import CONTENT_TYPES, FORMATS, iter_report
+from .rollups import inventory_totals
+from .serializers import BatchSummarySerializer
+
+
+class BatchDossierView(generics.RetrieveAPIView):
+    """``GET`` the rolled-up dossier of one batch by ``batch_id``.
+
+    Served from ``OutBatchSummaryFact`` with a single primary-key lookup,
+    and from the query cache until that batch's summary changes.
+    """
+
+    permission_classes = [IsAuthenticated]
+    queryset = OutBatchSummaryFact.objects.all()
+    serializer_class = BatchSummarySerializer
+    lookup_field = "batch_id"
+
+    @cache_response("output_data.batch_dossier", depends_on=["output_data.OutBatchSummaryFact:{batch_id}"])
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+class InventoryDashboardView(APIView):
+    """``GET`` inventory and emissions totals per facility and material.
+
+    ``?facility_id=`` narrows the totals to one facility.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        facility_id = request.query_params.get("facility_id")
+        if facility_id is not None and not facility_id.isdigit():
+            return Response({"detail": "facility_id must be an integer."}, status=400)
+        return Response(inventory_totals(facility_id=int(facility_id) if facility_id else None))
+
+
+class CommitProofView(APIView):
+    """``GET`` the anchored inclusion proof of one record.
+
+    The response carries everything needed to re-check the record offline
+    against the batch root, plus the server's own verification result.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, linked_table, linked_id):
+        bundle = commit_proof(linked_table, linked_id)
+        if bundle is None:
+            raise Http404("No anchored commit for this record.")
+        return Response({**bundle, "verified": verify_bundle(bundle)})
+
+
+class AuditReportExportView(APIView):
+    """``GET`` an audit report as a streamed CSV or NDJSON download.
+
+    ``?output=csv|ndjson`` picks the encoding (``format`` is taken by DRF's
+    content negotiation) and ``?gzip=1`` compresses the stream.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, report_id):
+        report = get_object_or_404(OutAuditReportDim, pk=report_id)
+        fmt = request.query_params.get("output", "csv")
+        if fmt not in FORMATS:
+            return Response({"detail": f"output must be one of {', '.join(FORMATS)}."}, status=400)
+        compress = request.query_params.get("gzip") in ("1", "true")
+        filename = f"audit-report-{report.pk}.{fmt}" + (".gz" if compress else "")
+        response = StreamingHttpResponse(
+            iter_report(report, fmt, compress),
+            content_type="application/gzip" if compress else CONTENT_TYPES[fmt],
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ProcessDataConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "process_data"
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,300 @@
+"""Vectorized emissions calculation for ``ProcEmissionsCalcFact``.
+
+Activity data for a whole time window is loaded with a handful of queries and
+packed into NumPy arrays: one row per inventory record, one per facility
+process mapping and one per emission factor.  Inventory rows are joined to the
+processes active at their facility on the inventory date, each pair is matched
+to the ``RawEmissionFactorDim`` for its ``(process, material_type, region)``
+and emissions are computed for every pair at once as ``quantity * factor``.
+
+Quantities are read from ``normalized_quantity_kg`` (see
+``process_data.units``); rows not yet normalized are skipped and counted.
+Factors come from the in-process ``raw_data.factor_index`` rather than a
+query per run.  A factor with region ``"global"`` is used when no factor
+exists for the facility's own region.  Results replace any rows previously
+computed for the same window, so a recomputation is idempotent.
+"""
+
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from django.db import transaction
+
+from main.caching import mark_models_stale
+from output_data.rollups import refresh_batch_summaries
+from raw_data.factor_index import GLOBAL_REGION, factor_index, normalize_label
+from raw_data.models import RawFacilityProcessMapFact
+
+from .models import ProcEmissionsCalcFact, ProcInventoryFact
+
+ACTIVITY_TYPE = "inventory"
+WRITE_BATCH_SIZE = 2000
+
+# ``active_to`` is open-ended when null; use a date ordinal past any real date.
+_OPEN_ENDED = np.iinfo(np.int64).max
+
+
+class _Vocabulary:
+    """Assign stable integer codes to normalized string labels."""
+
+    def __init__(self) -> None:
+        self.codes: Dict[str, int] = {}
+
+    def code(self, label: Optional[str]) -> int:
+        key = normalize_label(label)
+        try:
+            return self.codes[key]
+        except KeyError:
+            return self.codes.setdefault(key, len(self.codes))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+@dataclass
+class EmissionsRunStats:
+    """Summary of one engine run."""
+
+    inventory_rows: int = 0
+    calculated: int = 0
+    unmatched: int = 0
+    unconverted: int = 0
+    deleted: int = 0
+    elapsed: float = 0.0
+
+
+@dataclass
+class EmissionsResult:
+    """Index pairs and values produced by :func:`calculate`.
+
+    ``inventory_index`` points into the activity arrays, ``process_ids`` and
+    ``factor_ids`` identify the matched process and factor for each pair.
+    ``missed_pairs`` counts active process pairs that had no factor.
+    """
+
+    inventory_index: np.ndarray
+    process_ids: np.ndarray
+    factor_ids: np.ndarray
+    emissions_kgco2: np.ndarray
+    matched_inventory: int
+    missed_pairs: int = 0
+
+
+def _expand_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Return the concatenation of ``range(start, start + count)`` per row."""
+
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    return np.arange(total, dtype=np.int64) - offsets + np.repeat(starts, counts)
+
+
+def calculate(
+    facility: np.ndarray,
+    material_type: np.ndarray,
+    region: np.ndarray,
+    quantity: np.ndarray,
+    day: np.ndarray,
+    map_facility: np.ndarray,
+    map_process: np.ndarray,
+    map_from: np.ndarray,
+    map_to: np.ndarray,
+    factor_keys: np.ndarray,
+    factor_ids: np.ndarray,
+    factor_values: np.ndarray,
+    vocab_size: int,
+    global_region: int,
+) -> EmissionsResult:
+    """Join activity rows to processes and factors and compute emissions.
+
+    ``factor_keys`` must be sorted and unique; they are built by
+    :func:`factor_key` from process id, material type code and region code.
+    """
+
+    order = np.argsort(map_facility, kind="stable")
+    map_facility = map_facility[order]
+    map_process = map_process[order]
+    map_from = map_from[order]
+    map_to = map_to[order]
+
+    lo = np.searchsorted(map_facility, facility, side="left")
+    hi = np.searchsorted(map_facility, facility, side="right")
+    counts = hi - lo
+    inv_idx = np.repeat(np.arange(len(facility), dtype=np.int64), counts)
+    map_idx = _expand_ranges(lo, counts)
+
+    pair_day = day[inv_idx]
+    active = (map_from[map_idx] <= pair_day) & (pair_day <= map_to[map_idx])
+    inv_idx = inv_idx[active]
+    process = map_process[map_idx[active]]
+
+    mtype = material_type[inv_idx]
+    local_pos, local_hit = _lookup(factor_keys, factor_key(process, mtype, region[inv_idx], vocab_size))
+    global_pos, global_hit = _lookup(
+        factor_keys, factor_key(process, mtype, np.full_like(mtype, global_region), vocab_size)
+    )
+    position = np.where(local_hit, local_pos, global_pos)
+    hit = local_hit | global_hit
+
+    inv_idx = inv_idx[hit]
+    position = position[hit]
+    return EmissionsResult(
+        inventory_index=inv_idx,
+        process_ids=process[hit],
+        factor_ids=factor_ids[position],
+        emissions_kgco2=quantity[inv_idx] * factor_values[position],
+        matched_inventory=len(np.unique(inv_idx)),
+        missed_pairs=int(len(hit) - hit.sum()),
+    )
+
+
+def factor_key(process: np.ndarray, material_type: np.ndarray, region: np.ndarray, vocab_size: int) -> np.ndarray:
+    """Pack ``(process, material_type, region)`` into one sortable int64."""
+
+    size = np.int64(max(vocab_size, 1))
+    return (process.astype(np.int64) * size + material_type) * size + region
+
+
+def _lookup(sorted_keys: np.ndarray, keys: np.ndarray):
+    if len(sorted_keys) == 0:
+        empty = np.zeros(len(keys), dtype=np.int64)
+        return empty, np.zeros(len(keys), dtype=bool)
+    pos = np.searchsorted(sorted_keys, keys)
+    pos = np.minimum(pos, len(sorted_keys) - 1)
+    return pos, sorted_keys[pos] == keys
+
+
+def _window_queryset(start: datetime, end: datetime, facility_ids: Optional[Sequence[int]]):
+    qs = ProcInventoryFact.objects.filter(timestamp__gte=start, timestamp__lt=end)
+    if facility_ids is not None:
+        qs = qs.filter(facility_id__in=list(facility_ids))
+    return qs
+
+
+def load_factors(vocab: _Vocabulary, process_ids: Iterable[int]):
+    """Return sorted unique factor keys with their ids and values."""
+
+    process_ids = set(process_ids)
+    rows = [
+        (entry.factor_id, key[0], key[1], key[2], entry.factor_value)
+        for key, entry in factor_index.entries().items()
+        if key[0] in process_ids
+    ]
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    process = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+    mtype = np.fromiter((vocab.code(r[2]) for r in rows), dtype=np.int64, count=len(rows))
+    region = np.fromiter((vocab.code(r[3]) for r in rows), dtype=np.int64, count=len(rows))
+    values = np.fromiter((r[4] for r in rows), dtype=np.float64, count=len(rows))
+    return process, mtype, region, ids, values
+
+
+def compute_emissions(
+    start: datetime,
+    end: datetime,
+    facility_ids: Optional[Sequence[int]] = None,
+) -> EmissionsRunStats:
+    """Recompute ``ProcEmissionsCalcFact`` rows for inventory in ``[start, end)``.
+
+    Optionally restrict the run to ``facility_ids``.  Existing inventory-based
+    calculations in the same window are replaced inside one transaction.
+    """
+
+    stats = EmissionsRunStats()
+    started = time.perf_counter()
+    vocab = _Vocabulary()
+    global_region = vocab.code(GLOBAL_REGION)
+
+    window = _window_queryset(start, end, facility_ids)
+    # Rows without a kg quantity wait for ``backfill_quantities``.
+    stats.unconverted = window.filter(normalized_quantity_kg__isnull=True).count()
+    inventory = list(
+        window.filter(normalized_quantity_kg__isnull=False).values_list(
+            "inventory_id",
+            "batch_id",
+            "facility_id",
+            "material_id",
+            "material__type",
+            "facility__location",
+            "normalized_quantity_kg",
+            "timestamp",
+        )
+    )
+    n = stats.inventory_rows = len(inventory)
+
+    facility = np.fromiter((r[2] for r in inventory), dtype=np.int64, count=n)
+    material_type = np.fromiter((vocab.code(r[4]) for r in inventory), dtype=np.int64, count=n)
+    region = np.fromiter((vocab.code(r[5]) for r in inventory), dtype=np.int64, count=n)
+    quantity = np.fromiter((r[6] for r in inventory), dtype=np.float64, count=n)
+    day = np.fromiter((r[7].date().toordinal() for r in inventory), dtype=np.int64, count=n)
+
+    maps = list(
+        RawFacilityProcessMapFact.objects.filter(facility_id__in=set(facility.tolist()))
+        .values_list("facility_id", "process_id", "active_from", "active_to")
+    )
+    m = len(maps)
+    map_facility = np.fromiter((r[0] for r in maps), dtype=np.int64, count=m)
+    map_process = np.fromiter((r[1] for r in maps), dtype=np.int64, count=m)
+    map_from = np.fromiter((r[2].toordinal() for r in maps), dtype=np.int64, count=m)
+    map_to = np.fromiter(
+        (r[3].toordinal() if r[3] else _OPEN_ENDED for r in maps), dtype=np.int64, count=m
+    )
+
+    f_process, f_mtype, f_region, f_ids, f_values = load_factors(vocab, set(map_process.tolist()))
+    keys = factor_key(f_process, f_mtype, f_region, len(vocab))
+    # Sort by key, keeping the lowest factor_id when a key is duplicated.
+    order = np.lexsort((f_ids, keys))
+    keys, first = np.unique(keys[order], return_index=True)
+    f_ids = f_ids[order][first]
+    f_values = f_values[order][first]
+
+    result = calculate(
+        facility, material_type, region, quantity, day,
+        map_facility, map_process, map_from, map_to,
+        keys, f_ids, f_values,
+        vocab_size=len(vocab),
+        global_region=global_region,
+    )
+    stats.unmatched = n - result.matched_inventory
+    factor_index.record(hits=len(result.factor_ids), misses=result.missed_pairs)
+
+    rows: List[ProcEmissionsCalcFact] = []
+    for i, process_id, factor_id, value in zip(
+        result.inventory_index.tolist(),
+        result.process_ids.tolist(),
+        result.factor_ids.tolist(),
+        result.emissions_kgco2.tolist(),
+    ):
+        record = inventory[i]
+        rows.append(
+            ProcEmissionsCalcFact(
+                batch_id=record[1],
+                process_id=process_id,
+                material_id=record[3],
+                facility_id=record[2],
+                factor_id=factor_id,
+                activity_type=ACTIVITY_TYPE,
+                emissions_kgco2=value,
+                timestamp=record[7],
+            )
+        )
+
+    existing = ProcEmissionsCalcFact.objects.filter(
+        activity_type=ACTIVITY_TYPE, timestamp__gte=start, timestamp__lt=end
+    )
+    if facility_ids is not None:
+        existing = existing.filter(facility_id__in=list(facility_ids))
+
+    touched = {row.batch_id for row in rows}
+    with transaction.atomic():
+        touched.update(existing.values_list("batch_id", flat=True).distinct())
+        stats.deleted, _ = existing.delete()
+        ProcEmissionsCalcFact.objects.bulk_create(rows, batch_size=WRITE_BATCH_SIZE)
+        mark_models_stale(ProcEmissionsCalcFact)
+        refresh_batch_summaries(touched)
+    stats.calculated = len(rows)
+    stats.elapsed = time.perf_counter() - started
+    return stats
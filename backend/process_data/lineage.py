@@ -0,0 +1,195 @@
+"""Batch lineage over ``ProcTraceChainFact`` backed by a closure table.
+
+Each trace step links batches: ``prev_step_id`` names the upstream batch that
+fed ``batch_id`` and ``next_step_id`` the downstream batch it fed into.  The
+transitive closure of those links is kept in ``ProcTraceLineageFact`` so a
+batch's complete upstream and downstream lineage is a single indexed query,
+however deep the chain.
+
+New steps are indexed incrementally: adding the edge ``u -> v`` inserts a row
+for every ancestor of ``u`` paired with every descendant of ``v``.  Rows are
+never removed when a step is edited or deleted; run ``rebuild_trace_lineage``
+after such changes.
+"""
+
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+
+from main.caching import mark_models_stale
+
+from .models import ProcTraceChainFact, ProcTraceLineageFact
+
+WRITE_BATCH_SIZE = 2000
+
+Edge = Tuple[str, str]
+# Fields of ``ProcTraceChainFact`` that define its edges.
+EDGE_FIELDS = ("batch_id", "prev_step_id", "next_step_id")
+
+
+@dataclass
+class Lineage:
+    """Upstream and downstream batches of ``batch_id`` with hop distances."""
+
+    batch_id: str
+    upstream: Dict[str, int] = field(default_factory=dict)
+    downstream: Dict[str, int] = field(default_factory=dict)
+
+
+def step_edges(step: ProcTraceChainFact) -> List[Edge]:
+    """Return the ``(upstream, downstream)`` batch edges a step describes."""
+
+    edges = []
+    if step.prev_step_id:
+        edges.append((step.prev_step_id, step.batch_id))
+    if step.next_step_id:
+        edges.append((step.batch_id, step.next_step_id))
+    return edges
+
+
+def _ensure_nodes(batch_ids: Iterable[str]) -> None:
+    ProcTraceLineageFact.objects.bulk_create(
+        [
+            ProcTraceLineageFact(ancestor_batch_id=b, descendant_batch_id=b, depth=0)
+            for b in set(batch_ids)
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def add_edge(upstream: str, downstream: str) -> int:
+    """Record ``upstream -> downstream`` and return the number of new pairs."""
+
+    with transaction.atomic():
+        _ensure_nodes([upstream, downstream])
+        ancestors = dict(
+            ProcTraceLineageFact.objects.filter(descendant_batch_id=upstream)
+            .values_list("ancestor_batch_id", "depth")
+        )
+        descendants = dict(
+            ProcTraceLineageFact.objects.filter(ancestor_batch_id=downstream)
+            .values_list("descendant_batch_id", "depth")
+        )
+        candidates = {
+            (a, d): a_depth + d_depth + 1
+            for a, a_depth in ancestors.items()
+            for d, d_depth in descendants.items()
+            if a != d
+        }
+        if not candidates:
+            return 0
+
+        existing = {
+            (row.ancestor_batch_id, row.descendant_batch_id): row
+            for row in ProcTraceLineageFact.objects.filter(
+                ancestor_batch_id__in=ancestors, descendant_batch_id__in=descendants
+            )
+        }
+        shorter = []
+        for pair, row in existing.items():
+            depth = candidates.get(pair)
+            if depth is not None and depth < row.depth:
+                row.depth = depth
+                shorter.append(row)
+        if shorter:
+            ProcTraceLineageFact.objects.bulk_update(shorter, ["depth"], batch_size=WRITE_BATCH_SIZE)
+
+        new_rows = [
+            ProcTraceLineageFact(ancestor_batch_id=a, descendant_batch_id=d, depth=depth)
+            for (a, d), depth in candidates.items()
+            if (a, d) not in existing
+        ]
+        ProcTraceLineageFact.objects.bulk_create(
+            new_rows, batch_size=WRITE_BATCH_SIZE, ignore_conflicts=True
+        )
+        mark_models_stale(ProcTraceLineageFact)
+        return len(new_rows)
+
+
+def index_trace_steps(steps: Iterable[ProcTraceChainFact]) -> int:
+    """Add the edges of ``steps`` to the closure table.
+
+    Call this after ``bulk_create`` of trace steps, which bypasses the
+    ``post_save`` hook that indexes single saves.
+    """
+
+    added = 0
+    for step in steps:
+        if not step_edges(step):
+            _ensure_nodes([step.batch_id])
+        for upstream, downstream in step_edges(step):
+            added += add_edge(upstream, downstream)
+    return added
+
+
+def get_lineage(batch_id: str) -> Lineage:
+    """Return the full lineage of ``batch_id`` using one query."""
+
+    lineage = Lineage(batch_id)
+    rows = ProcTraceLineageFact.objects.filter(
+        Q(ancestor_batch_id=batch_id) | Q(descendant_batch_id=batch_id), depth__gt=0
+    ).values_list("ancestor_batch_id", "descendant_batch_id", "depth")
+    for ancestor, descendant, depth in rows:
+        if descendant == batch_id:
+            lineage.upstream[ancestor] = depth
+        if ancestor == batch_id:
+            lineage.downstream[descendant] = depth
+    return lineage
+
+
+def lineage_steps(batch_id: str):
+    """Queryset of every trace step in the lineage of ``batch_id``.
+
+    The closure lookup is a subquery, so evaluating the result costs one query.
+    """
+
+    related = ProcTraceLineageFact.objects.filter(
+        Q(ancestor_batch_id=batch_id) | Q(descendant_batch_id=batch_id)
+    )
+    return ProcTraceChainFact.objects.filter(
+        Q(batch_id__in=related.values("ancestor_batch_id"))
+        | Q(batch_id__in=related.values("descendant_batch_id"))
+    ).order_by("timestamp", "trace_id")
+
+
+def rebuild_lineage() -> int:
+    """Recompute the closure table from every stored trace step."""
+
+    children: Dict[str, Set[str]] = defaultdict(set)
+    nodes: Set[str] = set()
+    steps = ProcTraceChainFact.objects.values_list("batch_id", "prev_step_id", "next_step_id")
+    for batch_id, prev_step_id, next_step_id in steps.iterator():
+        nodes.add(batch_id)
+        if prev_step_id:
+            nodes.add(prev_step_id)
+            children[prev_step_id].add(batch_id)
+        if next_step_id:
+            nodes.add(next_step_id)
+            children[batch_id].add(next_step_id)
+
+    written = 0
+    with transaction.atomic():
+        ProcTraceLineageFact.objects.all().delete()
+        for root in nodes:
+            # Breadth-first search gives shortest hop counts from ``root``.
+            depths = {root: 0}
+            queue = deque([root])
+            while queue:
+                node = queue.popleft()
+                for child in children.get(node, ()):
+                    if child not in depths:
+                        depths[child] = depths[node] + 1
+                        queue.append(child)
+            ProcTraceLineageFact.objects.bulk_create(
+                [
+                    ProcTraceLineageFact(ancestor_batch_id=root, descendant_batch_id=d, depth=depth)
+                    for d, depth in depths.items()
+                ],
+                batch_size=WRITE_BATCH_SIZE,
+            )
+            written += len(depths)
+        mark_models_stale(ProcTraceLineageFact)
+    return written
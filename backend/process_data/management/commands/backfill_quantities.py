@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from process_data.units import BACKFILL_CHUNK_SIZE, backfill_normalized_quantities
+
+
+class Command(BaseCommand):
+    help = "Fill ProcInventoryFact.normalized_quantity_kg from unit mappings in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Recompute rows that already have a value.")
+        parser.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        stats = backfill_normalized_quantities(
+            only_missing=not options["all"], chunk_size=options["chunk_size"]
+        )
+        self.stdout.write(
+            f"Normalized {stats.updated} of {stats.rows} rows; {stats.unconvertible} unconvertible"
+        )
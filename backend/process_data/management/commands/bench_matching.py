@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from process_data.matching import PRIORITIES, OrderBook, fills_digest, synthetic_market
+
+
+class Command(BaseCommand):
+    help = "Replay a seeded synthetic market through the in-memory order book."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--listings", type=int, default=20000)
+        parser.add_argument("--orders", type=int, default=100000)
+        parser.add_argument("--materials", type=int, default=50)
+        parser.add_argument("--priority", choices=PRIORITIES, default="price")
+
+    def handle(self, *args, **options):
+        listings, orders = synthetic_market(
+            options["seed"], options["listings"], options["orders"], options["materials"]
+        )
+
+        started = time.perf_counter()
+        book = OrderBook(options["priority"])
+        for listing in listings:
+            book.add(listing)
+        loaded = time.perf_counter()
+        results = book.match_all(orders)
+        finished = time.perf_counter()
+
+        matched = sum(result.matched for result in results)
+        fills = sum(len(result.fills) for result in results)
+        match_secs = finished - loaded
+        self.stdout.write(
+            f"loaded {len(listings)} listings in {loaded - started:.3f}s; "
+            f"matched {len(orders)} orders ({fills} fills, {matched:.0f} kg) in {match_secs:.3f}s "
+            f"= {len(orders) / match_secs if match_secs else 0:.0f} orders/sec"
+        )
+        self.stdout.write(f"digest {fills_digest(results)}")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from process_data.lineage import rebuild_lineage
+
+
+class Command(BaseCommand):
+    help = "Rebuild the ProcTraceLineageFact closure table from all trace steps."
+
+    def handle(self, *args, **options):
+        written = rebuild_lineage()
+        self.stdout.write(f"Wrote {written} lineage rows")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from process_data.trace_hashing import DEFAULT_CHUNK_SIZE, verify_all_paths
+
+
+class Command(BaseCommand):
+    help = "Recompute trace chain Merkle roots and check stored step and path hashes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help="Batches verified per round of queries.",
+        )
+
+    def handle(self, *args, **options):
+        report = verify_all_paths(chunk_size=options["chunk_size"])
+        for failure in report.failures:
+            self.stderr.write(failure)
+        self.stdout.write(
+            f"Verified {report.steps} steps in {report.batches} batches and "
+            f"{report.inventory_traces} inventory traces: {report.failure_count} failures, "
+            f"{report.unhashed_steps} unhashed steps"
+        )
+        if not report.ok:
+            raise CommandError("Trace hash verification failed")
@@ -0,0 +1,177 @@
+"""Loading of manual stage inputs into ``ProcInventoryFact``.
+
+A ``RawInputManualFact`` records a quantity entered by hand at a facility.
+Its ``values_json`` carries the inventory details::
+
+    {"batch_id": "B-17", "quantity": 120, "unit": "bale",
+     "unit_mapping_id": 4, "status": "in_stock"}
+
+``quantity`` (or ``quantity_kg``) and ``batch_id`` are required; ``unit``
+defaults to kilograms and ``status`` to ``in_stock``.  ``unit_mapping_id``
+is optional but must name an existing ``RawUnitMappingDim``.  Inputs
+without the required values or with an unknown mapping are counted as
+rejected; an inventory row loaded from them before they were corrected is
+removed.
+
+:func:`remove_manual_inputs` removes the inventory of deleted inputs.
+Removing inventory recomputes the emissions of the facility-days it was on,
+drops credit grants left without emissions and refreshes the batch
+summaries.
+
+Rows are upserted on ``ProcInventoryFact.source_input_id``, so loading the
+same inputs again rewrites their inventory rows instead of duplicating
+them.  ``normalized_quantity_kg`` is left to ``backfill_normalized_quantities``
+like every other bulk write.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from typing import Any, Dict, Iterable, Optional, Set
+
+from django.db import transaction
+
+from main.caching import mark_models_stale
+from output_data.credits import drop_emptied_grants
+from output_data.rollups import refresh_batch_summaries
+from raw_data.archive import query_archive
+from raw_data.models import RawInputManualFact, RawUnitMappingDim
+
+from .emissions import compute_emissions
+from .models import ProcInventoryFact
+
+DEFAULT_STATUS = "in_stock"
+WRITE_BATCH_SIZE = 2000
+
+UPSERT_FIELDS = [
+    "facility",
+    "material",
+    "batch_id",
+    "quantity_kg",
+    "custom_unit",
+    "unit_mapping",
+    "status",
+    "timestamp",
+    # Reset so the next backfill converts the reloaded quantity.
+    "normalized_quantity_kg",
+]
+
+
+@dataclass
+class ManualLoadStats:
+    read: int = 0
+    loaded: int = 0
+    rejected: int = 0
+    removed: int = 0
+
+
+def _inventory_row(input_id: int, facility_id: int, material_id: int, timestamp, values: Any) -> Optional[ProcInventoryFact]:
+    if not isinstance(values, dict):
+        return None
+    batch_id = str(values.get("batch_id") or "").strip()
+    quantity = values.get("quantity", values.get("quantity_kg"))
+    try:
+        quantity = float(quantity)
+    except (TypeError, ValueError):
+        return None
+    if not batch_id or len(batch_id) > 255 or quantity != quantity:
+        return None
+    mapping_id = values.get("unit_mapping_id")
+    # bool is an int subclass; ``true`` is no mapping id.
+    if mapping_id is not None and (isinstance(mapping_id, bool) or not isinstance(mapping_id, int)):
+        return None
+    return ProcInventoryFact(
+        source_input_id=input_id,
+        facility_id=facility_id,
+        material_id=material_id,
+        batch_id=batch_id,
+        quantity_kg=quantity,
+        custom_unit=str(values.get("unit") or "")[:100],
+        unit_mapping_id=mapping_id,
+        status=str(values.get("status") or DEFAULT_STATUS)[:100],
+        timestamp=timestamp,
+    )
+
+
+def load_manual_inputs(queryset=None) -> ManualLoadStats:
+    """Upsert inventory rows for the manual inputs in ``queryset``."""
+
+    if queryset is None:
+        queryset = RawInputManualFact.objects.all()
+    stats = ManualLoadStats()
+    rows: Dict[int, ProcInventoryFact] = {}
+    rejected: Set[int] = set()
+    for input_id, facility_id, material_id, timestamp, values in queryset.values_list(
+        "input_id", "facility_id", "material_id", "timestamp", "values_json"
+    ).iterator():
+        stats.read += 1
+        row = _inventory_row(input_id, facility_id, material_id, timestamp, values)
+        if row is None:
+            rejected.add(input_id)
+        else:
+            rows[input_id] = row
+
+    mapping_ids = {row.unit_mapping_id for row in rows.values() if row.unit_mapping_id is not None}
+    if mapping_ids:
+        known = set(RawUnitMappingDim.objects.filter(pk__in=mapping_ids).values_list("pk", flat=True))
+        for input_id, row in list(rows.items()):
+            if row.unit_mapping_id is not None and row.unit_mapping_id not in known:
+                del rows[input_id]
+                rejected.add(input_id)
+    stats.rejected = len(rejected)
+
+    batch_ids = {row.batch_id for row in rows.values()}
+    with transaction.atomic():
+        # A reloaded input may have moved to another batch; refresh both.
+        batch_ids.update(
+            ProcInventoryFact.objects.filter(source_input_id__in=queryset.values("input_id")).values_list(
+                "batch_id", flat=True
+            )
+        )
+        ProcInventoryFact.objects.bulk_create(
+            list(rows.values()),
+            batch_size=WRITE_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["source_input_id"],
+            update_fields=UPSERT_FIELDS,
+        )
+        mark_models_stale(ProcInventoryFact)
+        if rejected:
+            stats.removed = _remove_inventory(ProcInventoryFact.objects.filter(source_input_id__in=rejected))
+        refresh_batch_summaries(batch_ids)
+    stats.loaded = len(rows)
+    return stats
+
+
+def remove_manual_inputs(input_ids: Iterable[int]) -> int:
+    """Remove the inventory loaded from the deleted inputs ``input_ids``.
+
+    Inputs moved to the archive (``raw_data.archive``) also left the table
+    but keep their inventory.  Returns the inventory rows removed.
+    """
+
+    input_ids = set(input_ids) - set(RawInputManualFact.objects.filter(pk__in=input_ids).values_list("pk", flat=True))
+    if input_ids:
+        archived = query_archive("manual", columns=["input_id"], input_id__in=sorted(input_ids))["input_id"]
+        input_ids -= set(archived.tolist())
+    if not input_ids:
+        return 0
+    with transaction.atomic():
+        removed = _remove_inventory(ProcInventoryFact.objects.filter(source_input_id__in=input_ids))
+    return removed
+
+
+def _remove_inventory(queryset) -> int:
+    # Runs inside the caller's transaction.
+    found = list(queryset.values_list("inventory_id", "facility_id", "batch_id", "timestamp"))
+    if not found:
+        return 0
+    ProcInventoryFact.objects.filter(pk__in=[row[0] for row in found]).delete()
+    mark_models_stale(ProcInventoryFact)
+    days = {(facility_id, timestamp.astimezone(dt_timezone.utc).date()) for _, facility_id, _, timestamp in found}
+    for facility_id, day in sorted(days):
+        start = datetime.combine(day, dt_time.min, tzinfo=dt_timezone.utc)
+        compute_emissions(start, start + timedelta(days=1), facility_ids=[facility_id])
+    batch_ids = {row[2] for row in found}
+    drop_emptied_grants(batch_ids)
+    refresh_batch_summaries(batch_ids)
+    return len(found)
@@ -0,0 +1,351 @@
+"""Order book matching of marketplace demand against open supply.
+
+Open ``RawMarketplaceListingFact`` rows are loaded once into a heap per
+material, ordered by price (the listing's ``offer_price`` from
+``OutMarketplaceActiveListingFact``, unpriced listings last) or by listing
+time.  Outstanding ``RawOrderSubmissionFact`` rows are then matched in
+submission order in one pass: each order consumes the best listings for its
+``material_ids`` until it is filled or supply runs out.  Fills are written as
+``ProcOrderFulfillmentFact`` rows in bulk, together with the remaining listing
+quantities.
+
+An order is outstanding while its matched quantity is below ``quantity_kg``,
+so partially filled orders pick up new supply on later runs.
+
+A run is one transaction that locks the open listings it loads
+(``select_for_update``) before reading the outstanding orders.  The remaining
+quantities written back are computed from that snapshot, so a concurrent run,
+or any other write to those listings, waits for the commit instead of being
+overwritten by it, and the second run sees the first one's fills.
+
+:class:`OrderBook` has no database dependency; ``bench_matching`` drives it
+with seeded synthetic data to measure throughput.
+"""
+
+import hashlib
+import heapq
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.db import transaction
+from django.db.models import F, FloatField, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from main.caching import mark_models_stale
+from raw_data.models import RawMarketplaceListingFact, RawOrderSubmissionFact
+
+from .models import ProcOrderFulfillmentFact
+
+OPEN_STATUS = "open"
+FILLED_STATUS = "filled"
+PRIORITIES = ("price", "time")
+ORDER_CHUNK_SIZE = 5000
+WRITE_BATCH_SIZE = 2000
+
+# Quantities below this are treated as zero to absorb float residue.
+EPSILON = 1e-9
+
+
+@dataclass
+class Listing:
+    listing_id: int
+    facility_id: int
+    material_id: int
+    quantity: float
+    price: Optional[float]
+    timestamp: float
+
+
+@dataclass
+class Order:
+    order_id: int
+    material_ids: Sequence[int]
+    quantity: float
+    timestamp: float
+
+
+@dataclass
+class Fill:
+    order_id: int
+    listing_id: int
+    material_id: int
+    facility_id: int
+    quantity: float
+    listing_remaining: float
+
+
+@dataclass
+class OrderResult:
+    order: Order
+    fills: List[Fill] = field(default_factory=list)
+
+    @property
+    def matched(self) -> float:
+        return sum(fill.quantity for fill in self.fills)
+
+    @property
+    def remaining(self) -> float:
+        return max(self.order.quantity - self.matched, 0.0)
+
+
+class OrderBook:
+    """Per-material heaps of listings ordered by ``priority``."""
+
+    def __init__(self, priority: str = "price") -> None:
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of {PRIORITIES}")
+        self.priority = priority
+        self._books: Dict[int, List[Tuple[float, float, int, Listing]]] = {}
+
+    def _key(self, listing: Listing) -> Tuple[float, float]:
+        price = listing.price if listing.price is not None else math.inf
+        if self.priority == "price":
+            return price, listing.timestamp
+        return listing.timestamp, price
+
+    def add(self, listing: Listing) -> None:
+        if listing.quantity <= EPSILON:
+            return
+        first, second = self._key(listing)
+        heapq.heappush(
+            self._books.setdefault(listing.material_id, []),
+            (first, second, listing.listing_id, listing),
+        )
+
+    def depth(self, material_id: int) -> float:
+        return sum(entry[3].quantity for entry in self._books.get(material_id, ()))
+
+    def match(self, order: Order) -> OrderResult:
+        result = OrderResult(order)
+        remaining = order.quantity
+        for material_id in order.material_ids:
+            book = self._books.get(material_id)
+            while book and remaining > EPSILON:
+                listing = book[0][3]
+                take = min(remaining, listing.quantity)
+                listing.quantity -= take
+                remaining -= take
+                if listing.quantity <= EPSILON:
+                    listing.quantity = 0.0
+                    heapq.heappop(book)
+                result.fills.append(
+                    Fill(
+                        order_id=order.order_id,
+                        listing_id=listing.listing_id,
+                        material_id=material_id,
+                        facility_id=listing.facility_id,
+                        quantity=take,
+                        listing_remaining=listing.quantity,
+                    )
+                )
+            if remaining <= EPSILON:
+                break
+        return result
+
+    def match_all(self, orders: Iterable[Order]) -> List[OrderResult]:
+        return [self.match(order) for order in orders]
+
+
+@dataclass
+class MatchingStats:
+    orders: int = 0
+    filled: int = 0
+    partial: int = 0
+    unmatched: int = 0
+    fills: int = 0
+    quantity_matched_kg: float = 0.0
+    elapsed: float = 0.0
+
+    @property
+    def orders_per_sec(self) -> float:
+        return self.orders / self.elapsed if self.elapsed else 0.0
+
+    def record(self, result: OrderResult) -> None:
+        self.orders += 1
+        self.fills += len(result.fills)
+        self.quantity_matched_kg += result.matched
+        if not result.fills:
+            self.unmatched += 1
+        elif result.remaining > EPSILON:
+            self.partial += 1
+        else:
+            self.filled += 1
+
+
+def load_order_book(priority: str = "price") -> Tuple[OrderBook, Dict[int, Listing]]:
+    """Build an order book from all open listings, locking them until the
+    surrounding transaction ends.
+    """
+
+    book = OrderBook(priority)
+    listings: Dict[int, Listing] = {}
+    rows = (
+        RawMarketplaceListingFact.objects.filter(status=OPEN_STATUS, quantity__gt=0)
+        .select_for_update(of=("self",))
+        .values_list(
+            "listing_id",
+            "facility_id",
+            "material_id",
+            "quantity",
+            "outmarketplaceactivelistingfact__offer_price",
+            "timestamp",
+        )
+        .iterator()
+    )
+    for listing_id, facility_id, material_id, quantity, price, timestamp in rows:
+        listing = Listing(listing_id, facility_id, material_id, quantity, price, timestamp.timestamp())
+        listings[listing_id] = listing
+        book.add(listing)
+    return book, listings
+
+
+def outstanding_orders():
+    """Orders whose matched quantity is still below the requested quantity."""
+
+    return (
+        RawOrderSubmissionFact.objects.annotate(
+            matched=Coalesce(
+                Sum("procorderfulfillmentfact__quantity_matched_kg"),
+                Value(0.0),
+                output_field=FloatField(),
+            )
+        )
+        .filter(matched__lt=F("quantity_kg"))
+        .order_by("timestamp", "order_id")
+    )
+
+
+def _persist(results: List[OrderResult], listings: Dict[int, Listing], already: Dict[int, float]) -> None:
+    now = timezone.now()
+    rows = []
+    touched = {}
+    for result in results:
+        if not result.fills:
+            continue
+        total = already.get(result.order.order_id, 0.0) + result.order.quantity
+        status = "partial" if result.remaining > EPSILON else "filled"
+        for fill in result.fills:
+            touched[fill.listing_id] = listings[fill.listing_id]
+            rows.append(
+                ProcOrderFulfillmentFact(
+                    order_id=fill.order_id,
+                    material_id=fill.material_id,
+                    facility_id=fill.facility_id,
+                    listing_id=fill.listing_id,
+                    quantity_required_kg=total,
+                    quantity_matched_kg=fill.quantity,
+                    order_fulfillment_status=status,
+                    risk_reason="insufficient supply" if status == "partial" else "",
+                    stock_status="depleted" if fill.listing_remaining <= EPSILON else "available",
+                    updated_at=now,
+                )
+            )
+
+    updates = []
+    for listing_id, listing in touched.items():
+        updates.append(
+            RawMarketplaceListingFact(
+                listing_id=listing_id,
+                quantity=listing.quantity,
+                status=FILLED_STATUS if listing.quantity <= EPSILON else OPEN_STATUS,
+            )
+        )
+    with transaction.atomic():
+        ProcOrderFulfillmentFact.objects.bulk_create(rows, batch_size=WRITE_BATCH_SIZE)
+        RawMarketplaceListingFact.objects.bulk_update(
+            updates, ["quantity", "status"], batch_size=WRITE_BATCH_SIZE
+        )
+        mark_models_stale(ProcOrderFulfillmentFact, RawMarketplaceListingFact)
+
+
+def run_matching(priority: str = "price", chunk_size: int = ORDER_CHUNK_SIZE) -> MatchingStats:
+    """Match every outstanding order against open listings and persist fills."""
+
+    stats = MatchingStats()
+    started = time.perf_counter()
+    with transaction.atomic():
+        book, listings = load_order_book(priority)
+
+        orders = outstanding_orders().values_list(
+            "order_id", "material_ids", "quantity_kg", "timestamp", "matched"
+        )
+        # Materialise the queue first: fills written per chunk would otherwise
+        # change the aggregate the cursor is still reading.
+        queue = [
+            (
+                Order(order_id, _material_ids(material_ids), quantity - matched, timestamp.timestamp()),
+                matched,
+            )
+            for order_id, material_ids, quantity, timestamp, matched in orders
+        ]
+        for start in range(0, len(queue), chunk_size):
+            chunk = queue[start:start + chunk_size]
+            results = book.match_all(order for order, _ in chunk)
+            for result in results:
+                stats.record(result)
+            _persist(results, listings, {order.order_id: matched for order, matched in chunk})
+
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def _material_ids(value) -> List[int]:
+    if isinstance(value, (list, tuple)):
+        candidates = value
+    elif value is None:
+        candidates = []
+    else:
+        candidates = [value]
+    ids = []
+    for candidate in candidates:
+        try:
+            ids.append(int(candidate))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def synthetic_market(
+    seed: int,
+    listings: int,
+    orders: int,
+    materials: int,
+) -> Tuple[List[Listing], List[Order]]:
+    """Deterministic listings and orders for benchmarking the book."""
+
+    rng = random.Random(seed)
+    supply = [
+        Listing(
+            listing_id=i,
+            facility_id=rng.randrange(100),
+            material_id=rng.randrange(materials),
+            quantity=rng.uniform(100, 5000),
+            price=round(rng.uniform(0.2, 3.0), 2),
+            timestamp=float(i),
+        )
+        for i in range(listings)
+    ]
+    demand = [
+        Order(
+            order_id=i,
+            material_ids=rng.sample(range(materials), k=min(materials, rng.randint(1, 3))),
+            quantity=rng.uniform(50, 2000),
+            timestamp=float(i),
+        )
+        for i in range(orders)
+    ]
+    return supply, demand
+
+
+def fills_digest(results: Iterable[OrderResult]) -> str:
+    """Stable digest of the fills, for comparing benchmark replays."""
+
+    digest = hashlib.sha256()
+    for result in results:
+        for fill in result.fills:
+            digest.update(f"{fill.order_id}:{fill.listing_id}:{fill.quantity:.6f};".encode())
+    return digest.hexdigest()
@@ -0,0 +1,177 @@
+"""Merkle mountain range primitives.
+
+A Merkle mountain range (MMR) is an append-only list of perfect binary Merkle
+trees ("peaks") whose sizes follow the binary digits of the leaf count.
+Appending a leaf only merges the rightmost peaks, so it touches O(log n) nodes,
+and an inclusion proof is the sibling path up to the leaf's peak plus the
+list of peak hashes.  The root is the peaks folded right to left.
+
+Nodes are addressed by ``(level, position)``: leaves are level 0 and the
+parent of ``(level, p)`` is ``(level + 1, p // 2)``.  Hashes are hex SHA-256
+digests with distinct prefixes for leaves and interior nodes.
+
+This module is storage-agnostic; ``process_data.trace_hashing`` persists MMRs
+for trace chains.
+"""
+
+import hashlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+Position = Tuple[int, int]
+Node = Tuple[int, int, str]
+
+EMPTY_ROOT = hashlib.sha256(b"").hexdigest()
+
+
+def leaf_hash(data: bytes) -> str:
+    return hashlib.sha256(b"\x00" + data).hexdigest()
+
+
+def node_hash(left: str, right: str) -> str:
+    return hashlib.sha256(b"\x01" + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def bag_peaks(peaks: Sequence[str]) -> str:
+    """Fold peak hashes right to left into a single root."""
+
+    if not peaks:
+        return EMPTY_ROOT
+    root = peaks[-1]
+    for peak in reversed(peaks[:-1]):
+        root = node_hash(peak, root)
+    return root
+
+
+def append_leaf(size: int, peaks: Sequence[str], leaf: str) -> Tuple[List[str], List[Node]]:
+    """Append ``leaf`` to an MMR of ``size`` leaves with the given peaks.
+
+    Returns the new peaks and the ``(level, position, hash)`` nodes created.
+    Only the current peaks are needed, since they are exactly the left
+    siblings merged while carrying.
+    """
+
+    peaks = list(peaks)
+    level, position, current = 0, size, leaf
+    created = [(level, position, current)]
+    while position & 1:
+        current = node_hash(peaks.pop(), current)
+        level += 1
+        position >>= 1
+        created.append((level, position, current))
+    peaks.append(current)
+    return peaks, created
+
+
+def peak_positions(size: int) -> List[Position]:
+    """Return the ``(level, position)`` of each peak, left to right."""
+
+    result = []
+    offset = 0
+    for level in reversed(range(size.bit_length())):
+        if size >> level & 1:
+            result.append((level, offset >> level))
+            offset += 1 << level
+    return result
+
+
+def _leaf_peak(leaf_index: int, size: int) -> Tuple[int, int]:
+    if not 0 <= leaf_index < size:
+        raise IndexError(f"leaf {leaf_index} out of range for size {size}")
+    for k, (level, position) in enumerate(peak_positions(size)):
+        if position << level <= leaf_index < (position + 1) << level:
+            return k, level
+    raise AssertionError("unreachable")
+
+
+def path_positions(leaf_index: int, size: int) -> List[Position]:
+    """Positions of the siblings on the path from a leaf to its peak."""
+
+    _, peak_level = _leaf_peak(leaf_index, size)
+    return [(level, (leaf_index >> level) ^ 1) for level in range(peak_level)]
+
+
+def build_proof(
+    leaf_index: int,
+    size: int,
+    peaks: Sequence[str],
+    get_node: Callable[[int, int], str],
+) -> Dict[str, Any]:
+    """Build a JSON-serialisable inclusion proof for ``leaf_index``."""
+
+    peak_index, _ = _leaf_peak(leaf_index, size)
+    return {
+        "leaf_index": leaf_index,
+        "size": size,
+        "path": [get_node(level, position) for level, position in path_positions(leaf_index, size)],
+        "peaks": list(peaks),
+        "peak_index": peak_index,
+    }
+
+
+def verify_proof(leaf: str, proof: Dict[str, Any], root: str) -> bool:
+    """Check that ``leaf`` is included in the MMR whose root is ``root``."""
+
+    try:
+        leaf_index = proof["leaf_index"]
+        size = proof["size"]
+        path = proof["path"]
+        peaks = proof["peaks"]
+        peak_index = proof["peak_index"]
+        expected_peak, peak_level = _leaf_peak(leaf_index, size)
+        if (
+            peak_index != expected_peak
+            or len(path) != peak_level
+            or len(peaks) != len(peak_positions(size))
+        ):
+            return False
+    except (KeyError, TypeError, IndexError):
+        return False
+
+    current = leaf
+    position = leaf_index
+    try:
+        for sibling in path:
+            current = node_hash(sibling, current) if position & 1 else node_hash(current, sibling)
+            position >>= 1
+        return peaks[peak_index] == current and bag_peaks(peaks) == root
+    except (ValueError, TypeError):
+        # A sibling or peak that is not a hex string.
+        return False
+
+
+class MerkleMountainRange:
+    """In-memory MMR.
+
+    With ``keep_nodes=False`` only the peaks are retained, which is all that
+    is needed to compute the root of a stream of leaves in O(log n) memory.
+    """
+
+    def __init__(self, keep_nodes: bool = True) -> None:
+        self.size = 0
+        self.peaks: List[str] = []
+        self.nodes: Optional[Dict[Position, str]] = {} if keep_nodes else None
+
+    @classmethod
+    def from_leaves(cls, leaves: Iterable[str], keep_nodes: bool = True) -> "MerkleMountainRange":
+        mmr = cls(keep_nodes=keep_nodes)
+        for leaf in leaves:
+            mmr.append(leaf)
+        return mmr
+
+    def append(self, leaf: str) -> List[Node]:
+        self.peaks, created = append_leaf(self.size, self.peaks, leaf)
+        self.size += 1
+        if self.nodes is not None:
+            for level, position, value in created:
+                self.nodes[(level, position)] = value
+        return created
+
+    @property
+    def root(self) -> str:
+        return bag_peaks(self.peaks)
+
+    def proof(self, leaf_index: int) -> Dict[str, Any]:
+        if self.nodes is None:
+            raise ValueError("proofs require keep_nodes=True")
+        nodes = self.nodes
+        return build_proof(leaf_index, self.size, self.peaks, lambda lvl, pos: nodes[(lvl, pos)])
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('process_data', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='proctracechainfact',
+            name='batch_id',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='ProcTraceLineageFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ancestor_batch_id', models.CharField(max_length=255)),
+                ('descendant_batch_id', models.CharField(max_length=255)),
+                ('depth', models.PositiveIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['descendant_batch_id', 'depth'], name='proc_trace_lineage_desc_idx')],
+                'constraints': [models.UniqueConstraint(fields=('ancestor_batch_id', 'descendant_batch_id'), name='proc_trace_lineage_pair_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('process_data', '0002_trace_lineage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcTraceMerkleState',
+            fields=[
+                ('batch_id', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('leaf_count', models.PositiveIntegerField(default=0)),
+                ('peaks_json', models.JSONField(default=list)),
+                ('root_hash', models.CharField(blank=True, max_length=64)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='proctracechainfact',
+            name='merkle_leaf_index',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ProcTraceMerkleNode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=255)),
+                ('level', models.PositiveSmallIntegerField()),
+                ('position', models.PositiveIntegerField()),
+                ('hash', models.CharField(max_length=64)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('batch_id', 'level', 'position'), name='proc_trace_merkle_node_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("process_data", "0003_trace_merkle"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="procemissionscalcfact",
+            name="batch_id",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="procinventoryfact",
+            name="batch_id",
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
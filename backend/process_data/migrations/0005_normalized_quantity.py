@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("process_data", "0004_batch_summary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="procinventoryfact",
+            name="normalized_quantity_kg",
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
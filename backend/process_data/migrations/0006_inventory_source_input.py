@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("process_data", "0005_normalized_quantity"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="procinventoryfact",
+            name="source_input_id",
+            field=models.IntegerField(blank=True, null=True, unique=True),
+        ),
+    ]
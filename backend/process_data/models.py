@@ -5,21 +5,27 @@ class ProcInventoryFact(models.Model):
     inventory_id = models.AutoField(primary_key=True)
     facility = models.ForeignKey('raw_data.RawFacilityDim', on_delete=models.CASCADE)
     material = models.ForeignKey('raw_data.RawMaterialDim', on_delete=models.CASCADE)
-    batch_id = models.CharField(max_length=255)
+    batch_id = models.CharField(max_length=255, db_index=True)
     quantity_kg = models.FloatField()
+    # quantity_kg converted through custom_unit / unit_mapping; see process_data.units.
+    normalized_quantity_kg = models.FloatField(null=True, blank=True)
     custom_unit = models.CharField(max_length=100, blank=True)
     unit_mapping = models.ForeignKey('raw_data.RawUnitMappingDim', on_delete=models.CASCADE, null=True, blank=True)
     status = models.CharField(max_length=100)
     timestamp = models.DateTimeField()
+    # RawInputManualFact this row was loaded from (process_data.manual_inputs).
+    # A plain id: raw inputs are archived while their inventory stays.
+    source_input_id = models.IntegerField(null=True, blank=True, unique=True)
 
 
 class ProcTraceChainFact(models.Model):
     trace_id = models.AutoField(primary_key=True)
-    batch_id = models.CharField(max_length=255)
+    batch_id = models.CharField(max_length=255, db_index=True)
     prev_step_id = models.CharField(max_length=255, null=True, blank=True)
     next_step_id = models.CharField(max_length=255, null=True, blank=True)
     timestamp = models.DateTimeField()
     hash = models.CharField(max_length=255)
+    merkle_leaf_index = models.PositiveIntegerField(null=True, blank=True)
 
 
 class ProcProofOfGoodFact(models.Model):
@@ -34,7 +40,7 @@ class ProcProofOfGoodFact(models.Model):
 
 class ProcEmissionsCalcFact(models.Model):
     calc_id = models.AutoField(primary_key=True)
-    batch_id = models.CharField(max_length=255)
+    batch_id = models.CharField(max_length=255, db_index=True)
     process = models.ForeignKey('raw_data.RawTextileProcessDim', on_delete=models.CASCADE)
     material = models.ForeignKey('raw_data.RawMaterialDim', on_delete=models.CASCADE)
     facility = models.ForeignKey('raw_data.RawFacilityDim', on_delete=models.CASCADE)
@@ -64,3 +70,53 @@ class ProcMarketplaceStateFact(models.Model):
     state = models.CharField(max_length=100)
     timestamp = models.DateTimeField()
 
+
+class ProcTraceLineageFact(models.Model):
+    """Closure table over the batch graph described by ``ProcTraceChainFact``.
+
+    One row per ``(ancestor, descendant)`` pair reachable through trace
+    steps, with ``depth`` the shortest hop count; every batch also has a
+    ``depth=0`` row to itself.  Maintained by ``process_data.lineage``.
+    """
+
+    ancestor_batch_id = models.CharField(max_length=255)
+    descendant_batch_id = models.CharField(max_length=255)
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["ancestor_batch_id", "descendant_batch_id"],
+                name="proc_trace_lineage_pair_unique",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["descendant_batch_id", "depth"], name="proc_trace_lineage_desc_idx"),
+        ]
+
+
+class ProcTraceMerkleState(models.Model):
+    """Current Merkle mountain range summary of a batch's trace steps."""
+
+    batch_id = models.CharField(max_length=255, primary_key=True)
+    leaf_count = models.PositiveIntegerField(default=0)
+    peaks_json = models.JSONField(default=list)
+    root_hash = models.CharField(max_length=64, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class ProcTraceMerkleNode(models.Model):
+    """A node of a batch's trace Merkle mountain range, kept for proofs."""
+
+    batch_id = models.CharField(max_length=255)
+    level = models.PositiveSmallIntegerField()
+    position = models.PositiveIntegerField()
+    hash = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["batch_id", "level", "position"],
+                name="proc_trace_merkle_node_unique",
+            ),
+        ]
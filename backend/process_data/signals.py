@@ -0,0 +1,55 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from raw_data.models import RawUnitMappingDim
+
+from .lineage import EDGE_FIELDS, index_trace_steps, step_edges
+from .models import ProcInventoryFact, ProcTraceChainFact
+from .trace_hashing import append_trace_steps
+from .units import normalize_instance, reset_normalized_quantities, unit_converter
+
+
+@receiver(pre_save, sender=ProcTraceChainFact)
+def remember_trace_edges(sender, instance, update_fields=None, **kwargs):
+    # Edges as stored before an update, so unchanged steps are not re-indexed.
+    instance._stored_edges = None
+    if instance._state.adding:
+        return
+    if update_fields is not None and not set(update_fields) & set(EDGE_FIELDS):
+        instance._stored_edges = step_edges(instance)
+        return
+    stored = ProcTraceChainFact.objects.filter(pk=instance.pk).values(*EDGE_FIELDS).first()
+    if stored is not None:
+        instance._stored_edges = step_edges(ProcTraceChainFact(**stored))
+
+
+@receiver(post_save, sender=ProcTraceChainFact)
+def index_trace_step(sender, instance, created, **kwargs):
+    if created or getattr(instance, "_stored_edges", None) != step_edges(instance):
+        index_trace_steps([instance])
+    append_trace_steps([instance])
+
+
+@receiver(pre_save, sender=ProcInventoryFact)
+def normalize_quantity(sender, instance, **kwargs):
+    normalize_instance(instance)
+
+
+@receiver(pre_save, sender=RawUnitMappingDim)
+def remember_unit_label(sender, instance, **kwargs):
+    # A renamed mapping no longer matches rows under its old label.
+    instance._stored_unit = (
+        None if instance._state.adding
+        else RawUnitMappingDim.objects.filter(pk=instance.pk).values_list("custom_unit", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=RawUnitMappingDim)
+@receiver(post_delete, sender=RawUnitMappingDim)
+def invalidate_unit_mappings(sender, instance, **kwargs):
+    unit_converter.clear()
+    transaction.on_commit(unit_converter.invalidate)
+    # Rows converted through this mapping are re-normalized by the next backfill.
+    units = [instance.custom_unit, getattr(instance, "_stored_unit", None)]
+    reset_normalized_quantities(instance.mapping_id, [unit for unit in units if unit])
@@ -1,3 +1,393 @@
+from datetime import date, datetime, timezone as dt_timezone
+from unittest import mock
+
+import numpy as np
+from django.db.models import QuerySet
 from django.test import TestCase
 
-# Create your tests here.
+from main.watermarks import get_watermark
+from output_data.models import OutBatchSummaryFact
+from raw_data.factor_index import factor_index
+from raw_data.models import (
+    RawEmissionFactorDim,
+    RawFacilityDim,
+    RawFacilityProcessMapFact,
+    RawMarketplaceListingFact,
+    RawMaterialDim,
+    RawOrderSubmissionFact,
+    RawTextileProcessDim,
+    RawUnitMappingDim,
+    RawUserDim,
+)
+
+from .emissions import compute_emissions
+from .lineage import get_lineage, lineage_steps, rebuild_lineage
+from .matching import Listing, Order, OrderBook, run_matching
+from .merkle import MerkleMountainRange, leaf_hash, verify_proof
+from .models import (
+    ProcEmissionsCalcFact,
+    ProcInventoryFact,
+    ProcOrderFulfillmentFact,
+    ProcTraceChainFact,
+    ProcTraceLineageFact,
+    ProcTraceMerkleNode,
+)
+from .trace_hashing import prove_step, verify_all_paths, verify_step
+from .units import VERSION_WATERMARK, UnitConverter, backfill_normalized_quantities
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+def make_process(name):
+    return RawTextileProcessDim.objects.create(
+        process_name=name, stage="wet", energy_type="grid",
+        unit_of_measurement="kg", details_json={},
+    )
+
+
+class EmissionsEngineTests(TestCase):
+    def setUp(self):
+        self.facility = RawFacilityDim.objects.create(
+            name="Mill", location="IN", org_id="org-1", boundary_conditions_json={}
+        )
+        self.cotton = RawMaterialDim.objects.create(
+            type="Cotton", blend_ratio="100", source="farm", certifications=""
+        )
+        self.dyeing = make_process("dyeing")
+        self.spinning = make_process("spinning")
+        self.retired = make_process("retired")
+        for process, active_to in ((self.dyeing, None), (self.spinning, None), (self.retired, date(2024, 12, 31))):
+            RawFacilityProcessMapFact.objects.create(
+                facility=self.facility, process=process, default_energy_source="grid",
+                active_from=date(2024, 1, 1), active_to=active_to, scope_flag="1",
+            )
+        self.local = RawEmissionFactorDim.objects.create(
+            process=self.dyeing, material_type="cotton", factor_value=2.0, source="x", region="in"
+        )
+        self.fallback = RawEmissionFactorDim.objects.create(
+            process=self.spinning, material_type="cotton", factor_value=0.5, source="x", region="Global"
+        )
+        RawEmissionFactorDim.objects.create(
+            process=self.retired, material_type="cotton", factor_value=9.0, source="x", region="in"
+        )
+
+    def add_inventory(self, batch_id, quantity, timestamp):
+        return ProcInventoryFact.objects.create(
+            facility=self.facility, material=self.cotton, batch_id=batch_id,
+            quantity_kg=quantity, status="in_stock", timestamp=timestamp,
+        )
+
+    def test_window_is_computed_and_recomputed_idempotently(self):
+        self.add_inventory("b1", 10.0, utc(2025, 3, 2))
+        self.add_inventory("b2", 4.0, utc(2025, 3, 20))
+        self.add_inventory("b3", 100.0, utc(2025, 4, 1))
+
+        hits = factor_index.stats()["hits"]
+        stats = compute_emissions(utc(2025, 3, 1), utc(2025, 4, 1))
+
+        self.assertEqual(stats.inventory_rows, 2)
+        self.assertEqual(stats.calculated, 4)
+        self.assertEqual(factor_index.stats()["hits"], hits + 4)
+        rows = ProcEmissionsCalcFact.objects.filter(batch_id="b1")
+        by_process = {row.process_id: row for row in rows}
+        self.assertEqual(set(by_process), {self.dyeing.pk, self.spinning.pk})
+        self.assertAlmostEqual(by_process[self.dyeing.pk].emissions_kgco2, 20.0)
+        self.assertEqual(by_process[self.dyeing.pk].factor, self.local)
+        self.assertAlmostEqual(by_process[self.spinning.pk].emissions_kgco2, 5.0)
+        self.assertEqual(by_process[self.spinning.pk].factor, self.fallback)
+
+        stats = compute_emissions(utc(2025, 3, 1), utc(2025, 4, 1))
+        self.assertEqual(stats.deleted, 4)
+        self.assertEqual(ProcEmissionsCalcFact.objects.count(), 4)
+        summary = OutBatchSummaryFact.objects.get(pk="b1")
+        self.assertEqual(summary.emissions_records, 2)
+        self.assertAlmostEqual(summary.emissions_kgco2, 25.0)
+
+    def test_inventory_without_factor_is_unmatched(self):
+        wool = RawMaterialDim.objects.create(
+            type="wool", blend_ratio="100", source="farm", certifications=""
+        )
+        ProcInventoryFact.objects.create(
+            facility=self.facility, material=wool, batch_id="b9",
+            quantity_kg=1.0, status="in_stock", timestamp=utc(2025, 3, 2),
+        )
+
+        stats = compute_emissions(utc(2025, 3, 1), utc(2025, 4, 1))
+
+        self.assertEqual(stats.unmatched, 1)
+        self.assertFalse(ProcEmissionsCalcFact.objects.exists())
+
+
+class TraceLineageTests(TestCase):
+    def add_step(self, batch_id, prev=None, next=None):
+        return ProcTraceChainFact.objects.create(
+            batch_id=batch_id, prev_step_id=prev, next_step_id=next,
+            timestamp=utc(2025, 1, 1), hash="",
+        )
+
+    def setUp(self):
+        # a -> b -> c -> d, plus a side branch x -> c.
+        self.add_step("b", prev="a")
+        self.add_step("c", prev="b", next="d")
+        self.add_step("c", prev="x")
+
+    def test_full_lineage_in_one_query(self):
+        with self.assertNumQueries(1):
+            lineage = get_lineage("b")
+
+        self.assertEqual(lineage.upstream, {"a": 1})
+        self.assertEqual(lineage.downstream, {"c": 1, "d": 2})
+        self.assertEqual(get_lineage("d").upstream, {"a": 3, "b": 2, "c": 1, "x": 2})
+
+    def test_lineage_steps(self):
+        with self.assertNumQueries(1):
+            batches = {step.batch_id for step in lineage_steps("a")}
+        self.assertEqual(batches, {"b", "c"})
+
+    def test_only_new_or_relinked_steps_are_indexed(self):
+        step = ProcTraceChainFact.objects.get(batch_id="b")
+        with mock.patch("process_data.signals.index_trace_steps") as index:
+            step.timestamp = utc(2025, 1, 2)
+            step.save()
+            step.save(update_fields=["hash"])
+            index.assert_not_called()
+
+            step.next_step_id = "e"
+            step.save()
+            index.assert_called_once_with([step])
+
+    def test_rebuild_matches_incremental_index(self):
+        incremental = set(ProcTraceLineageFact.objects.values_list(
+            "ancestor_batch_id", "descendant_batch_id", "depth"
+        ))
+        rebuild_lineage()
+        rebuilt = set(ProcTraceLineageFact.objects.values_list(
+            "ancestor_batch_id", "descendant_batch_id", "depth"
+        ))
+        self.assertEqual(incremental, rebuilt)
+
+
+class MerkleMountainRangeTests(TestCase):
+    def test_every_leaf_proves_against_root(self):
+        for size in range(1, 12):
+            leaves = [leaf_hash(str(i).encode()) for i in range(size)]
+            mmr = MerkleMountainRange.from_leaves(leaves)
+            for index, leaf in enumerate(leaves):
+                proof = mmr.proof(index)
+                self.assertTrue(verify_proof(leaf, proof, mmr.root))
+                self.assertFalse(verify_proof(leaf_hash(b"other"), proof, mmr.root))
+
+    def test_malformed_proofs_do_not_verify(self):
+        leaves = [leaf_hash(str(i).encode()) for i in range(5)]
+        mmr = MerkleMountainRange.from_leaves(leaves)
+        for key, value in (("path", ["zz", mmr.proof(0)["path"][1]]), ("path", [None, 1]), ("peaks", ["zz", None])):
+            with self.subTest(key=key, value=value):
+                proof = {**mmr.proof(0), key: value}
+                self.assertFalse(verify_proof(leaves[0], proof, mmr.root))
+        self.assertFalse(verify_proof(leaves[0], {**mmr.proof(0), "path": 7}, mmr.root))
+
+    def test_peaks_only_mode_matches_full_root(self):
+        leaves = [leaf_hash(str(i).encode()) for i in range(37)]
+        full = MerkleMountainRange.from_leaves(leaves)
+        light = MerkleMountainRange.from_leaves(leaves, keep_nodes=False)
+        self.assertEqual(full.root, light.root)
+        self.assertLessEqual(len(light.peaks), 6)
+
+
+class TraceHashingTests(TestCase):
+    def setUp(self):
+        self.steps = [
+            ProcTraceChainFact.objects.create(
+                batch_id="b1", prev_step_id=f"s{i}", next_step_id=None,
+                timestamp=utc(2025, 1, 1, 0, i), hash="",
+            )
+            for i in range(5)
+        ]
+
+    def test_steps_are_hashed_incrementally(self):
+        for index, step in enumerate(self.steps):
+            step.refresh_from_db()
+            self.assertEqual(step.merkle_leaf_index, index)
+            self.assertEqual(len(step.hash), 64)
+        # 5 leaves, plus the level 1 and level 2 nodes over the first four.
+        self.assertEqual(ProcTraceMerkleNode.objects.filter(batch_id="b1").count(), 8)
+
+    def test_single_step_verification_and_tampering(self):
+        step = ProcTraceChainFact.objects.get(pk=self.steps[2].pk)
+        self.assertTrue(verify_step(step))
+        with self.assertNumQueries(2):
+            prove_step(step)
+
+        ProcTraceChainFact.objects.filter(pk=step.pk).update(next_step_id="forged")
+        step.refresh_from_db()
+        self.assertFalse(verify_step(step))
+
+    def test_bulk_verification(self):
+        report = verify_all_paths(chunk_size=1)
+        self.assertTrue(report.ok)
+        self.assertEqual(report.steps, 5)
+
+        ProcTraceChainFact.objects.filter(pk=self.steps[0].pk).update(prev_step_id="forged")
+        report = verify_all_paths()
+        self.assertFalse(report.ok)
+        self.assertEqual(report.failure_count, 2)
+
+
+class OrderBookTests(TestCase):
+    def test_price_priority_and_partial_fills(self):
+        book = OrderBook("price")
+        book.add(Listing(1, 10, 7, 50.0, 2.0, 0.0))
+        book.add(Listing(2, 11, 7, 30.0, 1.0, 1.0))
+        book.add(Listing(3, 12, 8, 10.0, None, 2.0))
+
+        first = book.match(Order(100, [7], 40.0, 0.0))
+        self.assertEqual([(f.listing_id, f.quantity) for f in first.fills], [(2, 30.0), (1, 10.0)])
+
+        second = book.match(Order(101, [7, 8], 100.0, 1.0))
+        self.assertEqual([(f.listing_id, f.quantity) for f in second.fills], [(1, 40.0), (3, 10.0)])
+        self.assertEqual(second.remaining, 50.0)
+        self.assertEqual(book.depth(7), 0)
+
+    def test_time_priority(self):
+        book = OrderBook("time")
+        book.add(Listing(1, 10, 7, 50.0, 2.0, 0.0))
+        book.add(Listing(2, 11, 7, 30.0, 1.0, 1.0))
+        result = book.match(Order(100, [7], 10.0, 0.0))
+        self.assertEqual(result.fills[0].listing_id, 1)
+
+
+class MatchingRunTests(TestCase):
+    def setUp(self):
+        self.facility = RawFacilityDim.objects.create(
+            name="Mill", location="IN", org_id="org-1", boundary_conditions_json={}
+        )
+        self.material = RawMaterialDim.objects.create(
+            type="cotton", blend_ratio="100", source="farm", certifications=""
+        )
+        self.user = RawUserDim.objects.create(org_id="org-1", role="buyer", settings_json={})
+        self.listing = RawMarketplaceListingFact.objects.create(
+            facility=self.facility, material=self.material, quantity=60.0,
+            timestamp=utc(2025, 1, 1), status="open",
+        )
+
+    def add_order(self, quantity, minute):
+        return RawOrderSubmissionFact.objects.create(
+            user=self.user, material_ids=[self.material.pk], timestamp=utc(2025, 1, 2, 0, minute),
+            quantity_kg=quantity, unit_mapping_json={},
+        )
+
+    def test_fills_are_persisted_and_partial_orders_resume(self):
+        first = self.add_order(40.0, 0)
+        second = self.add_order(50.0, 1)
+
+        stats = run_matching()
+
+        self.assertEqual((stats.filled, stats.partial), (1, 1))
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.quantity, 0)
+        self.assertEqual(self.listing.status, "filled")
+        partial = ProcOrderFulfillmentFact.objects.get(order=second)
+        self.assertEqual(partial.quantity_matched_kg, 20.0)
+        self.assertEqual(partial.order_fulfillment_status, "partial")
+        self.assertEqual(ProcOrderFulfillmentFact.objects.get(order=first).stock_status, "available")
+
+        RawMarketplaceListingFact.objects.create(
+            facility=self.facility, material=self.material, quantity=100.0,
+            timestamp=utc(2025, 1, 3), status="open",
+        )
+        stats = run_matching()
+        self.assertEqual((stats.orders, stats.filled), (1, 1))
+        fills = ProcOrderFulfillmentFact.objects.filter(order=second).order_by("id")
+        self.assertEqual([f.quantity_matched_kg for f in fills], [20.0, 30.0])
+        self.assertEqual(run_matching().orders, 0)
+
+    def test_open_listings_are_locked_for_the_run(self):
+        # SQLite ignores FOR UPDATE, so check the listing query asks for it.
+        self.add_order(10.0, 0)
+        locked = []
+        select_for_update = QuerySet.select_for_update
+
+        def spy(queryset, *args, **kwargs):
+            locked.append((queryset.model, kwargs))
+            return select_for_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, "select_for_update", spy):
+            self.assertEqual(run_matching().filled, 1)
+        self.assertEqual(locked, [(RawMarketplaceListingFact, {"of": ("self",)})])
+
+
+class UnitConversionTests(TestCase):
+    def setUp(self):
+        self.facility = RawFacilityDim.objects.create(
+            name="Mill", location="IN", org_id="org-1", boundary_conditions_json={}
+        )
+        self.cotton = RawMaterialDim.objects.create(
+            type="cotton", blend_ratio="100", source="farm", certifications=""
+        )
+        self.bale = RawUnitMappingDim.objects.create(
+            custom_unit="Bale", kg_equivalent=218.0, description="cotton bale"
+        )
+        self.converter = UnitConverter(check_interval=0)
+
+    def add_inventory(self, quantity, custom_unit="", unit_mapping=None):
+        return ProcInventoryFact.objects.create(
+            facility=self.facility, material=self.cotton, batch_id="b1", quantity_kg=quantity,
+            custom_unit=custom_unit, unit_mapping=unit_mapping, status="in_stock",
+            timestamp=utc(2025, 1, 1),
+        )
+
+    def test_vectorized_conversion(self):
+        # Between version checks conversions never reach the database.
+        self.converter.check_interval = 60
+        self.converter.tables()
+        with self.assertNumQueries(0):
+            kg = self.converter.to_kg(
+                [2, 3, 500, 1, 4],
+                units=["bale", "", "g", "parsec", None],
+                mapping_ids=[None, None, None, None, self.bale.pk],
+            )
+        self.assertEqual(kg[:3].tolist(), [436.0, 3.0, 0.5])
+        self.assertTrue(np.isnan(kg[3]))
+        self.assertEqual(kg[4], 872.0)
+
+    def test_rows_are_normalized_on_save_and_backfilled(self):
+        saved = self.add_inventory(2, custom_unit="bale")
+        self.assertEqual(saved.normalized_quantity_kg, 436.0)
+
+        ProcInventoryFact.objects.bulk_create([
+            ProcInventoryFact(
+                facility=self.facility, material=self.cotton, batch_id="b2", quantity_kg=quantity,
+                custom_unit=unit, status="in_stock", timestamp=utc(2025, 1, 1),
+            )
+            for quantity, unit in [(1, "t"), (5, "kg"), (7, "crate")]
+        ])
+        stats = backfill_normalized_quantities(chunk_size=2, converter=self.converter)
+        self.assertEqual((stats.rows, stats.updated, stats.unconvertible), (3, 2, 1))
+        normalized = ProcInventoryFact.objects.filter(batch_id="b2").order_by("quantity_kg")
+        self.assertEqual(
+            list(normalized.values_list("normalized_quantity_kg", flat=True)), [1000.0, 5.0, None]
+        )
+
+    def test_mapping_change_resets_dependent_rows(self):
+        row = self.add_inventory(1, unit_mapping=self.bale)
+        self.bale.kg_equivalent = 200.0
+        self.bale.save()
+        row.refresh_from_db()
+        self.assertIsNone(row.normalized_quantity_kg)
+        backfill_normalized_quantities(converter=self.converter)
+        row.refresh_from_db()
+        self.assertEqual(row.normalized_quantity_kg, 200.0)
+
+    def test_renamed_mapping_resets_rows_under_the_old_label(self):
+        row = self.add_inventory(2, custom_unit="bale")
+        self.assertEqual(row.normalized_quantity_kg, 436.0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bale.custom_unit = "Cotton bale"
+            self.bale.save()
+        row.refresh_from_db()
+        self.assertIsNone(row.normalized_quantity_kg)
+        # The version other processes compare against lives in the database.
+        self.assertEqual(UnitConverter.shared_version(), get_watermark(VERSION_WATERMARK))
+        self.assertGreater(UnitConverter.shared_version(), 0)
@@ -0,0 +1,221 @@
+"""Merkle hashing of trace chains.
+
+Every trace step is a leaf in its batch's Merkle mountain range (see
+``process_data.merkle``).  ``ProcTraceChainFact.hash`` holds the step's leaf
+hash, ``ProcTraceMerkleState`` the batch's peaks and root, and
+``ProcTraceMerkleNode`` the interior nodes needed for inclusion proofs.
+``OutInventoryTraceFact.path_hash`` mirrors the root of its batch.
+
+Appending a step reads the batch state, writes the O(log n) nodes it creates
+and updates the state, independent of how long the chain already is.
+Verifying a single step needs its sibling path only, and
+:func:`verify_all_paths` streams every stored chain with memory bounded by
+``chunk_size`` batches.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import timezone as dt_timezone
+from functools import reduce
+from itertools import groupby
+from operator import or_
+from typing import Any, Dict, Iterable, List
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from main.caching import mark_models_stale
+
+from .merkle import (
+    MerkleMountainRange,
+    append_leaf,
+    bag_peaks,
+    build_proof,
+    leaf_hash,
+    path_positions,
+    verify_proof,
+)
+from .models import ProcTraceChainFact, ProcTraceMerkleNode, ProcTraceMerkleState
+
+MAX_REPORTED_FAILURES = 100
+DEFAULT_CHUNK_SIZE = 500
+
+
+def step_leaf(batch_id: str, prev_step_id, next_step_id, timestamp) -> str:
+    """Leaf hash of a trace step computed from its content."""
+
+    if timezone.is_aware(timestamp):
+        timestamp = timestamp.astimezone(dt_timezone.utc)
+    parts = [batch_id, prev_step_id or "", next_step_id or "", timestamp.isoformat()]
+    return leaf_hash("\x1f".join(parts).encode())
+
+
+def _step_leaf(step: ProcTraceChainFact) -> str:
+    return step_leaf(step.batch_id, step.prev_step_id, step.next_step_id, step.timestamp)
+
+
+def append_trace_steps(steps: Iterable[ProcTraceChainFact]) -> int:
+    """Append saved steps that are not hashed yet to their batch MMRs.
+
+    Sets ``hash`` and ``merkle_leaf_index`` on each step and refreshes the
+    ``path_hash`` of the batch's inventory traces.  Returns the number of
+    steps appended.
+    """
+
+    from output_data.models import OutInventoryTraceFact
+
+    by_batch: Dict[str, List[ProcTraceChainFact]] = defaultdict(list)
+    for step in steps:
+        if step.merkle_leaf_index is None:
+            by_batch[step.batch_id].append(step)
+
+    appended = 0
+    for batch_id, batch_steps in by_batch.items():
+        with transaction.atomic():
+            state, _ = ProcTraceMerkleState.objects.select_for_update().get_or_create(batch_id=batch_id)
+            peaks = state.peaks_json
+            size = state.leaf_count
+            nodes = []
+            for step in sorted(batch_steps, key=lambda s: s.pk):
+                step.hash = _step_leaf(step)
+                step.merkle_leaf_index = size
+                peaks, created = append_leaf(size, peaks, step.hash)
+                size += 1
+                nodes.extend(
+                    ProcTraceMerkleNode(batch_id=batch_id, level=level, position=position, hash=value)
+                    for level, position, value in created
+                )
+            ProcTraceMerkleNode.objects.bulk_create(nodes)
+            ProcTraceChainFact.objects.bulk_update(batch_steps, ["hash", "merkle_leaf_index"])
+            state.leaf_count = size
+            state.peaks_json = peaks
+            state.root_hash = bag_peaks(peaks)
+            state.save()
+            OutInventoryTraceFact.objects.filter(batch_id=batch_id).exclude(
+                path_hash=state.root_hash
+            ).update(path_hash=state.root_hash)
+            mark_models_stale(ProcTraceMerkleNode, ProcTraceChainFact, OutInventoryTraceFact)
+        appended += len(batch_steps)
+    return appended
+
+
+def prove_step(step: ProcTraceChainFact) -> Dict[str, Any]:
+    """Return an inclusion proof for ``step`` against its batch root."""
+
+    if step.merkle_leaf_index is None:
+        raise ValueError(f"trace step {step.pk} has not been hashed")
+    state = ProcTraceMerkleState.objects.get(batch_id=step.batch_id)
+    positions = path_positions(step.merkle_leaf_index, state.leaf_count)
+    nodes = {}
+    if positions:
+        query = reduce(or_, (Q(level=level, position=position) for level, position in positions))
+        nodes = {
+            (level, position): value
+            for level, position, value in ProcTraceMerkleNode.objects.filter(query, batch_id=step.batch_id)
+            .values_list("level", "position", "hash")
+        }
+    proof = build_proof(
+        step.merkle_leaf_index, state.leaf_count, state.peaks_json, lambda lvl, pos: nodes[(lvl, pos)]
+    )
+    return {"root": state.root_hash, "proof": proof}
+
+
+def verify_step(step: ProcTraceChainFact) -> bool:
+    """Check a step's content against its batch root via an inclusion proof."""
+
+    if step.merkle_leaf_index is None:
+        return False
+    try:
+        result = prove_step(step)
+    except (ProcTraceMerkleState.DoesNotExist, KeyError, IndexError):
+        return False
+    return verify_proof(_step_leaf(step), result["proof"], result["root"])
+
+
+@dataclass
+class VerificationReport:
+    """Outcome of :func:`verify_all_paths`."""
+
+    batches: int = 0
+    steps: int = 0
+    inventory_traces: int = 0
+    unhashed_steps: int = 0
+    failures: List[str] = field(default_factory=list)
+    failure_count: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.failure_count == 0 and self.unhashed_steps == 0
+
+    def fail(self, message: str) -> None:
+        self.failure_count += 1
+        if len(self.failures) < MAX_REPORTED_FAILURES:
+            self.failures.append(message)
+
+
+def _verify_chunk(roots: Dict[str, tuple], report: VerificationReport, chunk_size: int) -> None:
+    from output_data.models import OutInventoryTraceFact
+
+    steps = (
+        ProcTraceChainFact.objects.filter(batch_id__in=list(roots), merkle_leaf_index__isnull=False)
+        .order_by("batch_id", "merkle_leaf_index")
+        .values_list("trace_id", "batch_id", "prev_step_id", "next_step_id", "timestamp", "hash", "merkle_leaf_index")
+        .iterator(chunk_size=chunk_size)
+    )
+    seen = set()
+    for batch_id, rows in groupby(steps, key=lambda row: row[1]):
+        seen.add(batch_id)
+        mmr = MerkleMountainRange(keep_nodes=False)
+        for trace_id, _, prev_id, next_id, timestamp, stored, leaf_index in rows:
+            report.steps += 1
+            leaf = step_leaf(batch_id, prev_id, next_id, timestamp)
+            if leaf != stored:
+                report.fail(f"step {trace_id} ({batch_id}): content does not match its hash")
+            if leaf_index != mmr.size:
+                report.fail(f"step {trace_id} ({batch_id}): leaf index {leaf_index}, expected {mmr.size}")
+            mmr.append(leaf)
+        leaf_count, root = roots[batch_id]
+        if mmr.size != leaf_count or mmr.root != root:
+            report.fail(f"batch {batch_id}: recomputed root does not match stored root")
+
+    for batch_id, (leaf_count, _) in roots.items():
+        if batch_id not in seen and leaf_count:
+            report.fail(f"batch {batch_id}: stored root has no trace steps")
+
+    traces = (
+        OutInventoryTraceFact.objects.filter(batch_id__in=list(roots))
+        .values_list("trace_id", "batch_id", "path_hash")
+        .iterator(chunk_size=chunk_size)
+    )
+    for trace_id, batch_id, path_hash in traces:
+        report.inventory_traces += 1
+        if path_hash != roots[batch_id][1]:
+            report.fail(f"inventory trace {trace_id} ({batch_id}): path_hash does not match batch root")
+
+
+def verify_all_paths(chunk_size: int = DEFAULT_CHUNK_SIZE) -> VerificationReport:
+    """Recompute and check every stored trace chain and inventory path hash.
+
+    Batches are processed ``chunk_size`` at a time and each chain is replayed
+    keeping only its peaks, so memory does not grow with the data.
+    """
+
+    report = VerificationReport()
+    report.unhashed_steps = ProcTraceChainFact.objects.filter(merkle_leaf_index__isnull=True).count()
+
+    states = (
+        ProcTraceMerkleState.objects.order_by("batch_id")
+        .values_list("batch_id", "leaf_count", "root_hash")
+        .iterator(chunk_size=chunk_size)
+    )
+    roots: Dict[str, tuple] = {}
+    for batch_id, leaf_count, root in states:
+        report.batches += 1
+        roots[batch_id] = (leaf_count, root)
+        if len(roots) >= chunk_size:
+            _verify_chunk(roots, report, chunk_size)
+            roots = {}
+    if roots:
+        _verify_chunk(roots, report, chunk_size)
+    return report
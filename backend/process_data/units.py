@@ -0,0 +1,271 @@
+"""Conversion of custom quantity units to kilograms.
+
+``RawUnitMappingDim`` maps custom units ("bale", "roll", ...) to a
+``kg_equivalent``.  :class:`UnitConverter` keeps those mappings in memory,
+keyed both by ``mapping_id`` and by normalised unit label, and converts whole
+arrays of quantities with one multiplication.  Like ``raw_data.factor_index``
+it shares a version counter stored in the database (a ``JobWatermark`` row)
+so every process reloads after a mapping changes.
+
+Resolution order for a row: its ``unit_mapping`` if set, then its unit label
+(database mappings first, then the built-in mass units), and a blank label
+means the quantity is already in kg.  Anything else is unconvertible and
+yields ``NaN``.
+
+``ProcInventoryFact.normalized_quantity_kg`` is filled on save and by
+:func:`backfill_normalized_quantities` for rows written in bulk, so
+aggregations read kilograms directly.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+
+from main.caching import mark_models_stale
+from main.watermarks import bump_watermark, get_watermark
+from raw_data.factor_index import normalize_label
+from raw_data.models import RawUnitMappingDim
+
+from .models import ProcInventoryFact
+
+VERSION_WATERMARK = "process_data.unit_converter"
+BACKFILL_CHUNK_SIZE = 5000
+
+BUILTIN_UNITS: Dict[str, float] = {
+    "": 1.0,
+    "kg": 1.0,
+    "kgs": 1.0,
+    "kilogram": 1.0,
+    "kilograms": 1.0,
+    "g": 0.001,
+    "gram": 0.001,
+    "grams": 0.001,
+    "t": 1000.0,
+    "tonne": 1000.0,
+    "tonnes": 1000.0,
+    "lb": 0.45359237,
+    "lbs": 0.45359237,
+}
+
+
+class UnitConverter:
+    """Cached ``RawUnitMappingDim`` lookup with vectorized conversion."""
+
+    def __init__(self, check_interval: float = 1.0) -> None:
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._by_id: Optional[Dict[int, float]] = None
+        self._by_label: Dict[str, float] = {}
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self.loads = 0
+
+    @staticmethod
+    def shared_version() -> int:
+        return get_watermark(VERSION_WATERMARK)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._by_id = None
+
+    def invalidate(self) -> None:
+        bump_watermark(VERSION_WATERMARK)
+        self.clear()
+
+    def _load(self) -> Tuple[Dict[int, float], Dict[str, float]]:
+        version = self.shared_version()
+        by_id: Dict[int, float] = {}
+        by_label = dict(BUILTIN_UNITS)
+        mapped_labels = set()
+        rows = RawUnitMappingDim.objects.order_by("mapping_id").values_list(
+            "mapping_id", "custom_unit", "kg_equivalent"
+        )
+        for mapping_id, unit, kg_equivalent in rows.iterator():
+            by_id[mapping_id] = kg_equivalent
+            label = normalize_label(unit)
+            # Database mappings override built-in units; the oldest one wins.
+            if label and label not in mapped_labels:
+                mapped_labels.add(label)
+                by_label[label] = kg_equivalent
+        self._by_id, self._by_label = by_id, by_label
+        self._version = version
+        self._checked_at = time.monotonic()
+        self.loads += 1
+        return by_id, by_label
+
+    def tables(self) -> Tuple[Dict[int, float], Dict[str, float]]:
+        """Return ``(by_mapping_id, by_label)``, reloading them if stale."""
+
+        with self._lock:
+            if self._by_id is None:
+                return self._load()
+            now = time.monotonic()
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                if self.shared_version() != self._version:
+                    return self._load()
+            return self._by_id, self._by_label
+
+    def factor(self, unit: Optional[str] = None, mapping_id: Optional[int] = None) -> Optional[float]:
+        """kg per unit for one row, or ``None`` if it cannot be resolved."""
+
+        by_id, by_label = self.tables()
+        if mapping_id is not None and mapping_id in by_id:
+            return by_id[mapping_id]
+        return by_label.get(normalize_label(unit))
+
+    def factors(
+        self,
+        units: Optional[Sequence[Optional[str]]] = None,
+        mapping_ids: Optional[Sequence[Optional[int]]] = None,
+        size: Optional[int] = None,
+    ) -> np.ndarray:
+        """kg per unit for many rows; unresolvable rows are ``NaN``.
+
+        Each distinct unit and mapping id is resolved once.
+        """
+
+        by_id, by_label = self.tables()
+        n = size if size is not None else len(units if units is not None else mapping_ids)
+        result = np.full(n, np.nan)
+        if units is not None:
+            labels, inverse = np.unique(
+                np.array([normalize_label(unit) for unit in units], dtype=str), return_inverse=True
+            )
+            table = np.array([by_label.get(label, np.nan) for label in labels.tolist()], dtype=np.float64)
+            result = table[inverse]
+        elif mapping_ids is None:
+            result[:] = 1.0
+        if mapping_ids is not None:
+            ids = np.array([-1 if value is None else value for value in mapping_ids], dtype=np.int64)
+            unique_ids, inverse = np.unique(ids, return_inverse=True)
+            table = np.array([by_id.get(value, np.nan) for value in unique_ids.tolist()], dtype=np.float64)
+            mapped = table[inverse]
+            result = np.where(np.isnan(mapped), result, mapped)
+        return result
+
+    def to_kg(
+        self,
+        quantities: Sequence[float],
+        units: Optional[Sequence[Optional[str]]] = None,
+        mapping_ids: Optional[Sequence[Optional[int]]] = None,
+    ) -> np.ndarray:
+        """Convert ``quantities`` to kg in one call."""
+
+        quantities = np.asarray(quantities, dtype=np.float64)
+        return quantities * self.factors(units, mapping_ids, size=len(quantities))
+
+    def convert_queryset(
+        self,
+        queryset,
+        quantity_field: str,
+        unit_field: Optional[str] = None,
+        mapping_field: Optional[str] = None,
+    ) -> Tuple[list, np.ndarray]:
+        """Return ``(pks, kg)`` for a queryset in one query.
+
+        Field names may be lookups, e.g. ``"unit_mapping_json__unit"``.
+        """
+
+        fields = ["pk", quantity_field]
+        if unit_field:
+            fields.append(unit_field)
+        if mapping_field:
+            fields.append(mapping_field)
+        rows = list(queryset.values_list(*fields))
+        columns = list(zip(*rows)) if rows else [[] for _ in fields]
+        units = columns[2] if unit_field else None
+        mapping_ids = [_as_id(value) for value in columns[-1]] if mapping_field else None
+        return list(columns[0]), self.to_kg(columns[1], units, mapping_ids)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "loads": self.loads,
+            "mappings": len(self._by_id or ()),
+            "version": self._version if self._version is not None else -1,
+        }
+
+
+def _as_id(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+unit_converter = UnitConverter()
+
+
+@dataclass
+class BackfillStats:
+    rows: int = 0
+    updated: int = 0
+    unconvertible: int = 0
+
+
+def backfill_normalized_quantities(
+    queryset=None,
+    only_missing: bool = True,
+    chunk_size: int = BACKFILL_CHUNK_SIZE,
+    converter: UnitConverter = unit_converter,
+) -> BackfillStats:
+    """Fill ``ProcInventoryFact.normalized_quantity_kg`` in bulk.
+
+    Rows are processed in primary-key chunks; rows whose unit cannot be
+    resolved are left ``NULL`` and counted as unconvertible.
+    """
+
+    if queryset is None:
+        queryset = ProcInventoryFact.objects.all()
+    if only_missing:
+        queryset = queryset.filter(normalized_quantity_kg__isnull=True)
+    stats = BackfillStats()
+    last_pk = None
+    while True:
+        chunk = queryset.order_by("pk")
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        pks, kg = converter.convert_queryset(
+            chunk[:chunk_size], "quantity_kg", "custom_unit", "unit_mapping_id"
+        )
+        if not pks:
+            break
+        last_pk = pks[-1]
+        stats.rows += len(pks)
+        updates = [
+            ProcInventoryFact(pk=pk, normalized_quantity_kg=value)
+            for pk, value in zip(pks, kg.tolist())
+            if value == value
+        ]
+        stats.unconvertible += len(pks) - len(updates)
+        with transaction.atomic():
+            ProcInventoryFact.objects.bulk_update(updates, ["normalized_quantity_kg"], batch_size=1000)
+            mark_models_stale(ProcInventoryFact)
+        stats.updated += len(updates)
+    return stats
+
+
+def normalize_instance(instance) -> None:
+    """Set ``normalized_quantity_kg`` on an unsaved ``ProcInventoryFact``."""
+
+    factor = unit_converter.factor(instance.custom_unit, instance.unit_mapping_id)
+    instance.normalized_quantity_kg = (
+        instance.quantity_kg * factor if factor is not None and instance.quantity_kg is not None else None
+    )
+
+
+def reset_normalized_quantities(mapping_id: int, units: Iterable[str]) -> int:
+    """Clear normalized quantities that depend on a changed mapping."""
+
+    condition = Q(unit_mapping_id=mapping_id)
+    for unit in units:
+        if unit:
+            condition |= Q(custom_unit__iexact=unit.strip())
+    reset = ProcInventoryFact.objects.filter(condition).update(normalized_quantity_kg=None)
+    mark_models_stale(ProcInventoryFact)
+    return reset
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RawDataConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "raw_data"
+
+    def ready(self):
+        from . import signals  # noqa: F401
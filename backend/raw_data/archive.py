@@ -0,0 +1,474 @@
+"""Cold archival of aged raw facts to compressed columnar files.
+
+:func:`archive_before` moves fact rows older than a cutoff out of the
+database into ``.npz`` files under ``settings.RAW_ARCHIVE_DIR``, one per
+day and facility::
+
+    <RAW_ARCHIVE_DIR>/<kind>/date=2024-03-01/facility=7/<segment>.npz
+
+Each file holds one compressed numpy array per column: text and JSON as
+unicode arrays, times as ``datetime64[us]`` (UTC), ids and numbers as
+int64/float64, binary values as a padded ``uint8`` matrix plus lengths.
+No array needs pickling to load.  Files are written and fsynced first; the
+archived rows are then deleted in the same transaction that records the
+file as a :class:`~raw_data.models.RawArchiveSegment`, so a crash leaves at
+worst an unreferenced file, never rows that exist nowhere.  The delete
+repeats the group's filters; if rows were moved out of the group or deleted
+since they were read, the group is rolled back, its file removed and it is
+left for the next run (``ArchiveStats.changed``).
+
+:func:`query_archive` reads archived ranges back without restoring them.
+Segments are pruned on day and facility through the segment table, then on
+the per-column min/max kept for every segment; only the requested and
+filtered columns of the remaining files are decompressed, and the
+remaining predicates are applied as vectorized masks.  Filters use Django
+lookup syntax: ``batch_id="b1"``, ``stage__in=[...]``, ``scan_time__gte=...``.
+
+Scan kinds are archived from their monthly partitions as well as from the
+hot table (see ``raw_data.partitions``); partitions emptied by archival are
+dropped.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.functions import TruncDate
+
+from main.caching import mark_models_stale
+
+from .models import RawArchiveSegment, RawInputManualFact, RawInputNIRFact, RawInputRFIDFact
+from .partitions import SCAN_PARTITIONS, MonthlyPartitions, month_start, next_month
+
+DELETE_CHUNK_SIZE = 5000
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+# Storage codec by Django internal field type.
+CODECS = {
+    "AutoField": "int",
+    "BigAutoField": "int",
+    "IntegerField": "int",
+    "BigIntegerField": "int",
+    "PositiveIntegerField": "int",
+    "ForeignKey": "int",
+    "FloatField": "float",
+    "BooleanField": "bool",
+    "CharField": "str",
+    "TextField": "str",
+    "URLField": "str",
+    "JSONField": "json",
+    "DateTimeField": "datetime",
+    "BinaryField": "bytes",
+}
+# Codecs with an order, for min/max pruning and comparison filters.
+ORDERED = {"int", "float", "str", "datetime"}
+LOOKUPS = {"exact", "in", "gt", "gte", "lt", "lte"}
+
+
+@dataclass(frozen=True)
+class ArchiveSpec:
+    """How one fact model is archived."""
+
+    model: type
+    time_field: str
+    facility_field: str = "facility"
+    partitions: Optional[MonthlyPartitions] = None
+
+    @property
+    def fields(self) -> list:
+        return list(self.model._meta.concrete_fields)
+
+    @property
+    def columns(self) -> Dict[str, str]:
+        """Column name -> codec, in model order."""
+
+        columns = {}
+        for f in self.fields:
+            codec = CODECS.get(f.get_internal_type())
+            if codec is None or f.null:
+                raise ValueError(f"{self.model.__name__}.{f.name} cannot be archived")
+            columns[f.attname] = codec
+        return columns
+
+    @property
+    def time_column(self) -> str:
+        return self.model._meta.get_field(self.time_field).attname
+
+    @property
+    def facility_column(self) -> str:
+        return self.model._meta.get_field(self.facility_field).attname
+
+    def sources(self, cutoff: datetime) -> List[QuerySet]:
+        """Querysets over every table holding rows older than ``cutoff``."""
+
+        if self.partitions is not None:
+            return self.partitions.querysets(end=cutoff)
+        return [self.model.objects.filter(**{f"{self.time_field}__lt": cutoff})]
+
+
+# Archivable kind -> spec.  Facts other tables point at (marketplace
+# listings) or that imports deduplicate against (sheet rows) stay in the
+# database.
+ARCHIVES: Dict[str, ArchiveSpec] = {
+    "rfid": ArchiveSpec(RawInputRFIDFact, "scan_time", partitions=SCAN_PARTITIONS["rfid"]),
+    "nir": ArchiveSpec(RawInputNIRFact, "scan_time", partitions=SCAN_PARTITIONS["nir"]),
+    "manual": ArchiveSpec(RawInputManualFact, "timestamp"),
+}
+
+
+@dataclass
+class ArchiveStats:
+    rows: int = 0
+    segments: int = 0
+    bytes: int = 0
+    dropped_partitions: int = 0
+    changed: int = 0
+    elapsed: float = 0.0
+
+
+def archive_root() -> Path:
+    return Path(settings.RAW_ARCHIVE_DIR)
+
+
+# -- column encoding --------------------------------------------------------
+
+
+def _to_micros(value: datetime) -> int:
+    return (value - EPOCH) // MICROSECOND
+
+
+def encode_column(codec: str, values: Sequence[Any]) -> Dict[str, np.ndarray]:
+    """Arrays stored for one column, keyed by their npz member suffix."""
+
+    if codec == "int":
+        return {"": np.asarray(values, dtype=np.int64)}
+    if codec == "float":
+        return {"": np.asarray(values, dtype=np.float64)}
+    if codec == "bool":
+        return {"": np.asarray(values, dtype=bool)}
+    if codec == "str":
+        return {"": np.asarray(values, dtype=np.str_)}
+    if codec == "json":
+        return {"": np.asarray([json.dumps(v, sort_keys=True) for v in values], dtype=np.str_)}
+    if codec == "datetime":
+        return {"": np.asarray([_to_micros(v) for v in values], dtype=np.int64).astype("datetime64[us]")}
+    if codec == "bytes":
+        blobs = [bytes(v) for v in values]
+        lengths = np.fromiter(map(len, blobs), dtype=np.int32, count=len(blobs))
+        matrix = np.zeros((len(blobs), int(lengths.max(initial=0))), dtype=np.uint8)
+        for row, blob in enumerate(blobs):
+            matrix[row, : len(blob)] = np.frombuffer(blob, dtype=np.uint8)
+        return {"": matrix, "__len": lengths}
+    raise ValueError(f"unknown codec {codec!r}")
+
+
+def _load_column(archive, name: str, codec: str) -> np.ndarray:
+    values = archive[name]
+    if codec == "bytes":
+        lengths = archive[f"{name}__len"]
+        blobs = np.empty(len(lengths), dtype=object)
+        for row, length in enumerate(lengths):
+            blobs[row] = values[row, :length].tobytes()
+        return blobs
+    return values
+
+
+def _empty(codec: str) -> np.ndarray:
+    if codec == "bytes":
+        return np.empty(0, dtype=object)
+    return encode_column(codec, [])[""]
+
+
+def _scalar(codec: str, value: Any) -> Any:
+    """A filter value in the column's storage representation."""
+
+    if codec == "datetime":
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=dt_timezone.utc)
+        return np.datetime64(_to_micros(value), "us")
+    if codec == "int":
+        return int(value)
+    if codec == "float":
+        return float(value)
+    return value
+
+
+def _stat(codec: str, value: Any) -> Any:
+    if codec == "datetime":
+        return int(value.astype("datetime64[us]").astype(np.int64))
+    return value.item() if hasattr(value, "item") else value
+
+
+def _column_stats(columns: Dict[str, str], arrays: Dict[str, np.ndarray]) -> Dict[str, list]:
+    stats = {}
+    for name, codec in columns.items():
+        if codec not in ORDERED:
+            continue
+        # Unicode arrays have no min/max ufunc loop; sort instead.
+        values = np.sort(arrays[name]) if codec == "str" else arrays[name]
+        low, high = (values[0], values[-1]) if codec == "str" else (values.min(), values.max())
+        stats[name] = [_stat(codec, low), _stat(codec, high)]
+    return stats
+
+
+# -- archiving --------------------------------------------------------------
+
+
+def _write_file(path: Path, arrays: Dict[str, np.ndarray]) -> Tuple[int, str]:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "wb") as stream:
+        np.savez_compressed(stream, **arrays)
+        stream.flush()
+        os.fsync(stream.fileno())
+    os.replace(tmp, path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for block in iter(lambda: stream.read(1 << 20), b""):
+            digest.update(block)
+    return path.stat().st_size, digest.hexdigest()
+
+
+def _archive_group(kind: str, spec: ArchiveSpec, rows: QuerySet, facility_id: int, day: date, stats: ArchiveStats) -> None:
+    columns = spec.columns
+    names = list(columns)
+    records = list(rows.values_list(*names))
+    if not records:
+        return
+    by_column = list(zip(*records))
+    arrays: Dict[str, np.ndarray] = {}
+    for name, values in zip(names, by_column):
+        for suffix, array in encode_column(columns[name], values).items():
+            arrays[name + suffix] = array
+
+    relative = Path(kind) / f"date={day.isoformat()}" / f"facility={facility_id}" / f"{uuid.uuid4().hex}.npz"
+    size, sha256 = _write_file(archive_root() / relative, arrays)
+
+    pk = rows.model._meta.pk.attname
+    keys = by_column[names.index(pk)]
+    times = by_column[names.index(spec.time_column)]
+    try:
+        with transaction.atomic():
+            _delete_archived(rows, pk, keys)
+            RawArchiveSegment.objects.create(
+                kind=kind,
+                path=relative.as_posix(),
+                facility_id=facility_id,
+                day=day,
+                row_count=len(records),
+                min_time=min(times),
+                max_time=max(times),
+                column_stats=_column_stats(columns, arrays),
+                size_bytes=size,
+                sha256=sha256,
+            )
+            mark_models_stale(spec.model)
+    except _GroupChanged:
+        (archive_root() / relative).unlink(missing_ok=True)
+        stats.changed += 1
+        return
+    stats.rows += len(records)
+    stats.segments += 1
+    stats.bytes += size
+
+
+class _GroupChanged(Exception):
+    pass
+
+
+def _delete_archived(rows: QuerySet, pk: str, keys: Sequence[Any]) -> None:
+    # Delete through ``rows`` so a row moved out of the group since it was
+    # read survives; any shortfall rolls the group back.
+    label = rows.model._meta.label
+    deleted = 0
+    for start in range(0, len(keys), DELETE_CHUNK_SIZE):
+        _, per_model = rows.filter(**{f"{pk}__in": keys[start:start + DELETE_CHUNK_SIZE]}).delete()
+        deleted += per_model.get(label, 0)
+    if deleted != len(keys):
+        raise _GroupChanged
+
+
+def archive_kind(kind: str, cutoff: datetime) -> ArchiveStats:
+    """Move the rows of ``kind`` older than ``cutoff`` into archive files."""
+
+    spec = ARCHIVES[kind]
+    stats = ArchiveStats()
+    started = time.perf_counter()
+    utc_day = TruncDate(spec.time_field, tzinfo=dt_timezone.utc)
+    for source in spec.sources(cutoff):
+        groups = (
+            source.annotate(archive_day=utc_day)
+            .values_list(spec.facility_column, "archive_day")
+            .distinct()
+            .order_by(spec.facility_column, "archive_day")
+        )
+        for facility_id, day in list(groups):
+            day_start = datetime(day.year, day.month, day.day, tzinfo=dt_timezone.utc)
+            rows = source.filter(**{
+                spec.facility_column: facility_id,
+                f"{spec.time_field}__gte": day_start,
+                f"{spec.time_field}__lt": min(day_start + timedelta(days=1), cutoff),
+            })
+            _archive_group(kind, spec, rows, facility_id, day, stats)
+
+    if spec.partitions is not None:
+        for month in spec.partitions.months():
+            if month_start(next_month(month)) <= cutoff and not spec.partitions.partition_model(month).objects.exists():
+                spec.partitions.detach(month, drop=True)
+                stats.dropped_partitions += 1
+    stats.elapsed = time.perf_counter() - started
+    return stats
+
+
+def archive_before(cutoff: datetime, kinds: Optional[Iterable[str]] = None) -> Dict[str, ArchiveStats]:
+    return {kind: archive_kind(kind, cutoff) for kind in (kinds or ARCHIVES)}
+
+
+# -- query-through ----------------------------------------------------------
+
+
+def _parse_filters(columns: Dict[str, str], filters: Dict[str, Any]) -> List[Tuple[str, str, Any]]:
+    parsed = []
+    for key, value in filters.items():
+        name, _, lookup = key.partition("__")
+        lookup = lookup or "exact"
+        if name not in columns:
+            # Allow relation names for their id column, as the ORM does.
+            name = f"{name}_id" if f"{name}_id" in columns else name
+        codec = columns.get(name)
+        if codec is None or lookup not in LOOKUPS:
+            raise ValueError(f"unsupported archive filter {key!r}")
+        if codec not in ORDERED and lookup not in ("exact", "in"):
+            raise ValueError(f"{key!r}: {codec} columns only support exact and in")
+        if codec in ("json", "bytes"):
+            raise ValueError(f"{key!r}: cannot filter on {codec} columns")
+        if lookup == "in":
+            value = [_scalar(codec, item) for item in value]
+        else:
+            value = _scalar(codec, value)
+        parsed.append((name, lookup, value))
+    return parsed
+
+
+def _may_match(segment: RawArchiveSegment, columns: Dict[str, str], predicates) -> bool:
+    """False if the segment's min/max rule out every predicate match."""
+
+    for name, lookup, value in predicates:
+        bounds = segment.column_stats.get(name)
+        if bounds is None:
+            continue
+        codec = columns[name]
+        lo, hi = (np.datetime64(b, "us") for b in bounds) if codec == "datetime" else bounds
+        if lookup == "exact" and not lo <= value <= hi:
+            return False
+        if lookup == "in" and not any(lo <= item <= hi for item in value):
+            return False
+        if (lookup == "gt" and hi <= value) or (lookup == "gte" and hi < value):
+            return False
+        if (lookup == "lt" and lo >= value) or (lookup == "lte" and lo > value):
+            return False
+    return True
+
+
+def _mask(values: np.ndarray, lookup: str, value: Any) -> np.ndarray:
+    if lookup == "exact":
+        return values == value
+    if lookup == "in":
+        return np.isin(values, value)
+    return {"gt": np.greater, "gte": np.greater_equal, "lt": np.less, "lte": np.less_equal}[lookup](values, value)
+
+
+def segments_for(kind: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 facility_ids: Optional[Iterable[int]] = None) -> QuerySet:
+    """Segments of ``kind`` that may hold rows in ``[start, end)``."""
+
+    segments = RawArchiveSegment.objects.filter(kind=kind)
+    if start is not None:
+        segments = segments.filter(day__gte=start.astimezone(dt_timezone.utc).date(), max_time__gte=start)
+    if end is not None:
+        segments = segments.filter(day__lte=end.astimezone(dt_timezone.utc).date(), min_time__lt=end)
+    if facility_ids is not None:
+        segments = segments.filter(facility_id__in=list(facility_ids))
+    return segments.order_by("day", "facility_id", "pk")
+
+
+def query_archive(
+    kind: str,
+    columns: Optional[Sequence[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    facility_ids: Optional[Iterable[int]] = None,
+    **filters: Any,
+) -> Dict[str, np.ndarray]:
+    """Archived rows of ``kind`` as ``{column: array}``.
+
+    Only ``columns`` (default: all) are returned and only they and the
+    filtered columns are read.  Times come back as ``datetime64[us]`` in
+    UTC, JSON as strings and binary columns as object arrays of bytes.
+    """
+
+    spec = ARCHIVES[kind]
+    all_columns = spec.columns
+    wanted = list(columns) if columns is not None else list(all_columns)
+    unknown = [name for name in wanted if name not in all_columns]
+    if unknown:
+        raise ValueError(f"unknown archive columns {unknown}")
+
+    time_filters = {}
+    if start is not None:
+        time_filters[f"{spec.time_column}__gte"] = start
+    if end is not None:
+        time_filters[f"{spec.time_column}__lt"] = end
+    predicates = _parse_filters(all_columns, {**filters, **time_filters})
+
+    parts: Dict[str, List[np.ndarray]] = {name: [] for name in wanted}
+    for segment in segments_for(kind, start, end, facility_ids):
+        if not _may_match(segment, all_columns, predicates):
+            continue
+        with np.load(archive_root() / segment.path) as archive:
+            mask = np.ones(segment.row_count, dtype=bool)
+            for name, lookup, value in predicates:
+                mask &= _mask(archive[name], lookup, value)
+            if not mask.any():
+                continue
+            for name in wanted:
+                parts[name].append(_load_column(archive, name, all_columns[name])[mask])
+
+    return {
+        name: np.concatenate(parts[name]) if parts[name] else _empty(all_columns[name])
+        for name in wanted
+    }
+
+
+def iter_archived_rows(kind: str, columns: Optional[Sequence[str]] = None, **query: Any) -> Iterator[Dict[str, Any]]:
+    """:func:`query_archive` as Python rows: aware datetimes, parsed JSON."""
+
+    codecs = ARCHIVES[kind].columns
+    result = query_archive(kind, columns, **query)
+    names = list(result)
+    decoders = []
+    for name in names:
+        codec = codecs[name]
+        if codec == "datetime":
+            decoders.append(lambda v: EPOCH + int(v.astype(np.int64)) * MICROSECOND)
+        elif codec == "json":
+            decoders.append(json.loads)
+        elif codec in ("int", "float", "bool", "str"):
+            decoders.append(lambda v: v.item())
+        else:
+            decoders.append(lambda v: v)
+    for values in zip(*(result[name] for name in names)):
+        yield {name: decode(value) for name, decode, value in zip(names, decoders, values)}
@@ -0,0 +1,73 @@
+"""ASGI fast path for the scan ingestion endpoints.
+
+Django runs its synchronous middleware on a worker thread, several thread
+hops per request, which dominates the cost of a request that only
+validates and buffers a few scans.  :class:`IngestRouter` answers ``POST``
+requests to the ingestion routes directly and passes everything else to the
+Django application.  It still enforces ``ALLOWED_HOSTS``,
+``DATA_UPLOAD_MAX_MEMORY_SIZE`` and the same JWT-or-ingest-token check as
+the views; the routes are CSRF-exempt and set no cookies, so nothing else in
+the stack applies.
+"""
+
+import json
+
+from django.conf import settings
+from django.http.request import split_domain_port, validate_host
+
+from .microbatch import authorize, ingest_payload
+from .views import UNAUTHORIZED
+
+ROUTES = {
+    "/api/raw/ingest/rfid": "rfid",
+    "/api/raw/ingest/nir": "nir",
+}
+
+
+class IngestRouter:
+    def __init__(self, app, routes=None) -> None:
+        self.app = app
+        self.routes = ROUTES if routes is None else routes
+
+    async def __call__(self, scope, receive, send):
+        kind = self.routes.get(scope.get("path")) if scope["type"] == "http" else None
+        if kind is None or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        host, _ = split_domain_port(headers.get(b"host", b"").decode("latin-1"))
+        allowed = settings.ALLOWED_HOSTS or ([".localhost", "127.0.0.1", "[::1]"] if settings.DEBUG else [])
+        if not validate_host(host, allowed):
+            return await self._respond(send, 400, {"detail": "Invalid host."})
+        if not await authorize(
+            headers.get(b"authorization", b"").decode("latin-1"), headers.get(b"x-ingest-token", b"").decode("latin-1")
+        ):
+            return await self._respond(send, 401, UNAUTHORIZED)
+
+        limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if limit is not None and size > limit:
+                return await self._respond(send, 413, {"detail": "Request body exceeds the upload limit."})
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        status, payload = await ingest_payload(kind, body)
+        await self._respond(send, status, payload)
+
+    @staticmethod
+    async def _respond(send, status, payload):
+        content = json.dumps(payload).encode()
+        headers = [(b"content-type", b"application/json"), (b"content-length", str(len(content)).encode())]
+        if status == 401:
+            headers.append((b"www-authenticate", b'Bearer realm="api"'))
+        if status == 503:
+            headers.append((b"retry-after", b"1"))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": content})
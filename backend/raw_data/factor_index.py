@@ -0,0 +1,135 @@
+"""In-process index of ``RawEmissionFactorDim`` rows.
+
+Emission factors change rarely but are resolved constantly, so every process
+keeps a hash index keyed by ``(process_id, material_type, region)`` and
+answers lookups without touching the database.
+
+Saving or deleting a factor bumps a version counter stored in the database
+(a ``JobWatermark`` row), which every process shares whatever cache backend is
+configured.  Each process compares its loaded version with the stored one (at
+most once per ``check_interval`` seconds) and rebuilds its index when they
+differ, so long-running workers pick up factor edits made elsewhere.
+"""
+
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from main.watermarks import bump_watermark, get_watermark
+
+VERSION_WATERMARK = "raw_data.emission_factor_index"
+GLOBAL_REGION = "global"
+
+FactorKey = Tuple[int, str, str]
+
+
+class FactorEntry(NamedTuple):
+    factor_id: int
+    factor_value: float
+
+
+def normalize_label(label: Optional[str]) -> str:
+    """Canonical form of material types and regions used for matching."""
+
+    return (label or "").strip().lower()
+
+
+class EmissionFactorIndex:
+    """Hash index of emission factors with versioned invalidation."""
+
+    def __init__(self, check_interval: float = 1.0) -> None:
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[FactorKey, FactorEntry]] = None
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    @staticmethod
+    def shared_version() -> int:
+        return get_watermark(VERSION_WATERMARK)
+
+    def clear(self) -> None:
+        """Drop this process's copy; the next lookup reloads it."""
+
+        with self._lock:
+            self._entries = None
+
+    def invalidate(self) -> None:
+        """Mark every process's index stale, including this one."""
+
+        bump_watermark(VERSION_WATERMARK)
+        self.clear()
+
+    def _load(self) -> Dict[FactorKey, FactorEntry]:
+        from .models import RawEmissionFactorDim
+
+        version = self.shared_version()
+        entries: Dict[FactorKey, FactorEntry] = {}
+        rows = RawEmissionFactorDim.objects.order_by("factor_id").values_list(
+            "factor_id", "process_id", "material_type", "region", "factor_value"
+        )
+        for factor_id, process_id, material_type, region, value in rows.iterator():
+            key = (process_id, normalize_label(material_type), normalize_label(region))
+            # Duplicate keys resolve to the oldest factor.
+            entries.setdefault(key, FactorEntry(factor_id, value))
+        self._entries = entries
+        self._version = version
+        self._checked_at = time.monotonic()
+        self.loads += 1
+        return entries
+
+    def entries(self) -> Dict[FactorKey, FactorEntry]:
+        """Return the current index, reloading it if it is stale."""
+
+        with self._lock:
+            entries = self._entries
+            if entries is None:
+                return self._load()
+            now = time.monotonic()
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                if self.shared_version() != self._version:
+                    return self._load()
+            return entries
+
+    def lookup(
+        self,
+        process_id: int,
+        material_type: Optional[str],
+        region: Optional[str],
+        fallback_region: Optional[str] = GLOBAL_REGION,
+    ) -> Optional[FactorEntry]:
+        """Resolve a factor, falling back to ``fallback_region`` if given."""
+
+        entries = self.entries()
+        mtype = normalize_label(material_type)
+        entry = entries.get((process_id, mtype, normalize_label(region)))
+        if entry is None and fallback_region is not None:
+            entry = entries.get((process_id, mtype, normalize_label(fallback_region)))
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def record(self, hits: int, misses: int) -> None:
+        """Count lookups resolved in bulk from :meth:`entries`."""
+
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "size": len(self._entries or ()),
+            "version": self._version if self._version is not None else -1,
+        }
+
+
+factor_index = EmissionFactorIndex()
@@ -0,0 +1,329 @@
+"""Bulk ingestion of RFID dock scans into ``RawInputRFIDFact``.
+
+Scans are read lazily from NDJSON or CSV streams, validated one record at a
+time and written in fixed-size batches.  NIR scans posted to the ingestion
+endpoints (see ``raw_data.microbatch``) share the same batch writer.  Each
+batch resolves its facility ids with a single query and is upserted on the
+``tag_id`` primary key inside its own transaction, so memory use is bounded
+by the batch size rather than by the size of the input.
+"""
+
+import csv
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, TextIO
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from main.caching import mark_models_stale
+
+from .models import RawFacilityDim, RawInputNIRFact, RawInputRFIDFact
+from .nir import encode_composition
+
+DEFAULT_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 50
+
+# Columns refreshed when a scan for an existing tag is ingested again.
+UPSERT_FIELDS = ["batch_id", "facility", "scan_time", "context_json"]
+NIR_UPSERT_FIELDS = ["facility", "scan_time", "composition", "stage"]
+
+# CSV columns mapped onto model fields; anything else lands in ``context_json``.
+CSV_FIELDS = {"tag_id", "batch_id", "facility_id", "scan_time", "context_json"}
+
+
+class ScanValidationError(ValueError):
+    """Raised when a scan record cannot be turned into a fact row."""
+
+
+@dataclass
+class IngestStats:
+    """Counters collected while ingesting a stream of scans."""
+
+    read: int = 0
+    written: int = 0
+    rejected: int = 0
+    duplicates: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.written / self.elapsed if self.elapsed else 0.0
+
+    def reject(self, message: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+
+def iter_ndjson(stream: TextIO) -> Iterator[Dict[str, Any]]:
+    """Yield one record per non-blank line of an NDJSON stream."""
+
+    for lineno, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            yield {"_error": f"line {lineno}: invalid JSON ({exc})"}
+            continue
+        if not isinstance(record, dict):
+            yield {"_error": f"line {lineno}: expected a JSON object"}
+            continue
+        yield record
+
+
+def iter_csv(stream: TextIO) -> Iterator[Dict[str, Any]]:
+    """Yield records from a CSV stream with a header row.
+
+    Columns that do not map onto a model field are folded into the record's
+    ``context_json`` so reader-specific metadata is not lost.
+    """
+
+    for row in csv.DictReader(stream):
+        record: Dict[str, Any] = {k: v for k, v in row.items() if k in CSV_FIELDS}
+        extra = {k: v for k, v in row.items() if k and k not in CSV_FIELDS and v != ""}
+        if extra:
+            context = record.get("context_json") or {}
+            if isinstance(context, str):
+                try:
+                    context = json.loads(context) if context else {}
+                except ValueError:
+                    context = {"raw": context}
+            record["context_json"] = {**extra, **context}
+        yield record
+
+
+def read_scans(stream: TextIO, fmt: str = "ndjson") -> Iterator[Dict[str, Any]]:
+    """Return a record iterator for ``stream`` in the given format."""
+
+    if fmt == "ndjson":
+        return iter_ndjson(stream)
+    if fmt == "csv":
+        return iter_csv(stream)
+    raise ValueError(f"Unsupported scan format: {fmt!r}")
+
+
+def _parse_scan_time(value: Any) -> datetime:
+    try:
+        if isinstance(value, datetime):
+            parsed: Optional[datetime] = value
+        elif isinstance(value, (int, float)):
+            parsed = datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        elif isinstance(value, str):
+            parsed = parse_datetime(value.strip())
+        else:
+            parsed = None
+    except (ValueError, OverflowError, OSError):
+        # Impossible dates, NaN and out-of-range epochs.
+        parsed = None
+    if parsed is None:
+        raise ScanValidationError(f"invalid scan_time {value!r}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def _parse_facility_id(record: Dict[str, Any], key: str) -> int:
+    raw_facility = record.get("facility_id", record.get("facility"))
+    try:
+        return int(raw_facility)
+    except (TypeError, ValueError):
+        raise ScanValidationError(f"{key}: invalid facility_id {raw_facility!r}") from None
+
+
+def parse_scan(record: Dict[str, Any]) -> RawInputRFIDFact:
+    """Validate ``record`` and build an unsaved ``RawInputRFIDFact``."""
+
+    if "_error" in record:
+        raise ScanValidationError(record["_error"])
+
+    tag_id = str(record.get("tag_id") or "").strip()
+    if not tag_id or len(tag_id) > 255:
+        raise ScanValidationError(f"invalid tag_id {record.get('tag_id')!r}")
+
+    batch_id = str(record.get("batch_id") or "").strip()
+    if not batch_id or len(batch_id) > 255:
+        raise ScanValidationError(f"{tag_id}: invalid batch_id {record.get('batch_id')!r}")
+
+    facility_id = _parse_facility_id(record, tag_id)
+    try:
+        scan_time = _parse_scan_time(record.get("scan_time"))
+    except ScanValidationError as exc:
+        raise ScanValidationError(f"{tag_id}: {exc}") from None
+
+    context = record.get("context_json") or {}
+    if isinstance(context, str):
+        try:
+            context = json.loads(context)
+        except ValueError:
+            raise ScanValidationError(f"{tag_id}: context_json is not valid JSON") from None
+    if not isinstance(context, dict):
+        raise ScanValidationError(f"{tag_id}: context_json must be an object")
+
+    return RawInputRFIDFact(
+        tag_id=tag_id,
+        batch_id=batch_id,
+        facility_id=facility_id,
+        scan_time=scan_time,
+        context_json=context,
+    )
+
+
+def parse_nir_scan(record: Dict[str, Any]) -> RawInputNIRFact:
+    """Validate ``record`` and build an unsaved ``RawInputNIRFact``.
+
+    ``composition`` is a ``{component: share}`` object, stored as the
+    float32 vector of ``raw_data.nir``.
+    """
+
+    if "_error" in record:
+        raise ScanValidationError(record["_error"])
+
+    scanner_id = str(record.get("scanner_id") or "").strip()
+    if not scanner_id or len(scanner_id) > 255:
+        raise ScanValidationError(f"invalid scanner_id {record.get('scanner_id')!r}")
+
+    facility_id = _parse_facility_id(record, scanner_id)
+    try:
+        scan_time = _parse_scan_time(record.get("scan_time"))
+    except ScanValidationError as exc:
+        raise ScanValidationError(f"{scanner_id}: {exc}") from None
+
+    stage = str(record.get("stage") or "").strip()
+    if not stage or len(stage) > 100:
+        raise ScanValidationError(f"{scanner_id}: invalid stage {record.get('stage')!r}")
+
+    composition = record.get("composition")
+    if not isinstance(composition, dict):
+        raise ScanValidationError(f"{scanner_id}: composition must be an object")
+    try:
+        blob = encode_composition(composition)
+    except ValueError as exc:
+        raise ScanValidationError(f"{scanner_id}: {exc}") from None
+
+    return RawInputNIRFact(
+        scanner_id=scanner_id,
+        facility_id=facility_id,
+        scan_time=scan_time,
+        composition=blob,
+        stage=stage,
+    )
+
+
+class FacilityResolver:
+    """Facility ids known to exist or to be missing, queried at most once each."""
+
+    def __init__(self) -> None:
+        self.known: Set[int] = set()
+        self.missing: Set[int] = set()
+
+    def resolve(self, facility_ids: Set[int]) -> None:
+        unknown = facility_ids - self.known - self.missing
+        if not unknown:
+            return
+        found = set(RawFacilityDim.objects.filter(pk__in=unknown).values_list("pk", flat=True))
+        self.known |= found
+        self.missing |= unknown - found
+
+    def __contains__(self, facility_id: int) -> bool:
+        return facility_id in self.known
+
+
+class RFIDScanWriter:
+    """Write validated scans in batches, resolving facilities per batch.
+
+    Facility ids confirmed to exist are remembered across batches, so a long
+    stream from the same docks only queries ``RawFacilityDim`` for ids it has
+    not seen before.
+    """
+
+    model = RawInputRFIDFact
+    key_field = "tag_id"
+    upsert_fields = UPSERT_FIELDS
+
+    def __init__(self, stats: Optional[IngestStats] = None) -> None:
+        self.stats = stats if stats is not None else IngestStats()
+        self._facilities = FacilityResolver()
+
+    def write(self, scans: List[RawInputRFIDFact]) -> int:
+        """Upsert one batch of scans and return the number of rows written."""
+
+        # A tag read twice in the same batch keeps its last reading; the
+        # upsert cannot touch the same primary key twice in one statement.
+        unique: Dict[str, Any] = {}
+        for scan in scans:
+            unique[getattr(scan, self.key_field)] = scan
+        self.stats.duplicates += len(scans) - len(unique)
+
+        self._facilities.resolve({scan.facility_id for scan in unique.values()})
+        rows = []
+        for key, scan in unique.items():
+            if scan.facility_id in self._facilities:
+                rows.append(scan)
+            else:
+                self.stats.reject(f"{key}: unknown facility_id {scan.facility_id}")
+
+        if rows:
+            with transaction.atomic():
+                self.model.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=[self.key_field],
+                    update_fields=self.upsert_fields,
+                )
+                mark_models_stale(self.model)
+        self.stats.written += len(rows)
+        self.stats.batches += 1
+        return len(rows)
+
+
+class NIRScanWriter(RFIDScanWriter):
+    """:class:`RFIDScanWriter` for ``RawInputNIRFact``, keyed on ``scanner_id``."""
+
+    model = RawInputNIRFact
+    key_field = "scanner_id"
+    upsert_fields = NIR_UPSERT_FIELDS
+
+
+def ingest_rfid_scans(
+    records: Iterable[Dict[str, Any]],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> IngestStats:
+    """Validate and upsert ``records`` into ``RawInputRFIDFact``.
+
+    ``records`` may be any iterable of dicts, typically one returned by
+    :func:`read_scans`.  Invalid records and scans for unknown facilities are
+    counted as rejected instead of aborting the run.
+    """
+
+    if batch_size < 1:
+        raise ValueError("batch_size must be positive")
+
+    writer = RFIDScanWriter()
+    stats = writer.stats
+    started = time.perf_counter()
+    pending: List[RawInputRFIDFact] = []
+
+    for record in records:
+        stats.read += 1
+        try:
+            pending.append(parse_scan(record))
+        except ScanValidationError as exc:
+            stats.reject(str(exc))
+            continue
+        if len(pending) >= batch_size:
+            writer.write(pending)
+            pending = []
+
+    if pending:
+        writer.write(pending)
+
+    stats.elapsed = time.perf_counter() - started
+    return stats
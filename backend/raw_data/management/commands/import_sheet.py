@@ -0,0 +1,52 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from raw_data.gsheet_import import DEFAULT_BATCH_SIZE, import_sheet
+
+
+class Command(BaseCommand):
+    help = "Import a sheet CSV export into RawInputGSheetFact, skipping unchanged rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV export of the sheet.")
+        parser.add_argument(
+            "--source-url",
+            help="URL identifying the sheet; defaults to the file's file:// URI.",
+        )
+        parser.add_argument("--key-column", help="Column that identifies a row; defaults to the row number.")
+        parser.add_argument("--facility", type=int, help="Facility id for rows without a facility_id column.")
+        parser.add_argument("--stage", help="Stage for rows without a stage column.")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Rows written per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+        path = Path(options["path"])
+        source_url = options["source_url"] or path.resolve().as_uri()
+        try:
+            stream = open(path, newline="", encoding="utf-8")
+        except OSError as exc:
+            raise CommandError(f"Cannot open {path}: {exc}") from exc
+        with stream:
+            stats = import_sheet(
+                stream,
+                source_url,
+                key_column=options["key_column"],
+                facility_id=options["facility"],
+                stage=options["stage"],
+                batch_size=options["batch_size"],
+            )
+
+        for error in stats.errors:
+            self.stderr.write(f"rejected: {error}")
+        self.stdout.write(
+            f"{source_url}: read {stats.read}, inserted {stats.inserted}, updated {stats.updated}, "
+            f"unchanged {stats.unchanged}, rejected {stats.rejected}, duplicates {stats.duplicates} "
+            f"({stats.elapsed:.2f}s, {stats.rows_per_sec:.0f} rows/sec)"
+        )
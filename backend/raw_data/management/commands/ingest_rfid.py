@@ -0,0 +1,61 @@
+import sys
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from raw_data.ingestion import DEFAULT_BATCH_SIZE, ingest_rfid_scans, read_scans
+
+
+def _detect_format(path: str, requested: str) -> str:
+    if requested != "auto":
+        return requested
+    return "csv" if Path(path).suffix.lower() == ".csv" else "ndjson"
+
+
+class Command(BaseCommand):
+    help = "Stream RFID scans from NDJSON/CSV files (or stdin) into RawInputRFIDFact."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            default=["-"],
+            help="Input files; use '-' (the default) to read from stdin.",
+        )
+        parser.add_argument(
+            "--format",
+            choices=["auto", "ndjson", "csv"],
+            default="auto",
+            help="Input format; 'auto' picks CSV for .csv files and NDJSON otherwise.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Rows written per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        for path in options["paths"]:
+            fmt = _detect_format(path, options["format"])
+            if path == "-":
+                stats = ingest_rfid_scans(read_scans(sys.stdin, fmt), options["batch_size"])
+            else:
+                try:
+                    stream = open(path, newline="", encoding="utf-8")
+                except OSError as exc:
+                    raise CommandError(f"Cannot open {path}: {exc}") from exc
+                with stream:
+                    stats = ingest_rfid_scans(read_scans(stream, fmt), options["batch_size"])
+
+            for error in stats.errors:
+                self.stderr.write(f"rejected: {error}")
+            self.stdout.write(
+                f"{path}: read {stats.read}, wrote {stats.written}, "
+                f"rejected {stats.rejected}, duplicates {stats.duplicates} "
+                f"in {stats.batches} batches ({stats.elapsed:.2f}s, "
+                f"{stats.rows_per_sec:.0f} rows/sec)"
+            )
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from raw_data.partitions import SCAN_PARTITIONS
+
+
+def _parse_month(value: str) -> int:
+    try:
+        year, month = (int(part) for part in value.split("-"))
+    except ValueError:
+        raise CommandError(f"Expected YYYY-MM, got {value!r}") from None
+    if not 1 <= month <= 12:
+        raise CommandError(f"Expected YYYY-MM, got {value!r}")
+    return year * 100 + month
+
+
+class Command(BaseCommand):
+    help = "Rotate closed months of scan facts into monthly partition tables and detach old ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--kind",
+            choices=sorted(SCAN_PARTITIONS),
+            action="append",
+            help="Scan tables to process (default: all).",
+        )
+        parser.add_argument(
+            "--hot-months",
+            type=int,
+            help="Months kept in the hot table, including the current one (default: SCAN_HOT_MONTHS).",
+        )
+        parser.add_argument(
+            "--detach-before",
+            metavar="YYYY-MM",
+            help="Detach partitions older than this month.",
+        )
+        parser.add_argument(
+            "--drop",
+            action="store_true",
+            help="Drop detached partitions instead of renaming them.",
+        )
+
+    def handle(self, *args, **options):
+        if options["hot_months"] is not None and options["hot_months"] < 1:
+            raise CommandError("--hot-months must be at least 1")
+        detach_before = _parse_month(options["detach_before"]) if options["detach_before"] else None
+
+        for kind in options["kind"] or sorted(SCAN_PARTITIONS):
+            partitions = SCAN_PARTITIONS[kind]
+            stats = partitions.rotate(hot_months=options["hot_months"])
+            self.stdout.write(
+                f"{kind}: moved {stats.total} rows from {len(stats.moved)} months, "
+                f"created {len(stats.created)} partitions"
+            )
+            if detach_before is not None:
+                detached = partitions.detach_before(detach_before, drop=options["drop"])
+                action = "dropped" if options["drop"] else "detached"
+                self.stdout.write(f"{kind}: {action} {len(detached)} partitions")
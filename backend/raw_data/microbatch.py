@@ -0,0 +1,360 @@
+"""In-process micro-batching for the async scan ingestion endpoints.
+
+Endpoints validate posted scans, hand them to a :class:`MicroBatcher` and
+answer ``202 Accepted`` as soon as the scans are buffered; they never wait
+for the database.  One flusher task per batcher takes up to ``max_batch``
+scans once that many are waiting or the oldest has waited ``max_delay_ms``,
+and writes them with :class:`raw_data.ingestion.RFIDScanWriter` (or its NIR
+variant) on a dedicated writer thread, so writes are serialized and the
+event loop keeps accepting scans while a batch is in flight.
+
+The buffer holds at most ``max_queue`` scans.  A request that does not fit
+waits up to ``enqueue_timeout`` seconds for the flusher to make room and is
+otherwise refused with :class:`QueueFull`, which the endpoints turn into
+``503`` with ``Retry-After``; clients slow down instead of the process
+growing without bound.
+
+A batch the writer fails on is retried ``write_retries`` times with
+backoff on the writer thread; a batch that still fails is logged and counted
+as ``failed`` with its ``last_error`` in the stats.  Accepted scans are
+durable only once flushed: scans still buffered when the process dies are
+lost, and clients that need stronger guarantees should use the
+``ingest_rfid`` command.
+
+Buffering needs an event loop that outlives the request.  Under WSGI every
+async view runs on a loop of its own, so the endpoints write the scans
+before answering instead (:meth:`MicroBatcher.write_now`).  A batcher that
+is replaced by one for a new loop writes what it still holds before its
+writer thread stops.
+
+The endpoints take either a JWT (``Authorization: Bearer``) or one of the
+``INGEST_TOKENS`` in ``X-Ingest-Token``, for scanners that have no user
+account (:func:`authorize`).
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from accounts.authentication import authenticate_header
+
+from .ingestion import (
+    MAX_REPORTED_ERRORS,
+    NIRScanWriter,
+    RFIDScanWriter,
+    ScanValidationError,
+    parse_nir_scan,
+    parse_scan,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH = 1000
+DEFAULT_MAX_DELAY_MS = 50
+DEFAULT_MAX_QUEUE = 50000
+DEFAULT_ENQUEUE_TIMEOUT = 1.0
+DEFAULT_WRITE_RETRIES = 3
+DEFAULT_RETRY_DELAY = 0.1
+
+
+class QueueFull(Exception):
+    """Raised when scans cannot be buffered within the enqueue timeout."""
+
+
+class WriteFailed(Exception):
+    """Raised when scans written before answering could not be written."""
+
+
+@dataclass
+class BatcherStats:
+    accepted: int = 0
+    refused: int = 0
+    flushes: int = 0
+    flushed: int = 0
+    failed: int = 0
+    retries: int = 0
+    queued: int = 0
+    max_queued: int = 0
+    last_flush_ms: float = 0.0
+    last_error: str = ""
+
+
+class MicroBatcher:
+    """Buffer scans on the event loop and flush them in size/time-bound batches."""
+
+    def __init__(
+        self,
+        writer: Any,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_delay_ms: float = DEFAULT_MAX_DELAY_MS,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        enqueue_timeout: float = DEFAULT_ENQUEUE_TIMEOUT,
+        write_retries: int = DEFAULT_WRITE_RETRIES,
+        retry_delay: float = DEFAULT_RETRY_DELAY,
+        name: str = "ingest",
+    ) -> None:
+        if max_batch < 1 or max_queue < max_batch:
+            raise ValueError("max_batch must be positive and no larger than max_queue")
+        self.writer = writer
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+        self.max_queue = max_queue
+        self.enqueue_timeout = enqueue_timeout
+        self.write_retries = write_retries
+        self.retry_delay = retry_delay
+        self.stats = BatcherStats()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._buffer: List[Any] = []
+        self._first_at = 0.0
+        self._in_flight = False
+
+    @property
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        return self._loop
+
+    def _start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._has_items = asyncio.Event()
+        self._batch_due = asyncio.Event()
+        self._has_space = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._has_space.set()
+        self._idle.set()
+        self._task = self._loop.create_task(self._run())
+
+    async def submit(self, items: List[Any]) -> int:
+        """Buffer ``items``, waiting for room if the buffer is full."""
+
+        if self._loop is None:
+            self._start()
+        if len(items) > self.max_queue:
+            self.stats.refused += len(items)
+            raise QueueFull(f"{len(items)} scans exceed the queue size of {self.max_queue}")
+        deadline = time.monotonic() + self.enqueue_timeout
+        while len(self._buffer) + len(items) > self.max_queue:
+            self._has_space.clear()
+            remaining = deadline - time.monotonic()
+            try:
+                await asyncio.wait_for(self._has_space.wait(), remaining)
+            except asyncio.TimeoutError:
+                self.stats.refused += len(items)
+                raise QueueFull("ingestion queue is full") from None
+
+        if not self._buffer:
+            self._first_at = time.monotonic()
+        self._buffer.extend(items)
+        self._idle.clear()
+        self._has_items.set()
+        if len(self._buffer) >= self.max_batch:
+            self._batch_due.set()
+        self.stats.accepted += len(items)
+        self.stats.queued = len(self._buffer)
+        self.stats.max_queued = max(self.stats.max_queued, self.stats.queued)
+        return len(items)
+
+    async def write_now(self, items: List[Any]) -> int:
+        """Write ``items`` on the writer thread and wait for them, unbuffered.
+
+        For callers without a long-lived event loop; raises
+        :class:`WriteFailed` if the batch could not be written.
+        """
+
+        self.stats.accepted += len(items)
+        try:
+            await asyncio.wrap_future(self._executor.submit(self._flush, items))
+        except Exception as exc:
+            raise WriteFailed("scans could not be written") from exc
+        return len(items)
+
+    async def drain(self) -> None:
+        """Wait until every buffered scan has been written."""
+
+        if self._loop is None:
+            return
+        while self._buffer or self._in_flight:
+            self._batch_due.set()
+            await self._idle.wait()
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_items.wait()
+            wait = self.max_delay - (time.monotonic() - self._first_at)
+            if len(self._buffer) < self.max_batch and wait > 0:
+                try:
+                    await asyncio.wait_for(self._batch_due.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_due.clear()
+
+            batch = self._buffer[: self.max_batch]
+            del self._buffer[: self.max_batch]
+            self._first_at = time.monotonic()
+            if not self._buffer:
+                self._has_items.clear()
+            self._has_space.set()
+            self.stats.queued = len(self._buffer)
+
+            self._in_flight = True
+            try:
+                await self._loop.run_in_executor(self._executor, self._flush, batch)
+            except Exception:
+                pass  # Logged and counted by _flush.
+            finally:
+                self._in_flight = False
+            if not self._buffer:
+                self._idle.set()
+
+    def _flush(self, batch: List[Any]) -> int:
+        # Runs on the writer thread, which keeps its own connection.
+        started = time.perf_counter()
+        try:
+            written = self._write(batch)
+        except Exception as exc:
+            self.stats.failed += len(batch)
+            self.stats.last_error = f"{type(exc).__name__}: {exc}"
+            logger.exception("Failed to write %d accepted scans after %d attempts", len(batch), self.write_retries + 1)
+            raise
+        else:
+            self.stats.flushed += len(batch)
+            return written
+        finally:
+            self.stats.flushes += 1
+            self.stats.last_flush_ms = (time.perf_counter() - started) * 1000
+
+    def _write(self, batch: List[Any]) -> int:
+        attempt = 0
+        while True:
+            close_old_connections()
+            try:
+                return self.writer.write(batch)
+            except Exception:
+                if attempt >= self.write_retries:
+                    raise
+                logger.warning("Retrying a batch of %d scans", len(batch), exc_info=True)
+                self.stats.retries += 1
+                time.sleep(self.retry_delay * 2 ** attempt)
+                attempt += 1
+
+    def close(self) -> None:
+        """Stop the writer thread once the scans still buffered are written.
+
+        The writes run in the background; ``close`` does not wait for them.
+        """
+
+        batch, self._buffer = self._buffer, []
+        self.stats.queued = 0
+        if batch:
+            self._executor.submit(self._flush, batch)
+        self._executor.shutdown(wait=False)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {**asdict(self.stats), "writer": asdict(self.writer.stats)}
+
+
+# Scan kind -> (record parser, writer class).
+KINDS: Dict[str, tuple] = {
+    "rfid": (parse_scan, RFIDScanWriter),
+    "nir": (parse_nir_scan, NIRScanWriter),
+}
+
+_batchers: Dict[str, MicroBatcher] = {}
+_lock = threading.Lock()
+
+
+def _setting(name: str, default):
+    return getattr(settings, "INGEST_BATCHING", {}).get(name, default)
+
+
+def get_batcher(kind: str, factory: Optional[Callable[[], MicroBatcher]] = None) -> MicroBatcher:
+    """The batcher for ``kind`` bound to the running event loop.
+
+    A batcher belongs to the loop it first ran on; a new loop (a restarted
+    server worker, or each async test) gets a fresh one.
+    """
+
+    loop = asyncio.get_running_loop()
+    with _lock:
+        batcher = _batchers.get(kind)
+        if batcher is None or (batcher.loop is not None and batcher.loop is not loop):
+            if batcher is not None:
+                batcher.close()
+            if factory is not None:
+                batcher = factory()
+            else:
+                batcher = MicroBatcher(
+                    KINDS[kind][1](),
+                    max_batch=_setting("MAX_BATCH", DEFAULT_MAX_BATCH),
+                    max_delay_ms=_setting("MAX_DELAY_MS", DEFAULT_MAX_DELAY_MS),
+                    max_queue=_setting("MAX_QUEUE", DEFAULT_MAX_QUEUE),
+                    enqueue_timeout=_setting("ENQUEUE_TIMEOUT", DEFAULT_ENQUEUE_TIMEOUT),
+                    write_retries=_setting("WRITE_RETRIES", DEFAULT_WRITE_RETRIES),
+                    name=f"ingest-{kind}",
+                )
+            _batchers[kind] = batcher
+        return batcher
+
+
+def batcher_stats() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        return {kind: batcher.as_dict() for kind, batcher in _batchers.items()}
+
+
+async def authorize(authorization: str, ingest_token: str) -> bool:
+    """True if the request carries a valid JWT or a configured ingest token."""
+
+    if ingest_token and any(
+        hmac.compare_digest(ingest_token.encode(), token.encode()) for token in getattr(settings, "INGEST_TOKENS", ())
+    ):
+        return True
+    return bool(authorization) and await authenticate_header(authorization) is not None
+
+
+async def ingest_payload(kind: str, body: bytes, buffered: bool = True) -> Tuple[int, Dict[str, Any]]:
+    """Validate a posted JSON scan or array of scans and buffer the valid ones.
+
+    With ``buffered=False`` the scans are written before returning.  Returns
+    the HTTP status and JSON body for the response: ``202`` when every scan
+    was accepted, ``207`` when some were rejected and ``400`` when none was
+    accepted.
+    """
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return 400, {"detail": "Body must be JSON."}
+    records = payload if isinstance(payload, list) else [payload]
+    parse = KINDS[kind][0]
+
+    scans, errors = [], []
+    for index, record in enumerate(records):
+        try:
+            if not isinstance(record, dict):
+                raise ScanValidationError(f"item {index}: expected a JSON object")
+            scans.append(parse(record))
+        except ScanValidationError as exc:
+            errors.append(str(exc))
+        except (ValueError, TypeError, OverflowError) as exc:
+            # A record the parser did not anticipate is still only one record.
+            errors.append(f"item {index}: {exc}")
+
+    if scans:
+        batcher = get_batcher(kind)
+        try:
+            if buffered:
+                await batcher.submit(scans)
+            else:
+                await batcher.write_now(scans)
+        except (QueueFull, WriteFailed) as exc:
+            return 503, {"detail": str(exc)}
+    status = 400 if not scans else 207 if errors else 202
+    return status, {"accepted": len(scans), "rejected": len(errors), "errors": errors[:MAX_REPORTED_ERRORS]}
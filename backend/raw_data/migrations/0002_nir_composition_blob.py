@@ -0,0 +1,104 @@
+import math
+import struct
+
+from django.db import migrations, models
+
+# Frozen copy of the raw_data.nir codec as of this migration, so later
+# changes to the app code cannot change what it writes.
+COMPONENTS = (
+    "cotton",
+    "polyester",
+    "wool",
+    "viscose",
+    "nylon",
+    "elastane",
+    "linen",
+    "acrylic",
+    "silk",
+    "hemp",
+    "other",
+)
+OTHER = COMPONENTS.index("other")
+BATCH_SIZE = 2000
+
+
+def encode(composition):
+    """Float32 fractions of ``composition``; unusable shares are skipped.
+
+    Legacy values that are not a mapping or hold no usable share are stored
+    as entirely ``"other"`` instead of aborting the migration.
+    """
+
+    vector = [0.0] * len(COMPONENTS)
+    if isinstance(composition, dict):
+        for name, share in composition.items():
+            try:
+                value = float(share)
+            except (TypeError, ValueError):
+                continue
+            if value < 0 or not math.isfinite(value):
+                continue
+            name = str(name).strip().lower()
+            vector[COMPONENTS.index(name) if name in COMPONENTS else OTHER] += value
+    total = sum(vector)
+    if total <= 0:
+        vector, total = [0.0] * len(COMPONENTS), 1.0
+        vector[OTHER] = 1.0
+    return struct.pack(f"<{len(COMPONENTS)}f", *(value / total for value in vector))
+
+
+def decode(blob):
+    blob = bytes(blob)
+    count = len(blob) // 4
+    values = struct.unpack(f"<{count}f", blob[: count * 4])
+    return {name: round(value, 4) for name, value in zip(COMPONENTS, values) if value > 0}
+
+
+def _convert(apps, source, target, convert):
+    RawInputNIRFact = apps.get_model("raw_data", "RawInputNIRFact")
+    last = None
+    while True:
+        chunk = RawInputNIRFact.objects.order_by("scanner_id").only("scanner_id", source)
+        if last is not None:
+            chunk = chunk.filter(scanner_id__gt=last)
+        scans = list(chunk[:BATCH_SIZE])
+        if not scans:
+            return
+        for scan in scans:
+            setattr(scan, target, convert(getattr(scan, source)))
+        RawInputNIRFact.objects.bulk_update(scans, [target])
+        last = scans[-1].scanner_id
+
+
+def json_to_blob(apps, schema_editor):
+    _convert(apps, "composition_json", "composition", encode)
+
+
+def blob_to_json(apps, schema_editor):
+    _convert(apps, "composition", "composition_json", decode)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("raw_data", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rawinputnirfact",
+            name="composition",
+            field=models.BinaryField(default=b""),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name="rawinputnirfact",
+            name="composition_json",
+            field=models.JSONField(null=True),
+        ),
+        migrations.RunPython(json_to_blob, blob_to_json),
+        migrations.RemoveField(
+            model_name="rawinputnirfact",
+            name="composition_json",
+        ),
+    ]
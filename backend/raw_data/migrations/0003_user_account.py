@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("raw_data", "0002_nir_composition_blob"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rawuserdim",
+            name="account",
+            field=models.OneToOneField(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="raw_profile",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("raw_data", "0003_user_account"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="rawinputnirfact",
+            index=models.Index(fields=["scan_time"], name="raw_nir_scan_time_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="rawinputrfidfact",
+            index=models.Index(fields=["scan_time"], name="raw_rfid_scan_time_idx"),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("raw_data", "0004_scan_time_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RawArchiveSegment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("kind", models.CharField(max_length=50)),
+                ("path", models.CharField(max_length=500, unique=True)),
+                ("facility_id", models.IntegerField()),
+                ("day", models.DateField()),
+                ("row_count", models.IntegerField()),
+                ("min_time", models.DateTimeField()),
+                ("max_time", models.DateTimeField()),
+                ("column_stats", models.JSONField()),
+                ("size_bytes", models.BigIntegerField()),
+                ("sha256", models.CharField(max_length=64)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["kind", "day", "facility_id"],
+                        name="raw_archive_segment_idx",
+                    )
+                ],
+            },
+        ),
+    ]
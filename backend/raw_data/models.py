@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 
 
@@ -6,6 +7,10 @@ class RawUserDim(models.Model):
     org_id = models.CharField(max_length=255)
     role = models.CharField(max_length=100)
     settings_json = models.JSONField()
+    # Login account whose tokens carry this user's org_id and role.
+    account = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="raw_profile"
+    )
 
 
 class RawFacilityDim(models.Model):
@@ -146,14 +151,27 @@ class RawInputRFIDFact(models.Model):
     scan_time = models.DateTimeField()
     context_json = models.JSONField()
 
+    class Meta:
+        # Older months are rotated out to raw_data.partitions tables.
+        indexes = [models.Index(fields=["scan_time"], name="raw_rfid_scan_time_idx")]
+
 
 class RawInputNIRFact(models.Model):
     scanner_id = models.CharField(primary_key=True, max_length=255)
     facility = models.ForeignKey(RawFacilityDim, on_delete=models.CASCADE)
     scan_time = models.DateTimeField()
-    composition_json = models.JSONField()
+    # float32 vector over raw_data.nir.COMPONENTS; see composition_dict() for JSON.
+    composition = models.BinaryField()
     stage = models.CharField(max_length=100)
 
+    class Meta:
+        indexes = [models.Index(fields=["scan_time"], name="raw_nir_scan_time_idx")]
+
+    def composition_dict(self):
+        from .nir import composition_to_dict
+
+        return composition_to_dict(self.composition)
+
 
 class RawOrderSubmissionFact(models.Model):
     order_id = models.AutoField(primary_key=True)
@@ -164,3 +182,23 @@ class RawOrderSubmissionFact(models.Model):
     unit_mapping_json = models.JSONField()
 
 
+class RawArchiveSegment(models.Model):
+    """A compressed columnar file of fact rows moved out by ``raw_data.archive``."""
+
+    kind = models.CharField(max_length=50)
+    # Relative to settings.RAW_ARCHIVE_DIR.
+    path = models.CharField(max_length=500, unique=True)
+    # Plain ids: archived history outlives the facility rows it refers to.
+    facility_id = models.IntegerField()
+    day = models.DateField()
+    row_count = models.IntegerField()
+    min_time = models.DateTimeField()
+    max_time = models.DateTimeField()
+    # {column: [min, max]} for the columns predicates can be pushed down to.
+    column_stats = models.JSONField()
+    size_bytes = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["kind", "day", "facility_id"], name="raw_archive_segment_idx")]
@@ -0,0 +1,197 @@
+"""Compact storage and vectorized classification of NIR compositions.
+
+A NIR reading is a fibre composition such as ``{"cotton": 60, "polyester":
+40}``.  ``RawInputNIRFact.composition`` stores it as a little-endian float32
+vector over the fixed :data:`COMPONENTS` vocabulary, normalised to fractions
+that sum to one.  Components outside the vocabulary are folded into
+``"other"``.  Appending to the vocabulary keeps existing blobs readable:
+shorter vectors are zero-padded on decode.
+
+Scans are loaded into one ``(n, len(COMPONENTS))`` array straight from the
+blobs and scored against reference profiles derived from ``RawMaterialDim``
+``type`` / ``blend_ratio`` with a single matrix product per chunk.  JSON is
+only produced for export (:func:`composition_to_dict`).
+"""
+
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .models import RawInputNIRFact, RawMaterialDim
+
+COMPONENTS: Tuple[str, ...] = (
+    "cotton",
+    "polyester",
+    "wool",
+    "viscose",
+    "nylon",
+    "elastane",
+    "linen",
+    "acrylic",
+    "silk",
+    "hemp",
+    "other",
+)
+COMPONENT_INDEX: Dict[str, int] = {name: i for i, name in enumerate(COMPONENTS)}
+OTHER = COMPONENT_INDEX["other"]
+DTYPE = np.dtype("<f4")
+CLASSIFY_CHUNK_SIZE = 10000
+
+_SEPARATORS = re.compile(r"\s*(?:/|,|\+|&|-|\band\b)\s*")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def _component(name: str) -> int:
+    return COMPONENT_INDEX.get(name.strip().lower(), OTHER)
+
+
+def composition_vector(composition: Mapping[str, float]) -> np.ndarray:
+    """Normalised float32 vector for a ``{component: share}`` mapping."""
+
+    vector = np.zeros(len(COMPONENTS), dtype=DTYPE)
+    for name, share in composition.items():
+        try:
+            value = float(share)
+        except (TypeError, ValueError):
+            raise ValueError(f"composition share for {name!r} is not a number: {share!r}")
+        if value < 0 or not np.isfinite(value):
+            raise ValueError(f"composition share for {name!r} must be a non-negative number")
+        vector[_component(str(name))] += value
+    total = vector.sum()
+    if total <= 0:
+        raise ValueError("composition is empty")
+    return vector / total
+
+
+def encode_composition(composition: Mapping[str, float]) -> bytes:
+    return composition_vector(composition).tobytes()
+
+
+def decode_composition(blob: bytes) -> np.ndarray:
+    vector = np.frombuffer(bytes(blob), dtype=DTYPE)
+    if len(vector) < len(COMPONENTS):
+        vector = np.pad(vector, (0, len(COMPONENTS) - len(vector)))
+    return vector
+
+
+def composition_to_dict(blob: bytes, precision: int = 4) -> Dict[str, float]:
+    """Export a stored composition as ``{component: fraction}``, zeros omitted."""
+
+    vector = decode_composition(blob)
+    return {
+        name: round(float(value), precision)
+        for name, value in zip(COMPONENTS, vector.tolist())
+        if value > 0
+    }
+
+
+def composition_matrix(blobs: Sequence[bytes]) -> np.ndarray:
+    """Stack stored compositions into one ``(n, len(COMPONENTS))`` array."""
+
+    width = len(COMPONENTS) * DTYPE.itemsize
+    if all(len(blob) == width for blob in blobs):
+        data = np.frombuffer(b"".join(bytes(blob) for blob in blobs), dtype=DTYPE)
+        return data.reshape(len(blobs), len(COMPONENTS))
+    matrix = np.zeros((len(blobs), len(COMPONENTS)), dtype=DTYPE)
+    for row, blob in enumerate(blobs):
+        matrix[row] = decode_composition(blob)
+    return matrix
+
+
+def blend_vector(material_type: str, blend_ratio: str) -> np.ndarray:
+    """Reference vector for a material such as ``("cotton/polyester", "60/40")``.
+
+    Ratios that are missing or do not line up with the component names are
+    replaced by an even split.
+    """
+
+    names = [name for name in _SEPARATORS.split(material_type or "") if name]
+    if not names:
+        names = ["other"]
+    ratios = [float(value) for value in _NUMBER.findall(blend_ratio or "")]
+    if len(ratios) != len(names) or sum(ratios) <= 0:
+        ratios = [1.0] * len(names)
+    return composition_vector(_sum_shares(zip(names, ratios)))
+
+
+def _sum_shares(pairs: Iterable[Tuple[str, float]]) -> Dict[str, float]:
+    totals: Dict[str, float] = {}
+    for name, value in pairs:
+        totals[name] = totals.get(name, 0.0) + value
+    return totals
+
+
+@dataclass
+class ReferenceProfiles:
+    material_ids: np.ndarray
+    matrix: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.material_ids)
+
+
+@dataclass
+class Classification:
+    """Best-matching material per scan; ``distance`` is Euclidean over fractions."""
+
+    material_ids: np.ndarray
+    distances: np.ndarray
+
+
+def load_reference_profiles(queryset=None) -> ReferenceProfiles:
+    if queryset is None:
+        queryset = RawMaterialDim.objects.all()
+    rows = list(queryset.order_by("material_id").values_list("material_id", "type", "blend_ratio"))
+    matrix = np.zeros((len(rows), len(COMPONENTS)), dtype=DTYPE)
+    for i, (_, material_type, blend_ratio) in enumerate(rows):
+        matrix[i] = blend_vector(material_type, blend_ratio)
+    material_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    return ReferenceProfiles(material_ids, matrix)
+
+
+def classify(
+    scans: np.ndarray,
+    profiles: ReferenceProfiles,
+    chunk_size: int = CLASSIFY_CHUNK_SIZE,
+) -> Classification:
+    """Score every row of ``scans`` against every profile and keep the closest."""
+
+    if not len(profiles):
+        raise ValueError("no reference profiles to classify against")
+    reference = profiles.matrix.astype(np.float32)
+    reference_sq = np.einsum("ij,ij->i", reference, reference)
+    best = np.empty(len(scans), dtype=np.int64)
+    distances = np.empty(len(scans), dtype=np.float32)
+    for start in range(0, len(scans), chunk_size):
+        chunk = scans[start:start + chunk_size]
+        # ||x - p||^2 = ||x||^2 + ||p||^2 - 2 x.p, for all pairs at once.
+        squared = (
+            np.einsum("ij,ij->i", chunk, chunk)[:, None]
+            + reference_sq[None, :]
+            - 2.0 * chunk @ reference.T
+        )
+        index = squared.argmin(axis=1)
+        best[start:start + len(chunk)] = index
+        distances[start:start + len(chunk)] = np.sqrt(
+            np.maximum(squared[np.arange(len(chunk)), index], 0.0)
+        )
+    return Classification(profiles.material_ids[best], distances)
+
+
+def classify_scans(
+    queryset=None,
+    profiles: Optional[ReferenceProfiles] = None,
+    chunk_size: int = CLASSIFY_CHUNK_SIZE,
+) -> Tuple[List[str], Classification]:
+    """Classify stored NIR scans; returns scanner ids alongside the result."""
+
+    if queryset is None:
+        queryset = RawInputNIRFact.objects.all()
+    if profiles is None:
+        profiles = load_reference_profiles()
+    rows = list(queryset.values_list("scanner_id", "composition"))
+    scanner_ids = [row[0] for row in rows]
+    scans = composition_matrix([row[1] for row in rows])
+    return scanner_ids, classify(scans, profiles, chunk_size)
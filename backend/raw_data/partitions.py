@@ -0,0 +1,257 @@
+"""Monthly partitions for the high-volume scan fact tables.
+
+``RawInputRFIDFact`` and ``RawInputNIRFact`` are upserted on their tag and
+scanner ids, and ``scan_time`` is not part of those keys, so the tables are
+partitioned here rather than with PostgreSQL declarative partitioning (which
+needs the partition column in every unique key) -- and the same scheme works
+on SQLite.
+
+The model's own table is the *hot* partition: all writes go there, so the
+ingestion path, the ORM and the upsert keys are unchanged.  :meth:`rotate`
+moves each closed month older than the hot window into a table of its own,
+``<db_table>_pYYYYMM``, created on first use with the same columns and an
+index on ``scan_time``.  A row is moved in one transaction per month; a scan
+of an archived tag later in time lands in the hot table again, so each
+monthly table keeps the readings taken in that month.
+
+:meth:`querysets` and :meth:`values_list` prune a time-window query to the
+tables that can hold matching rows: a query over the last 24 hours only
+touches the hot table however much history has been rotated out.  Old
+months are detached by renaming their table to ``<db_table>_dYYYYMM``, which
+takes it out of every query without copying rows, or dropped outright.
+"""
+
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.db import connection, models, transaction
+from django.db.models import Min, QuerySet
+from django.utils import timezone
+
+from main.caching import mark_models_stale
+
+from .models import RawInputNIRFact, RawInputRFIDFact
+
+DEFAULT_HOT_MONTHS = 1
+
+
+def month_key(value: datetime) -> int:
+    """``YYYYMM`` of ``value`` in UTC."""
+
+    value = value.astimezone(dt_timezone.utc)
+    return value.year * 100 + value.month
+
+
+def month_start(month: int) -> datetime:
+    return datetime(month // 100, month % 100, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(month: int) -> int:
+    year, mon = divmod(month, 100)
+    return (year + 1) * 100 + 1 if mon == 12 else month + 1
+
+
+def add_months(month: int, count: int) -> int:
+    year, mon = divmod(month, 100)
+    index = year * 12 + mon - 1 + count
+    return (index // 12) * 100 + index % 12 + 1
+
+
+@dataclass
+class RotationStats:
+    """Rows moved out of the hot table, per month."""
+
+    moved: Dict[int, int] = field(default_factory=dict)
+    created: List[int] = field(default_factory=list)
+
+    @property
+    def total(self) -> int:
+        return sum(self.moved.values())
+
+
+class MonthlyPartitions:
+    """Month-partitioned history of one scan fact model."""
+
+    def __init__(self, model: type, time_field: str = "scan_time") -> None:
+        self.model = model
+        self.time_field = time_field
+        self.table = model._meta.db_table
+        self._pattern = re.compile(rf"^{re.escape(self.table)}_p(\d{{6}})$")
+        self._models: Dict[int, type] = {}
+        self._lock = threading.Lock()
+
+    # -- partition tables --------------------------------------------------
+
+    def partition_table(self, month: int) -> str:
+        return f"{self.table}_p{month}"
+
+    def detached_table(self, month: int) -> str:
+        return f"{self.table}_d{month}"
+
+    def partition_model(self, month: int) -> type:
+        """Unmanaged model over the table of ``month``.
+
+        Relations keep their columns but drop the database constraint and
+        reverse accessor, so deleting a facility never reaches into history.
+        """
+
+        with self._lock:
+            model = self._models.get(month)
+            if model is not None:
+                return model
+            table = self.partition_table(month)
+            attrs: Dict[str, Any] = {"__module__": self.model.__module__}
+            for source in self.model._meta.concrete_fields:
+                name, _, args, kwargs = source.deconstruct()
+                if source.is_relation:
+                    kwargs.update(on_delete=models.DO_NOTHING, related_name="+", db_constraint=False)
+                attrs[name] = source.__class__(*args, **kwargs)
+            attrs["Meta"] = type("Meta", (), {
+                "app_label": self.model._meta.app_label,
+                "db_table": table,
+                "managed": False,
+                "indexes": [models.Index(fields=[self.time_field], name=f"{table}_ts")],
+            })
+            model = type(f"{self.model.__name__}P{month}", (models.Model,), attrs)
+            self._models[month] = model
+            return model
+
+    def months(self) -> List[int]:
+        """Months with an attached partition table, oldest first."""
+
+        tables = connection.introspection.table_names()
+        return sorted(int(m.group(1)) for m in map(self._pattern.match, tables) if m)
+
+    def ensure_partition(self, month: int) -> bool:
+        """Create the table of ``month`` if needed; True if it was created."""
+
+        if month in self.months():
+            return False
+        with connection.schema_editor() as editor:
+            editor.create_model(self.partition_model(month))
+        return True
+
+    # -- rotation ----------------------------------------------------------
+
+    def hot_window_start(self, now: Optional[datetime] = None, hot_months: Optional[int] = None) -> int:
+        """First month kept in the hot table."""
+
+        if hot_months is None:
+            hot_months = getattr(settings, "SCAN_HOT_MONTHS", DEFAULT_HOT_MONTHS)
+        return add_months(month_key(now or timezone.now()), -max(hot_months - 1, 0))
+
+    def rotate(self, now: Optional[datetime] = None, hot_months: Optional[int] = None) -> RotationStats:
+        """Move closed months older than the hot window into their partitions."""
+
+        stats = RotationStats()
+        first_hot = self.hot_window_start(now, hot_months)
+        oldest = self.model.objects.aggregate(oldest=Min(self.time_field))["oldest"]
+        if oldest is None:
+            return stats
+        month = month_key(oldest)
+        while month < first_hot:
+            if not self._month_rows(month).exists():
+                month = next_month(month)
+                continue
+            if self.ensure_partition(month):
+                stats.created.append(month)
+            moved = self._move_month(month)
+            if moved:
+                stats.moved[month] = moved
+            month = next_month(month)
+        return stats
+
+    def _month_rows(self, month: int) -> QuerySet:
+        return self.model.objects.filter(**{
+            f"{self.time_field}__gte": month_start(month),
+            f"{self.time_field}__lt": month_start(next_month(month)),
+        })
+
+    def _move_month(self, month: int) -> int:
+        rows = self._month_rows(month)
+        target = self.partition_model(month)
+        pk = self.model._meta.pk.attname
+        quote = connection.ops.quote_name
+        fields = self.model._meta.concrete_fields
+        columns = ", ".join(quote(f.column) for f in fields)
+        select_sql, params = rows.values_list(*[f.attname for f in fields]).query.sql_with_params()
+        with transaction.atomic():
+            # A key rotated out earlier and re-ingested with a time in the
+            # same month replaces the older copy.
+            target.objects.filter(**{f"{pk}__in": rows.values(pk)}).delete()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {quote(target._meta.db_table)} ({columns}) {select_sql}",
+                    params,
+                )
+                moved = cursor.rowcount
+            rows.delete()
+            mark_models_stale(self.model)
+        return moved
+
+    # -- detaching ---------------------------------------------------------
+
+    def detach(self, month: int, drop: bool = False) -> None:
+        """Take the table of ``month`` out of queries, renaming or dropping it."""
+
+        model = self.partition_model(month)
+        with connection.schema_editor() as editor:
+            if drop:
+                editor.delete_model(model)
+            else:
+                editor.alter_db_table(model, model._meta.db_table, self.detached_table(month))
+
+    def detach_before(self, month: int, drop: bool = False) -> List[int]:
+        """Detach every partition older than ``month``."""
+
+        detached = [old for old in self.months() if old < month]
+        for old in detached:
+            self.detach(old, drop=drop)
+        return detached
+
+    # -- queries -----------------------------------------------------------
+
+    def querysets(self, start: Optional[datetime] = None, end: Optional[datetime] = None, **filters) -> List[QuerySet]:
+        """One filtered queryset per table that can hold rows in ``[start, end)``.
+
+        The hot table is always included: late-arriving scans sit there
+        until the next rotation whatever their time.
+        """
+
+        window = dict(filters)
+        if start is not None:
+            window[f"{self.time_field}__gte"] = start
+        if end is not None:
+            window[f"{self.time_field}__lt"] = end
+        first = month_key(start) if start is not None else None
+        # ``end`` is exclusive: a window ending at midnight on the 1st does
+        # not reach into that month.
+        last = month_key(end - datetime.resolution) if end is not None else None
+
+        querysets = [self.model.objects.filter(**window)]
+        for month in self.months():
+            if (first is None or month >= first) and (last is None or month <= last):
+                querysets.append(self.partition_model(month).objects.filter(**window))
+        return querysets
+
+    def count(self, start: Optional[datetime] = None, end: Optional[datetime] = None, **filters) -> int:
+        return sum(qs.count() for qs in self.querysets(start, end, **filters))
+
+    def values_list(
+        self, *fields: str, start: Optional[datetime] = None, end: Optional[datetime] = None, **filters
+    ) -> Iterator[tuple]:
+        """Rows of ``fields`` across the pruned tables, table by table."""
+
+        for qs in self.querysets(start, end, **filters):
+            yield from qs.values_list(*fields).iterator()
+
+
+# Scan kind -> partitioned history, as in ``raw_data.microbatch.KINDS``.
+SCAN_PARTITIONS: Dict[str, MonthlyPartitions] = {
+    "rfid": MonthlyPartitions(RawInputRFIDFact),
+    "nir": MonthlyPartitions(RawInputNIRFact),
+}
@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .factor_index import factor_index
+from .models import RawEmissionFactorDim
+
+
+@receiver(post_save, sender=RawEmissionFactorDim)
+@receiver(post_delete, sender=RawEmissionFactorDim)
+def invalidate_factor_index(sender, **kwargs):
+    # Drop this process's copy now; other processes are told once the change
+    # is committed so they cannot reload the pre-commit state.
+    factor_index.clear()
+    transaction.on_commit(factor_index.invalidate)
@@ -1,3 +1,643 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from main.watermarks import get_watermark
+
+from . import archive as archive_module
+from .archive import archive_before, iter_archived_rows, query_archive
+from .asgi import IngestRouter
+from .factor_index import VERSION_WATERMARK, EmissionFactorIndex, factor_index
+from .gsheet_import import import_sheet, row_hash
+from .ingestion import IngestStats, ingest_rfid_scans, read_scans
+from .microbatch import MicroBatcher, QueueFull, WriteFailed, get_batcher
+from .models import (
+    RawArchiveSegment,
+    RawEmissionFactorDim,
+    RawFacilityDim,
+    RawInputGSheetFact,
+    RawInputNIRFact,
+    RawInputRFIDFact,
+    RawMaterialDim,
+    RawTextileProcessDim,
+)
+from .nir import COMPONENTS, blend_vector, classify_scans, composition_to_dict, encode_composition
+from .partitions import SCAN_PARTITIONS
+
+
+def make_facility(**kwargs):
+    defaults = {
+        "name": "Dock A",
+        "location": "IN",
+        "org_id": "org-1",
+        "boundary_conditions_json": {},
+    }
+    defaults.update(kwargs)
+    return RawFacilityDim.objects.create(**defaults)
+
+
+class RFIDIngestionTests(TestCase):
+    def setUp(self):
+        self.facility = make_facility()
+
+    def test_ndjson_upsert_and_rejections(self):
+        lines = [
+            {"tag_id": "t1", "batch_id": "b1", "facility_id": self.facility.pk,
+             "scan_time": "2025-01-01T10:00:00Z"},
+            {"tag_id": "t2", "batch_id": "b1", "facility_id": self.facility.pk,
+             "scan_time": "2025-01-01T10:00:01Z", "context_json": {"dock": 3}},
+            {"tag_id": "t1", "batch_id": "b2", "facility_id": self.facility.pk,
+             "scan_time": "2025-01-01T10:00:02Z"},
+            {"tag_id": "t3", "batch_id": "b1", "facility_id": 999,
+             "scan_time": "2025-01-01T10:00:03Z"},
+            {"tag_id": "t4", "batch_id": "b1", "facility_id": self.facility.pk,
+             "scan_time": "not-a-date"},
+        ]
+        stream = io.StringIO("\n".join(json.dumps(line) for line in lines) + "\nnot json\n")
+
+        stats = ingest_rfid_scans(read_scans(stream, "ndjson"), batch_size=2)
+
+        self.assertEqual(stats.read, 6)
+        self.assertEqual(stats.written, 3)
+        self.assertEqual(stats.rejected, 3)
+        self.assertEqual(RawInputRFIDFact.objects.count(), 2)
+        self.assertEqual(RawInputRFIDFact.objects.get(pk="t1").batch_id, "b2")
+        self.assertEqual(RawInputRFIDFact.objects.get(pk="t2").context_json, {"dock": 3})
+
+    def test_impossible_scan_times_are_rejected(self):
+        scan_times = ["2024-02-30T00:00:00", 1e20, float("nan"), "2025-01-01T10:00:00Z"]
+        records = [
+            {"tag_id": f"t{n}", "batch_id": "b1", "facility_id": self.facility.pk, "scan_time": scan_time}
+            for n, scan_time in enumerate(scan_times)
+        ]
+        stats = ingest_rfid_scans(records)
+        self.assertEqual((stats.read, stats.rejected, stats.written), (4, 3, 1))
+        self.assertEqual(list(RawInputRFIDFact.objects.values_list("tag_id", flat=True)), ["t3"])
+
+    def test_facilities_resolved_once_per_batch(self):
+        records = [
+            {"tag_id": f"t{i}", "batch_id": "b1", "facility_id": self.facility.pk,
+             "scan_time": "2025-01-01T10:00:00Z"}
+            for i in range(10)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            stats = ingest_rfid_scans(records, batch_size=5)
+
+        lookups = [q for q in ctx.captured_queries if "rawfacilitydim" in q["sql"]]
+        inserts = [q for q in ctx.captured_queries if q["sql"].startswith("INSERT")]
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(stats.batches, 2)
+        self.assertEqual(RawInputRFIDFact.objects.count(), 10)
+
+    def test_command_reads_csv_with_extra_columns(self):
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w", newline="") as handle:
+            handle.write("tag_id,batch_id,facility_id,scan_time,reader\n")
+            handle.write(f"t9,b9,{self.facility.pk},2025-01-01 10:00:00,dock-7\n")
+        self.addCleanup(os.remove, path)
+
+        out = io.StringIO()
+        call_command("ingest_rfid", path, stdout=out)
+
+        scan = RawInputRFIDFact.objects.get(pk="t9")
+        self.assertEqual(scan.context_json, {"reader": "dock-7"})
+        self.assertIn("wrote 1", out.getvalue())
+
+
+class EmissionFactorIndexTests(TestCase):
+    def setUp(self):
+        self.process = RawTextileProcessDim.objects.create(
+            process_name="dyeing", stage="wet", energy_type="grid",
+            unit_of_measurement="kg", details_json={},
+        )
+        self.factor = RawEmissionFactorDim.objects.create(
+            process=self.process, material_type="Cotton", factor_value=2.5,
+            source="x", region="IN",
+        )
+        self.index = EmissionFactorIndex(check_interval=0)
+
+    def test_lookup_is_served_from_memory(self):
+        # Between version checks lookups never reach the database.
+        self.index.check_interval = 60
+        self.index.entries()
+        with self.assertNumQueries(0):
+            entry = self.index.lookup(self.process.pk, "cotton", "in")
+            missing = self.index.lookup(self.process.pk, "wool", "in")
+
+        self.assertEqual(entry.factor_id, self.factor.pk)
+        self.assertIsNone(missing)
+        self.assertEqual(self.index.stats()["hits"], 1)
+        self.assertEqual(self.index.stats()["misses"], 1)
+
+    def test_global_region_fallback(self):
+        RawEmissionFactorDim.objects.create(
+            process=self.process, material_type="cotton", factor_value=1.0,
+            source="x", region="global",
+        )
+        entry = self.index.lookup(self.process.pk, "cotton", "BR")
+        self.assertEqual(entry.factor_value, 1.0)
+
+    def test_committed_save_bumps_version_for_other_workers(self):
+        self.index.entries()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.factor.factor_value = 3.0
+            self.factor.save()
+
+        self.assertEqual(self.index.lookup(self.process.pk, "cotton", "in").factor_value, 3.0)
+        self.assertEqual(self.index.loads, 2)
+        self.assertIsNone(factor_index._entries)
+        # The version lives in the database, not in a per-process cache.
+        cache.clear()
+        self.assertEqual(self.index.shared_version(), get_watermark(VERSION_WATERMARK))
+        self.assertEqual(self.index.stats()["version"], get_watermark(VERSION_WATERMARK))
+
+
+class NIRCompositionTests(TestCase):
+    def setUp(self):
+        self.facility = make_facility()
+        self.cotton = RawMaterialDim.objects.create(
+            type="cotton", blend_ratio="100", source="farm", certifications=""
+        )
+        self.polycotton = RawMaterialDim.objects.create(
+            type="cotton/polyester", blend_ratio="60/40", source="mill", certifications=""
+        )
+
+    def add_scan(self, scanner_id, composition):
+        return RawInputNIRFact.objects.create(
+            scanner_id=scanner_id,
+            facility=self.facility,
+            scan_time=datetime(2025, 1, 1, tzinfo=dt_timezone.utc),
+            composition=encode_composition(composition),
+            stage="intake",
+        )
+
+    def test_migration_codec_matches_and_tolerates_legacy_values(self):
+        migration = importlib.import_module("raw_data.migrations.0002_nir_composition_blob")
+        composition = {"Cotton": 30, "polyester": 20, "mystery": 50}
+        self.assertEqual(migration.encode(composition), encode_composition(composition))
+        self.assertEqual(
+            migration.decode(migration.encode(composition)), composition_to_dict(encode_composition(composition))
+        )
+        for legacy in (["cotton"], {"cotton": "lots"}, {"wool": -1}, None):
+            self.assertEqual(migration.decode(migration.encode(legacy)), {"other": 1.0})
+        self.assertEqual(migration.decode(migration.encode({"wool": "2", "silk": None})), {"wool": 1.0})
+
+    def test_blob_round_trip_and_json_export(self):
+        self.add_scan("s1", {"Cotton": 30, "polyester": 20, "mystery": 50})
+        scan = RawInputNIRFact.objects.get(pk="s1")
+        self.assertEqual(len(scan.composition), len(COMPONENTS) * 4)
+        self.assertEqual(scan.composition_dict(), {"cotton": 0.3, "polyester": 0.2, "other": 0.5})
+        with self.assertRaises(ValueError):
+            encode_composition({"cotton": "lots"})
+
+    def test_blend_profiles(self):
+        self.assertAlmostEqual(float(blend_vector("cotton/polyester", "60/40")[1]), 0.4, places=6)
+        # Ratios that do not match the component names fall back to an even split.
+        self.assertAlmostEqual(float(blend_vector("wool, silk", "100")[2]), 0.5, places=6)
+
+    def test_classify_stored_scans(self):
+        self.add_scan("s1", {"cotton": 98, "elastane": 2})
+        self.add_scan("s2", {"cotton": 55, "polyester": 45})
+        with self.assertNumQueries(2):
+            scanner_ids, result = classify_scans(chunk_size=1)
+        self.assertEqual(scanner_ids, ["s1", "s2"])
+        self.assertEqual(result.material_ids.tolist(), [self.cotton.pk, self.polycotton.pk])
+        self.assertLess(result.distances[1], 0.1)
+
+
+class SheetImportTests(TestCase):
+    SOURCE = "https://sheets.example/d/abc"
+
+    def setUp(self):
+        self.facility = make_facility()
+
+    def sheet(self, rows):
+        lines = ["row_id,stage,facility_id,material,kg"]
+        lines += [f"{r[0]},{r[1]},{self.facility.pk},{r[2]},{r[3]}" for r in rows]
+        return io.StringIO("\n".join(lines) + "\n")
+
+    def test_row_hash_is_canonical(self):
+        self.assertEqual(
+            row_hash({"Stage": " spinning ", "kg": "10"}),
+            row_hash({"kg": "10", "stage": "spinning"}),
+        )
+        self.assertNotEqual(row_hash({"kg": "10"}), row_hash({"kg": "11"}))
+
+    def test_reimport_writes_only_changed_rows(self):
+        rows = [(f"r{i}", "spinning", "cotton", i) for i in range(10)]
+        stats = import_sheet(self.sheet(rows), self.SOURCE, key_column="row_id", batch_size=4)
+        self.assertEqual((stats.inserted, stats.batches), (10, 3))
+        self.assertEqual(RawInputGSheetFact.objects.count(), 10)
+
+        with self.assertNumQueries(1):
+            stats = import_sheet(self.sheet(rows), self.SOURCE, key_column="row_id")
+        self.assertEqual((stats.unchanged, stats.inserted, stats.updated), (10, 0, 0))
+
+        rows[3] = ("r3", "weaving", "cotton", 3)
+        rows.append(("r10", "spinning", "wool", 10))
+        stats = import_sheet(self.sheet(rows), self.SOURCE, key_column="row_id")
+        self.assertEqual((stats.unchanged, stats.inserted, stats.updated), (9, 1, 1))
+        self.assertEqual(RawInputGSheetFact.objects.get(sheet_id=f"{self.SOURCE}#r3").stage, "weaving")
+
+    def test_rejections_and_command(self):
+        stream = io.StringIO("stage,facility_id\nspinning,999\n,%d\n" % self.facility.pk)
+        stats = import_sheet(stream, self.SOURCE)
+        self.assertEqual(stats.rejected, 2)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sheet.csv")
+            with open(path, "w", encoding="utf-8") as handle:
+                handle.write("material\ncotton\nwool\n")
+            out = io.StringIO()
+            call_command("import_sheet", path, facility=self.facility.pk, stage="intake", stdout=out)
+            self.assertIn("inserted 2", out.getvalue())
+
+
+class SlowWriter:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+        self.stats = IngestStats()
+
+    def write(self, batch):
+        time.sleep(self.delay)
+        self.batches.append(list(batch))
+        return len(batch)
+
+
+class FlakyWriter(SlowWriter):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def write(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database is locked")
+        return super().write(batch)
+
+
+class MicroBatcherTests(TestCase):
+    def test_flushes_by_size_and_by_delay(self):
+        async def scenario():
+            writer = SlowWriter()
+            batcher = MicroBatcher(writer, max_batch=3, max_delay_ms=20, max_queue=10)
+            await batcher.submit([1, 2, 3, 4])
+            # A full batch goes out at once; the remainder after max_delay_ms.
+            for _ in range(100):
+                if len(writer.batches) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(writer.batches, [[1, 2, 3], [4]])
+            self.assertEqual(batcher.stats.flushes, 2)
+            batcher.close()
+
+        asyncio.run(scenario())
+
+    def test_backpressure_when_the_queue_is_full(self):
+        async def scenario():
+            writer = SlowWriter(delay=0.05)
+            batcher = MicroBatcher(writer, max_batch=2, max_delay_ms=1, max_queue=4, enqueue_timeout=0.01)
+            await batcher.submit([1, 2, 3, 4])
+            with self.assertRaises(QueueFull):
+                await batcher.submit([5, 6, 7])
+            batcher.enqueue_timeout = 1.0
+            await batcher.submit([5, 6, 7])
+            await batcher.drain()
+            self.assertEqual(sum(writer.batches, []), [1, 2, 3, 4, 5, 6, 7])
+            self.assertEqual((batcher.stats.refused, batcher.stats.flushed), (3, 7))
+            batcher.close()
+
+        asyncio.run(scenario())
+
+    def test_failed_writes_are_retried_then_reported(self):
+        async def scenario():
+            writer = FlakyWriter(failures=2)
+            batcher = MicroBatcher(writer, max_batch=2, max_delay_ms=1, write_retries=2, retry_delay=0)
+            with self.assertLogs("raw_data.microbatch", "WARNING"):
+                await batcher.submit([1, 2])
+                await batcher.drain()
+            self.assertEqual((writer.batches, batcher.stats.retries), ([[1, 2]], 2))
+
+            # Three attempts each: the buffered scan is reported, the
+            # unbuffered one raises.
+            writer.failures = 6
+            with self.assertLogs("raw_data.microbatch", "ERROR"):
+                await batcher.submit([3])
+                await batcher.drain()
+                with self.assertRaises(WriteFailed):
+                    await batcher.write_now([4])
+            self.assertEqual((batcher.stats.failed, batcher.stats.flushed), (2, 2))
+            self.assertIn("database is locked", batcher.stats.last_error)
+            batcher.close()
+
+        asyncio.run(scenario())
+
+    def test_close_writes_buffered_scans(self):
+        async def scenario():
+            writer = SlowWriter()
+            batcher = MicroBatcher(writer, max_batch=10, max_delay_ms=10000, max_queue=10)
+            await batcher.submit([1, 2])
+            return writer, batcher
+
+        # The loop the scans were buffered on is gone, as after a WSGI request.
+        writer, batcher = asyncio.run(scenario())
+        batcher.close()
+        batcher._executor.shutdown(wait=True)
+        self.assertEqual(writer.batches, [[1, 2]])
+
+
+INGEST_TOKEN = {"X-Ingest-Token": "scanner-key"}
+
+
+# Batches are written on the batcher's own thread and connection, so these
+# tests cannot run inside a TestCase transaction.
+@override_settings(INGEST_TOKENS=["scanner-key"])
+class AsyncIngestionEndpointTests(TransactionTestCase):
+    async def test_rfid_and_nir_scans_are_buffered_and_written(self):
+        facility = await RawFacilityDim.objects.acreate(
+            name="Dock A", location="IN", org_id="org-1", boundary_conditions_json={}
+        )
+        scans = [
+            {"tag_id": f"t{n}", "batch_id": "b1", "facility_id": facility.pk, "scan_time": "2025-01-01T10:00:00Z"}
+            for n in range(3)
+        ]
+        resp = await self.async_client.post(
+            reverse("ingest-rfid"), [*scans, {"tag_id": "bad"}], content_type="application/json", headers=INGEST_TOKEN
+        )
+        self.assertEqual(resp.status_code, 207)
+        self.assertEqual((resp.json()["accepted"], resp.json()["rejected"]), (3, 1))
+
+        nir = {
+            "scanner_id": "s1", "facility_id": facility.pk, "scan_time": "2025-01-01T10:00:00Z",
+            "stage": "spinning", "composition": {"cotton": 60, "polyester": 40},
+        }
+        resp = await self.async_client.post(
+            reverse("ingest-nir"), nir, content_type="application/json", headers=INGEST_TOKEN
+        )
+        self.assertEqual(resp.json()["accepted"], 1)
+
+        await get_batcher("rfid").drain()
+        await get_batcher("nir").drain()
+        self.assertEqual(await RawInputRFIDFact.objects.acount(), 3)
+        stored = await RawInputNIRFact.objects.aget(pk="s1")
+        self.assertAlmostEqual(stored.composition_dict()["cotton"], 0.6, places=4)
+
+        stats = (await self.async_client.get(reverse("ingest-stats"), headers=INGEST_TOKEN)).json()
+        self.assertEqual(stats["rfid"]["flushed"], 3)
+
+    async def test_malformed_body_is_rejected(self):
+        resp = await self.async_client.post(
+            reverse("ingest-rfid"), "nope", content_type="application/json", headers=INGEST_TOKEN
+        )
+        self.assertEqual(resp.status_code, 400)
+
+    async def test_unparseable_records_are_rejected_one_by_one(self):
+        scans = [
+            {"tag_id": f"t{n}", "batch_id": "b1", "facility_id": 1, "scan_time": scan_time}
+            for n, scan_time in enumerate(["2024-02-30T00:00:00", 1e20])
+        ]
+        resp = await self.async_client.post(
+            reverse("ingest-rfid"), scans, content_type="application/json", headers=INGEST_TOKEN
+        )
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual((resp.json()["accepted"], resp.json()["rejected"]), (0, 2))
+
+    async def test_requests_need_a_token_or_jwt(self):
+        url = reverse("ingest-rfid")
+        self.assertEqual((await self.async_client.post(url, {}, content_type="application/json")).status_code, 401)
+        resp = await self.async_client.post(
+            url, {}, content_type="application/json", headers={"X-Ingest-Token": "guess"}
+        )
+        self.assertEqual(resp.status_code, 401)
+        self.assertEqual((await self.async_client.get(reverse("ingest-stats"))).status_code, 401)
+
+        user = await User.objects.acreate_user(username="dock", password="secret123")
+        jwt = {"Authorization": f"Bearer {AccessToken.for_user(user)}"}
+        self.assertEqual((await self.async_client.get(reverse("ingest-stats"), headers=jwt)).status_code, 200)
+
+    def test_wsgi_requests_write_before_answering(self):
+        facility = make_facility()
+        scan = {"tag_id": "t1", "batch_id": "b1", "facility_id": facility.pk, "scan_time": "2025-01-01T10:00:00Z"}
+        resp = self.client.post(reverse("ingest-rfid"), scan, content_type="application/json", headers=INGEST_TOKEN)
+        self.assertEqual(resp.status_code, 202)
+        self.assertTrue(RawInputRFIDFact.objects.filter(pk="t1").exists())
+
+
+@override_settings(INGEST_TOKENS=["scanner-key"])
+class IngestRouterTests(TransactionTestCase):
+    async def call(self, path, body=b"", method="POST", host=b"testserver", token=b"scanner-key"):
+        passed = []
+
+        async def django_app(scope, receive, send):
+            passed.append(scope["path"])
+
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        headers = [(b"host", host), (b"x-ingest-token", token)]
+        scope = {"type": "http", "path": path, "method": method, "headers": headers}
+        await IngestRouter(django_app)(scope, receive, send)
+        return passed, sent
+
+    async def test_ingest_posts_bypass_the_django_stack(self):
+        facility = await RawFacilityDim.objects.acreate(
+            name="Dock A", location="IN", org_id="org-1", boundary_conditions_json={}
+        )
+        scan = {"tag_id": "t1", "batch_id": "b1", "facility_id": facility.pk, "scan_time": "2025-01-01T10:00:00Z"}
+        passed, sent = await self.call("/api/raw/ingest/rfid", json.dumps(scan).encode())
+        self.assertEqual(passed, [])
+        self.assertEqual(sent[0]["status"], 202)
+        self.assertEqual(json.loads(sent[1]["body"])["accepted"], 1)
+        await get_batcher("rfid").drain()
+        self.assertTrue(await RawInputRFIDFact.objects.filter(pk="t1").aexists())
+
+    async def test_other_requests_reach_django(self):
+        passed, _ = await self.call("/api/raw/ingest/stats", method="GET")
+        self.assertEqual(passed, ["/api/raw/ingest/stats"])
+        passed, _ = await self.call("/api/raw/ingest/rfid", method="GET")
+        self.assertEqual(len(passed), 1)
+
+    async def test_unknown_host_is_refused(self):
+        passed, sent = await self.call("/api/raw/ingest/rfid", b"{}", host=b"evil.example")
+        self.assertEqual((passed, sent[0]["status"]), ([], 400))
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=16)
+    async def test_oversized_bodies_are_refused(self):
+        passed, sent = await self.call("/api/raw/ingest/rfid", b"[" + b"{}," * 10 + b"{}]")
+        self.assertEqual((passed, sent[0]["status"]), ([], 413))
+
+    async def test_posts_without_a_token_are_refused(self):
+        passed, sent = await self.call("/api/raw/ingest/rfid", b"{}", token=b"")
+        self.assertEqual((passed, sent[0]["status"]), ([], 401))
+
+
+# Partition tables are created with the schema editor, which SQLite does not
+# allow inside the transaction a TestCase wraps around each test.
+class ScanPartitionTests(TransactionTestCase):
+    def setUp(self):
+        self.facility = make_facility()
+        self.partitions = SCAN_PARTITIONS["rfid"]
+        self.now = datetime(2025, 3, 15, 12, tzinfo=dt_timezone.utc)
+
+    def tearDown(self):
+        self.partitions.detach_before(999912, drop=True)
+        with connection.cursor() as cursor:
+            for table in connection.introspection.table_names():
+                if table.startswith(f"{self.partitions.table}_d"):
+                    cursor.execute(f"DROP TABLE {connection.ops.quote_name(table)}")
+
+    def scan(self, tag_id, when):
+        RawInputRFIDFact.objects.update_or_create(
+            tag_id=tag_id,
+            defaults={"batch_id": "b1", "facility": self.facility, "scan_time": when, "context_json": {}},
+        )
+
+    def test_rotation_moves_closed_months_and_queries_prune(self):
+        for day in (3, 20):
+            self.scan(f"jan-{day}", datetime(2025, 1, day, tzinfo=dt_timezone.utc))
+            self.scan(f"feb-{day}", datetime(2025, 2, day, tzinfo=dt_timezone.utc))
+        self.scan("recent", self.now)
+
+        stats = self.partitions.rotate(now=self.now)
+        self.assertEqual(stats.moved, {202501: 2, 202502: 2})
+        self.assertEqual(self.partitions.months(), [202501, 202502])
+        self.assertEqual(list(RawInputRFIDFact.objects.values_list("tag_id", flat=True)), ["recent"])
+        self.assertEqual(self.partitions.rotate(now=self.now).total, 0)
+
+        with CaptureQueriesContext(connection) as ctx:
+            tags = list(self.partitions.values_list(
+                "tag_id", start=self.now - timedelta(hours=24), end=self.now + timedelta(seconds=1)
+            ))
+        self.assertEqual(tags, [("recent",)])
+        self.assertFalse(any("_p2025" in query["sql"] for query in ctx.captured_queries))
+
+        feb = self.partitions.querysets(
+            start=datetime(2025, 2, 1, tzinfo=dt_timezone.utc), end=datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+        )
+        self.assertEqual(len(feb), 2)
+        self.assertEqual(sum(qs.count() for qs in feb), 2)
+        self.assertEqual(self.partitions.count(facility=self.facility), 5)
+
+        # A late scan for a rotated tag in the same month replaces the old copy.
+        self.scan("jan-3", datetime(2025, 1, 4, tzinfo=dt_timezone.utc))
+        self.assertEqual(self.partitions.rotate(now=self.now).moved, {202501: 1})
+        self.assertEqual(self.partitions.count(), 5)
+
+    def test_detaching_old_partitions(self):
+        self.scan("jan", datetime(2025, 1, 3, tzinfo=dt_timezone.utc))
+        self.scan("feb", datetime(2025, 2, 3, tzinfo=dt_timezone.utc))
+        out = io.StringIO()
+        call_command("partition_scans", "--kind", "rfid", "--detach-before", "2025-02", stdout=out)
+        self.assertIn("detached 1 partitions", out.getvalue())
+
+        self.assertEqual(self.partitions.months(), [202502])
+        self.assertIn(self.partitions.detached_table(202501), connection.introspection.table_names())
+        self.assertEqual(self.partitions.count(), 1)
+
+
+class ArchiveTests(TransactionTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(override_settings(RAW_ARCHIVE_DIR=tmp.name))
+        self.dock_a = make_facility()
+        self.dock_b = make_facility(name="Dock B")
+        self.cutoff = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+
+    def add_scan(self, tag_id, facility, when, batch_id="b1"):
+        return RawInputRFIDFact.objects.create(
+            tag_id=tag_id, batch_id=batch_id, facility=facility, scan_time=when, context_json={"dock": tag_id}
+        )
+
+    def test_aged_scans_move_to_segments_and_read_back(self):
+        jan = datetime(2024, 1, 5, 8, tzinfo=dt_timezone.utc)
+        self.add_scan("a1", self.dock_a, jan)
+        self.add_scan("a2", self.dock_a, jan + timedelta(hours=1), batch_id="b2")
+        self.add_scan("a3", self.dock_a, jan + timedelta(days=1))
+        self.add_scan("b1", self.dock_b, jan)
+        self.add_scan("new", self.dock_a, self.cutoff + timedelta(days=3))
+        SCAN_PARTITIONS["rfid"].rotate(now=datetime(2024, 2, 10, tzinfo=dt_timezone.utc))
+        self.assertEqual(SCAN_PARTITIONS["rfid"].months(), [202401])
+
+        stats = archive_before(self.cutoff, kinds=["rfid"])["rfid"]
+        self.assertEqual((stats.rows, stats.segments, stats.dropped_partitions), (4, 3, 1))
+        self.assertEqual(SCAN_PARTITIONS["rfid"].months(), [])
+        self.assertEqual(list(RawInputRFIDFact.objects.values_list("tag_id", flat=True)), ["new"])
+        self.assertEqual(RawArchiveSegment.objects.get(day="2024-01-05", facility_id=self.dock_a.pk).row_count, 2)
+
+        result = query_archive("rfid", columns=["tag_id", "scan_time"], facility_ids=[self.dock_a.pk])
+        self.assertEqual(sorted(result), ["scan_time", "tag_id"])
+        self.assertEqual(list(result["tag_id"]), ["a1", "a2", "a3"])
+
+        # Only the segment whose batch_id range can match is opened.
+        with mock.patch("raw_data.archive.np.load", wraps=np.load) as load:
+            result = query_archive("rfid", columns=["tag_id"], batch_id="b2")
+        self.assertEqual(list(result["tag_id"]), ["a2"])
+        self.assertEqual(load.call_count, 1)
+
+        rows = list(iter_archived_rows("rfid", start=jan + timedelta(minutes=30), end=jan + timedelta(days=2)))
+        self.assertEqual([row["tag_id"] for row in rows], ["a2", "a3"])
+        self.assertEqual(rows[0]["scan_time"], jan + timedelta(hours=1))
+        self.assertEqual(rows[0]["context_json"], {"dock": "a2"})
+        self.assertEqual(query_archive("rfid", tag_id="missing")["tag_id"].size, 0)
+        with self.assertRaises(ValueError):
+            query_archive("rfid", context_json="x")
+
+    def test_rows_changed_while_archiving_are_kept(self):
+        jan = datetime(2024, 1, 5, 8, tzinfo=dt_timezone.utc)
+        self.add_scan("a1", self.dock_a, jan)
+        self.add_scan("a2", self.dock_a, jan)
+        write_file = archive_module._write_file
+
+        def write_then_rescan(path, arrays):
+            # A scan corrected after the group was read moves out of its range.
+            RawInputRFIDFact.objects.filter(pk="a2").update(scan_time=self.cutoff + timedelta(days=1))
+            return write_file(path, arrays)
+
+        with mock.patch("raw_data.archive._write_file", side_effect=write_then_rescan):
+            stats = archive_before(self.cutoff, kinds=["rfid"])["rfid"]
+        self.assertEqual((stats.rows, stats.segments, stats.changed), (0, 0, 1))
+        self.assertEqual(RawInputRFIDFact.objects.count(), 2)
+        self.assertFalse(any(Path(settings.RAW_ARCHIVE_DIR).rglob("*.npz")))
+
+        stats = archive_before(self.cutoff, kinds=["rfid"])["rfid"]
+        self.assertEqual((stats.rows, stats.changed), (1, 0))
+        self.assertEqual(list(RawInputRFIDFact.objects.values_list("tag_id", flat=True)), ["a2"])
+
+    def test_binary_columns_round_trip(self):
+        blob = encode_composition({"cotton": 50, "polyester": 50})
+        RawInputNIRFact.objects.create(
+            scanner_id="s1", facility=self.dock_a, scan_time=datetime(2024, 1, 2, tzinfo=dt_timezone.utc),
+            composition=blob, stage="spinning",
+        )
+        out = io.StringIO()
+        call_command("archive_raw_facts", "--kind", "nir", "--before", "2024-03-01", stdout=out)
+        self.assertIn("archived 1 rows into 1 segments", out.getvalue())
+        self.assertFalse(RawInputNIRFact.objects.exists())
+        self.assertEqual(query_archive("nir", columns=["composition"])["composition"][0], blob)
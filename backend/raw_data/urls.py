@@ -0,0 +1,9 @@
+from django.urls import path
+
+from .views import ingest_nir, ingest_rfid, ingest_stats
+
+urlpatterns = [
+    path('ingest/rfid', ingest_rfid, name='ingest-rfid'),
+    path('ingest/nir', ingest_nir, name='ingest-nir'),
+    path('ingest/stats', ingest_stats, name='ingest-stats'),
+]
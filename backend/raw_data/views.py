@@ -1,3 +1,62 @@
-from django.shortcuts import render
+"""Async ingestion endpoints for sensor scans.
 
-# Create your views here.
+``POST`` a single scan object or an array of them as JSON.  Scans are
+validated on the event loop and buffered by ``raw_data.microbatch``; the
+response reports how many were accepted and why the others were rejected,
+without waiting for the database.  Under ASGI the same routes are served by
+``raw_data.asgi`` ahead of the middleware stack; under WSGI, where no event
+loop outlives the request, the scans are written before answering.
+
+Every endpoint needs a JWT or an ingest token (``raw_data.microbatch.authorize``).
+"""
+
+from functools import wraps
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .microbatch import authorize, batcher_stats, ingest_payload
+
+UNAUTHORIZED = {"detail": "Authentication credentials were not provided."}
+
+
+def ingest_auth_required(view):
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await authorize(request.headers.get("Authorization", ""), request.headers.get("X-Ingest-Token", "")):
+            response = JsonResponse(UNAUTHORIZED, status=401)
+            response["WWW-Authenticate"] = 'Bearer realm="api"'
+            return response
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+async def _ingest(request, kind: str) -> JsonResponse:
+    status, body = await ingest_payload(kind, request.body, buffered=isinstance(request, ASGIRequest))
+    response = JsonResponse(body, status=status)
+    if status == 503:
+        response["Retry-After"] = "1"
+    return response
+
+
+@csrf_exempt
+@require_POST
+@ingest_auth_required
+async def ingest_rfid(request):
+    return await _ingest(request, "rfid")
+
+
+@csrf_exempt
+@require_POST
+@ingest_auth_required
+async def ingest_nir(request):
+    return await _ingest(request, "nir")
+
+
+@require_GET
+@ingest_auth_required
+async def ingest_stats(request):
+    return JsonResponse(batcher_stats())
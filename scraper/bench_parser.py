@@ -0,0 +1,58 @@
+"""Compare the streaming supplier parser with the BeautifulSoup path.
+
+Generates synthetic marketplace pages of increasing size and reports parse
+time, rows per second and peak traced memory for both implementations.
+"""
+
+import argparse
+import time
+import tracemalloc
+from typing import Callable, List
+
+from scraper import parse_suppliers, parse_suppliers_soup
+
+
+def synthetic_page(rows: int) -> str:
+    body = "".join(
+        f"<tr><td> Supplier {i} </td><td>cotton &amp; poly</td><td>{100 + i % 50}</td></tr>\n"
+        for i in range(rows)
+    )
+    return (
+        "<html><head><title>Market</title></head><body><h1>Suppliers</h1>"
+        "<table><tr><th>Name</th><th>Material</th><th>Rate</th></tr>"
+        f"{body}</table><footer>end</footer></body></html>"
+    )
+
+
+def measure(parse: Callable[[str], List], html: str):
+    started = time.perf_counter()
+    rows = parse(html)
+    elapsed = time.perf_counter() - started
+
+    # Memory is traced on a second run so tracing does not skew the timing.
+    tracemalloc.start()
+    parse(html)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rows, elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="*", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        html = synthetic_page(rows)
+        streamed, stream_secs, stream_peak = measure(parse_suppliers, html)
+        souped, soup_secs, soup_peak = measure(parse_suppliers_soup, html)
+        assert streamed == souped, "parsers disagree"
+        print(
+            f"{rows:>8} rows ({len(html) / 1e6:.1f} MB): "
+            f"stream {stream_secs:.3f}s {rows / stream_secs:,.0f} rows/s peak {stream_peak / 1e6:.1f} MB | "
+            f"soup {soup_secs:.3f}s {rows / soup_secs:,.0f} rows/s peak {soup_peak / 1e6:.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
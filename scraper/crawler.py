@@ -0,0 +1,260 @@
+"""Asynchronous crawler for paginated supplier listings.
+
+``fetch_suppliers`` in :mod:`scraper` reads a single page.  This crawler
+starts from one or more marketplace pages, follows their pagination links
+(``<a rel="next">`` and links inside a ``.pagination`` block) and fetches
+many pages concurrently over a pooled ``aiohttp`` session.
+
+Requests are limited per host, both in concurrency and in requests per
+second.  ETag and Last-Modified validators are remembered in a
+:class:`ValidatorCache` (optionally persisted to a JSON file) and sent back as
+``If-None-Match`` / ``If-Modified-Since``; a ``304`` reuses the rows and
+pagination links stored for that page instead of downloading and parsing it
+again.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urldefrag, urlsplit
+
+import aiohttp
+
+from scraper import URL
+from table_parser import parse_page
+
+Supplier = Dict[str, str]
+
+
+@dataclass
+class CrawlStats:
+    """Counters reported at the end of a crawl."""
+
+    pages: int = 0
+    not_modified: int = 0
+    errors: int = 0
+    bytes_transferred: int = 0
+    elapsed: float = 0.0
+    error_urls: List[str] = field(default_factory=list)
+
+    @property
+    def pages_per_sec(self) -> float:
+        return self.pages / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "pages": self.pages,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+            "bytes_transferred": self.bytes_transferred,
+            "elapsed": round(self.elapsed, 3),
+            "pages_per_sec": round(self.pages_per_sec, 1),
+        }
+
+
+class ValidatorCache:
+    """Conditional-request validators and parsed results per URL."""
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self.entries: Dict[str, Dict] = {}
+        if path:
+            try:
+                with open(path, encoding="utf-8") as handle:
+                    self.entries = json.load(handle)
+            except FileNotFoundError:
+                pass
+
+    def headers(self, url: str) -> Dict[str, str]:
+        entry = self.entries.get(url) or {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def get(self, url: str) -> Optional[Dict]:
+        return self.entries.get(url)
+
+    def store(self, url: str, etag: Optional[str], last_modified: Optional[str],
+              suppliers: List[Supplier], links: List[str]) -> None:
+        if not etag and not last_modified:
+            self.entries.pop(url, None)
+            return
+        self.entries[url] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "suppliers": suppliers,
+            "links": links,
+        }
+
+    def save(self) -> None:
+        if self.path:
+            with open(self.path, "w", encoding="utf-8") as handle:
+                json.dump(self.entries, handle)
+
+
+class HostLimiter:
+    """Caps concurrent requests and request rate for one host."""
+
+    def __init__(self, concurrency: int, rate: float) -> None:
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = asyncio.Lock()
+        self._next_slot = 0.0
+
+    async def __aenter__(self) -> "HostLimiter":
+        await self._semaphore.acquire()
+        if self._interval:
+            async with self._lock:
+                now = time.monotonic()
+                wait = self._next_slot - now
+                self._next_slot = max(now, self._next_slot) + self._interval
+            if wait > 0:
+                await asyncio.sleep(wait)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._semaphore.release()
+
+
+class SupplierCrawler:
+    """Crawl paginated supplier pages concurrently.
+
+    ``max_pages`` bounds the number of distinct URLs visited.  Only links on
+    the hosts of the start URLs are followed.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 16,
+        per_host_concurrency: int = 4,
+        per_host_rate: float = 10.0,
+        max_pages: int = 1000,
+        timeout: float = 10.0,
+        cache: Optional[ValidatorCache] = None,
+    ) -> None:
+        self.concurrency = concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_rate = per_host_rate
+        self.max_pages = max_pages
+        self.timeout = timeout
+        self.cache = cache if cache is not None else ValidatorCache()
+        self.stats = CrawlStats()
+        self._limiters: Dict[str, HostLimiter] = {}
+
+    def _limiter(self, host: str) -> HostLimiter:
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            limiter = self._limiters[host] = HostLimiter(self.per_host_concurrency, self.per_host_rate)
+        return limiter
+
+    async def _fetch(self, session: aiohttp.ClientSession, url: str) -> Tuple[List[Supplier], List[str]]:
+        async with self._limiter(urlsplit(url).netloc):
+            async with session.get(url, headers=self.cache.headers(url)) as resp:
+                if resp.status == 304:
+                    self.stats.not_modified += 1
+                    entry = self.cache.get(url) or {}
+                    return entry.get("suppliers", []), entry.get("links", [])
+                resp.raise_for_status()
+                body = await resp.read()
+                self.stats.bytes_transferred += len(body)
+                etag = resp.headers.get("ETag")
+                last_modified = resp.headers.get("Last-Modified")
+                charset = resp.charset or "utf-8"
+
+        html = body.decode(charset, errors="replace")
+        suppliers, links = parse_page(html, url)
+        self.cache.store(url, etag, last_modified, suppliers, links)
+        return suppliers, links
+
+    async def crawl(self, start_urls: Iterable[str]) -> List[Supplier]:
+        """Crawl from ``start_urls`` and return suppliers in page order."""
+
+        started = time.perf_counter()
+        start_urls = [urldefrag(url)[0] for url in start_urls]
+        hosts = {urlsplit(url).netloc for url in start_urls}
+        queue: asyncio.Queue = asyncio.Queue()
+        seen: Set[str] = set()
+        results: Dict[str, List[Supplier]] = {}
+        order: List[str] = []
+
+        def enqueue(url: str) -> None:
+            if url in seen or len(seen) >= self.max_pages or urlsplit(url).netloc not in hosts:
+                return
+            seen.add(url)
+            order.append(url)
+            queue.put_nowait(url)
+
+        async def worker(session: aiohttp.ClientSession) -> None:
+            while True:
+                url = await queue.get()
+                try:
+                    suppliers, links = await self._fetch(session, url)
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    self.stats.errors += 1
+                    self.stats.error_urls.append(url)
+                else:
+                    self.stats.pages += 1
+                    results[url] = suppliers
+                    for link in links:
+                        enqueue(link)
+                finally:
+                    queue.task_done()
+
+        for url in start_urls:
+            enqueue(url)
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host_concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            workers = [asyncio.create_task(worker(session)) for _ in range(self.concurrency)]
+            try:
+                await queue.join()
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        self.cache.save()
+        self.stats.elapsed = time.perf_counter() - started
+        return [supplier for url in order for supplier in results.get(url, [])]
+
+
+def crawl_suppliers(start_urls: Iterable[str], **options) -> Tuple[List[Supplier], CrawlStats]:
+    """Synchronous wrapper around :meth:`SupplierCrawler.crawl`."""
+
+    crawler = SupplierCrawler(**options)
+    suppliers = asyncio.run(crawler.crawl(start_urls))
+    return suppliers, crawler.stats
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("urls", nargs="*", default=[URL])
+    parser.add_argument("--max-pages", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--per-host-concurrency", type=int, default=4)
+    parser.add_argument("--per-host-rate", type=float, default=10.0)
+    parser.add_argument("--cache", help="JSON file for ETag/Last-Modified validators.")
+    args = parser.parse_args(argv)
+
+    suppliers, stats = crawl_suppliers(
+        args.urls,
+        concurrency=args.concurrency,
+        per_host_concurrency=args.per_host_concurrency,
+        per_host_rate=args.per_host_rate,
+        max_pages=args.max_pages,
+        cache=ValidatorCache(args.cache),
+    )
+    print(json.dumps(suppliers, indent=2))
+    print(json.dumps(stats.as_dict()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,10 @@ from typing import List, Dict
 import requests
 from bs4 import BeautifulSoup
 
+from table_parser import iter_suppliers
+
 URL = "https://example.com/recycling-market"
+CHUNK_SIZE = 64 * 1024
 
 
 def fetch_suppliers() -> List[Dict[str, str]]:
@@ -14,11 +17,31 @@ def fetch_suppliers() -> List[Dict[str, str]]:
 
     This function demonstrates how the marketplace data could be collected
     from an online source. The target page is expected to have a table with
-    supplier name, material type and rate per tonne.
+    supplier name, material type and rate per tonne.  The response is parsed
+    as it streams in and the download stops once the table has been read.
     """
-    resp = requests.get(URL, timeout=10)
-    resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    with requests.get(URL, timeout=10, stream=True) as resp:
+        resp.raise_for_status()
+        if resp.encoding is None:
+            resp.encoding = "utf-8"
+        chunks = resp.iter_content(chunk_size=CHUNK_SIZE, decode_unicode=True)
+        return list(iter_suppliers(chunks))
+
+
+def parse_suppliers(html: str) -> List[Dict[str, str]]:
+    """Extract supplier rows from the first table of a marketplace page."""
+
+    return list(iter_suppliers([html]))
+
+
+def parse_suppliers_soup(html: str) -> List[Dict[str, str]]:
+    """Reference implementation of :func:`parse_suppliers` on a full tree.
+
+    Kept for ``bench_parser`` comparisons; it builds the whole document with
+    BeautifulSoup before looking at any row.
+    """
+
+    soup = BeautifulSoup(html, "html.parser")
 
     data: List[Dict[str, str]] = []
 
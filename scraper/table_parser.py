@@ -0,0 +1,159 @@
+"""Streaming parser for supplier tables.
+
+:class:`SupplierTableParser` is an incremental ``html.parser`` handler: HTML
+is fed in chunks and supplier dicts become available as soon as each table
+row closes, so a page never has to be held or parsed as a whole tree.  Output
+matches the BeautifulSoup implementation in :mod:`scraper`: the first table
+on the page, its header row skipped, ``td`` text stripped and rows with fewer
+than three cells dropped.
+
+Pagination links (``<a rel="next">`` and anchors inside a ``.pagination``
+element) can be collected on the same pass for the crawler.
+"""
+
+from html.parser import HTMLParser
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urldefrag, urljoin
+
+Supplier = Dict[str, str]
+
+VOID_ELEMENTS = frozenset(
+    ["area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"]
+)
+
+
+class SupplierTableParser(HTMLParser):
+    """Incremental parser that emits one supplier per completed table row."""
+
+    def __init__(self, base_url: Optional[str] = None, collect_links: bool = False) -> None:
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url or ""
+        self.collect_links = collect_links
+        self.links: List[str] = []
+        self.done = False
+        self._ready: List[Supplier] = []
+        self._table_depth = 0
+        self._rows_seen = 0
+        self._cells: Optional[List[str]] = None
+        self._cell: Optional[List[str]] = None
+        self._pagination_depth = 0
+        self._open_tags: List[bool] = []
+
+    # Rows -----------------------------------------------------------------
+
+    def _close_cell(self) -> None:
+        if self._cell is not None and self._cells is not None:
+            self._cells.append("".join(self._cell))
+        self._cell = None
+
+    def _close_row(self) -> None:
+        self._close_cell()
+        cells = self._cells
+        self._cells = None
+        if cells is None:
+            return
+        self._rows_seen += 1
+        if self._rows_seen > 1 and len(cells) >= 3:
+            self._ready.append({"name": cells[0], "material": cells[1], "ratePerTonne": cells[2]})
+
+    def handle_starttag(self, tag, attrs):
+        if self.collect_links:
+            self._track_links(tag, attrs)
+        if self.done and not self.collect_links:
+            return
+        if tag == "table" and not self.done:
+            self._table_depth += 1
+        elif self._table_depth and not self.done:
+            if tag == "tr":
+                self._close_row()
+                self._cells = []
+            elif tag == "td" and self._cells is not None:
+                self._close_cell()
+                self._cell = []
+            elif tag == "th":
+                self._close_cell()
+
+    def handle_endtag(self, tag):
+        if self.collect_links:
+            self._untrack_links(tag)
+        if not self._table_depth or self.done:
+            return
+        if tag == "td":
+            self._close_cell()
+        elif tag == "tr":
+            self._close_row()
+        elif tag == "table":
+            self._table_depth -= 1
+            if not self._table_depth:
+                self._close_row()
+                self.done = True
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            stripped = data.strip()
+            if stripped:
+                self._cell.append(stripped)
+
+    # Links ----------------------------------------------------------------
+
+    def _track_links(self, tag, attrs) -> None:
+        attributes = dict(attrs)
+        classes = (attributes.get("class") or "").split()
+        is_pagination = "pagination" in classes
+        if tag not in VOID_ELEMENTS:
+            self._open_tags.append(is_pagination)
+            if is_pagination:
+                self._pagination_depth += 1
+        if tag == "a" and attributes.get("href"):
+            rel = (attributes.get("rel") or "").split()
+            if "next" in rel or self._pagination_depth:
+                url, _ = urldefrag(urljoin(self.base_url, attributes["href"]))
+                self.links.append(url)
+
+    def _untrack_links(self, tag) -> None:
+        if tag in VOID_ELEMENTS or not self._open_tags:
+            return
+        if self._open_tags.pop():
+            self._pagination_depth -= 1
+
+    # Driving --------------------------------------------------------------
+
+    def feed_rows(self, chunk: str) -> List[Supplier]:
+        """Feed a chunk and return the suppliers completed by it."""
+
+        self.feed(chunk)
+        ready, self._ready = self._ready, []
+        return ready
+
+    def close_rows(self) -> List[Supplier]:
+        """Flush the parser and return any suppliers still pending."""
+
+        self.close()
+        if self._table_depth and not self.done:
+            self._close_row()
+            self.done = True
+        ready, self._ready = self._ready, []
+        return ready
+
+
+def iter_suppliers(chunks: Iterable[str]) -> Iterator[Supplier]:
+    """Yield suppliers from HTML arriving as ``chunks``.
+
+    Reading stops as soon as the first table has closed.
+    """
+
+    parser = SupplierTableParser()
+    for chunk in chunks:
+        yield from parser.feed_rows(chunk)
+        if parser.done:
+            return
+    yield from parser.close_rows()
+
+
+def parse_page(html: str, base_url: str = "") -> Tuple[List[Supplier], List[str]]:
+    """Return the suppliers and pagination links of a complete page."""
+
+    parser = SupplierTableParser(base_url=base_url, collect_links=True)
+    suppliers = parser.feed_rows(html)
+    suppliers.extend(parser.close_rows())
+    return suppliers, parser.links
@@ -0,0 +1,93 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from crawler import ValidatorCache, crawl_suppliers
+
+PAGES = 6
+
+
+def render_page(number: int) -> bytes:
+    rows = "".join(
+        f"<tr><td>Supplier {number}-{i}</td><td>cotton</td><td>{100 + i}</td></tr>"
+        for i in range(3)
+    )
+    links = "".join(f'<a href="/page/{n}">{n}</a>' for n in range(1, PAGES + 1))
+    return (
+        "<html><body><table><tr><th>Name</th><th>Material</th><th>Rate</th></tr>"
+        f"{rows}</table><div class=\"pagination\">{links}</div></body></html>"
+    ).encode()
+
+
+class StubMarketplace(BaseHTTPRequestHandler):
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.active += 1
+            cls.peak = max(cls.peak, cls.active)
+        try:
+            number = int(self.path.rsplit("/", 1)[-1])
+            etag = f'"page-{number}"'
+            time.sleep(0.02)
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = render_page(number)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class CrawlerTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubMarketplace)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_follows_pagination_and_skips_unchanged_pages(self):
+        cache = ValidatorCache()
+        suppliers, stats = crawl_suppliers(
+            [f"{self.base}/page/1"], cache=cache, per_host_concurrency=3, per_host_rate=0
+        )
+
+        self.assertEqual(stats.pages, PAGES)
+        self.assertEqual(len(suppliers), PAGES * 3)
+        self.assertEqual(suppliers[0], {"name": "Supplier 1-0", "material": "cotton", "ratePerTonne": "100"})
+        self.assertGreater(stats.bytes_transferred, 0)
+        self.assertLessEqual(StubMarketplace.peak, 3)
+
+        again, stats = crawl_suppliers([f"{self.base}/page/1"], cache=cache, per_host_rate=0)
+        self.assertEqual(stats.not_modified, PAGES)
+        self.assertEqual(stats.bytes_transferred, 0)
+        self.assertEqual(again, suppliers)
+
+    def test_max_pages_bounds_the_crawl(self):
+        suppliers, stats = crawl_suppliers([f"{self.base}/page/1"], max_pages=2, per_host_rate=0)
+        self.assertEqual(stats.pages, 2)
+        self.assertEqual(len(suppliers), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
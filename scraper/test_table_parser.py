@@ -0,0 +1,60 @@
+import unittest
+
+from scraper import parse_suppliers_soup
+from table_parser import iter_suppliers, parse_page
+
+PAGE = """
+<html><body>
+<p>Intro <a href="/about">about</a></p>
+<table class="suppliers">
+  <tr><th>Name</th><th>Material</th><th>Rate</th></tr>
+  <tr><td> Acme <b>Fibres</b> </td><td>cotton &amp; poly</td><td>120</td></tr>
+  <tr><td>Short row</td><td>wool</td></tr>
+  <tr><td>Beta</td><td>nylon</td><td>95</td><td>extra</td>
+  <tr><td>Gamma</td><td>viscose</td><td>80</td></tr>
+</table>
+<table><tr><td>ignored</td><td>second</td><td>table</td></tr></table>
+<nav class="pagination"><a href="?page=2#top">2</a><img src="x.png"><a href="?page=3">3</a></nav>
+<a rel="next" href="/market?page=2">next</a>
+</body></html>
+"""
+
+
+class TableParserTests(unittest.TestCase):
+    def test_matches_beautifulsoup_output(self):
+        self.assertEqual(list(iter_suppliers([PAGE])), parse_suppliers_soup(PAGE))
+        self.assertEqual(
+            list(iter_suppliers([PAGE]))[0],
+            {"name": "AcmeFibres", "material": "cotton & poly", "ratePerTonne": "120"},
+        )
+
+    def test_small_chunks_yield_the_same_rows(self):
+        chunks = [PAGE[i:i + 7] for i in range(0, len(PAGE), 7)]
+        self.assertEqual(list(iter_suppliers(chunks)), parse_suppliers_soup(PAGE))
+
+    def test_stops_reading_after_the_table(self):
+        consumed = []
+
+        def chunks():
+            for line in PAGE.splitlines(keepends=True):
+                consumed.append(line)
+                yield line
+
+        list(iter_suppliers(chunks()))
+        self.assertLess(len(consumed), len(PAGE.splitlines()))
+
+    def test_collects_pagination_links(self):
+        suppliers, links = parse_page(PAGE, "http://example.com/market")
+        self.assertEqual(len(suppliers), 3)
+        self.assertEqual(
+            links,
+            [
+                "http://example.com/market?page=2",
+                "http://example.com/market?page=3",
+                "http://example.com/market?page=2",
+            ],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()